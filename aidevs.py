@@ -1,11 +1,25 @@
 import base64
+import contextlib
+import hashlib
+import io
+import math
+import mimetypes
 import os
+import re
 from typing import Optional, Dict, Any
 import requests
 from joblib import Memory
 from openai import OpenAI
 import json
+import threading
 import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from aidevs_telemetry import instrumented, annotate
+from aidevs_ratelimit import openai_limiter
+from aidevs_singleflight import coalesced
+from aidevs_embeddings import get_embedding_model
+from aidevs_ipc import model_server_request
 
 # Set up a caching directory
 memory = Memory("_cache_dir", verbose=1)
@@ -61,29 +75,147 @@ def encode_image(image_path:str) -> str:
         return base64.b64encode(image_file.read()).decode('utf-8')
 
 
-def generate_image_completion(
-        prompt: str,
-        image_filenames: list[str],
-        system_prompt: str = "",
-        model: str = "gpt-4o-mini",
-        max_tokens: int = 500
-) -> str:
+def file_hash(path: str) -> str:
     """
-    Sends a prompt with images to the OpenAI model and returns the response.
+    Computes SHA-256 digest of file contents.
 
     Parameters:
-    - prompt (str): User prompt describing the task or question for the images.
-    - image_filenames (list[str]): List of paths to image files to include in the prompt.
-    - system_prompt (str): Additional instructions or context for the system. Default is an empty string.
-    - model (str): The model name to use for the OpenAI API call. Default is "gpt-4-vision-preview".
-    - max_tokens (int): The maximum number of tokens to generate in the response. Default is 500.
+    - path (str): Path to the file.
 
     Returns:
-    - str: The text response from the OpenAI API, containing the model's reply.
+    - str: Hex digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-    Raises:
-    - Exception: If there's an error in the API call or processing the response.
+
+@memory.cache(ignore=['image_path'])
+def _prepare_image_cached(
+        content_hash: str,
+        image_path: str,
+        max_edge: Optional[int],
+        image_format: Optional[str],
+        quality: int
+) -> Dict[str, Any]:
+    # content_hash is the cache key, image_path is only used to read the data
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ImportError("Image preprocessing requires Pillow. Please install using:\npip install Pillow")
+
+    with open(image_path, "rb") as f:
+        original = f.read()
+
+    image = Image.open(io.BytesIO(original))
+    original_format = (image.format or "JPEG").upper()
+    target_format = (image_format or original_format).upper()
+    if target_format == "JPG":
+        target_format = "JPEG"
+
+    resized = False
+    if max_edge and max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        resized = True
+
+    if target_format == "JPEG" and image.mode != "RGB":
+        # JPEG has no alpha channel, flatten transparent scans on white
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+
+    buffer = io.BytesIO()
+    save_kwargs = {"optimize": True}
+    if target_format in ("JPEG", "WEBP"):
+        save_kwargs["quality"] = quality
+    image.save(buffer, format=target_format, **save_kwargs)
+    data = buffer.getvalue()
+
+    # Re-encoding without resizing can make already compressed files bigger
+    if not resized and len(data) >= len(original):
+        data = original
+        target_format = original_format
+        image = Image.open(io.BytesIO(original))
+
+    return {
+        "mime_type": Image.MIME.get(target_format, "image/jpeg"),
+        "data": base64.b64encode(data).decode('utf-8'),
+        "width": image.size[0],
+        "height": image.size[1],
+    }
+
+
+def prepare_image(
+        image_path: str,
+        max_edge: Optional[int] = None,
+        image_format: Optional[str] = None,
+        quality: int = 85
+) -> Dict[str, Any]:
+    """
+    Prepares an image for a vision request: optionally downscales and re-encodes it.
+    Re-encoded images are cached by file content hash and parameters.
+
+    Parameters:
+    - image_path (str): Path to the image file.
+    - max_edge (int): Maximum length of the longer edge in pixels. None keeps original size.
+    - image_format (str): Target format, e.g. "jpeg" or "webp". None keeps original format.
+    - quality (int): Encoder quality for JPEG/WebP (default: 85).
+
+    Returns:
+    - Dict[str, Any]: Dictionary with "mime_type", base64 "data", "width" and "height"
+      (width and height are None when the file is sent as is).
+    """
+    if max_edge is None and image_format is None:
+        mime_type = mimetypes.guess_type(image_path)[0] or "image/jpeg"
+        return {
+            "mime_type": mime_type,
+            "data": encode_image(image_path),
+            "width": None,
+            "height": None,
+        }
+
+    return _prepare_image_cached(file_hash(image_path), image_path, max_edge, image_format, quality)
+
+
+def pick_image_detail(image: Dict[str, Any], detail: str = "auto") -> str:
+    """
+    Picks vision `detail` level for a prepared image.
+
+    Parameters:
+    - image (Dict[str, Any]): Result of `prepare_image`.
+    - detail (str): Requested level - "low", "high" or "auto".
+
+    Returns:
+    - str: "low" for images that fit into a single 512px tile when "auto" is requested,
+      otherwise the requested level.
     """
+    if detail != "auto" or not image["width"]:
+        return detail
+    return "low" if max(image["width"], image["height"]) <= 512 else "auto"
+
+
+@instrumented("generate_image_completion")
+@memory.cache(ignore=['image_filenames'])
+def _image_completion_cached(
+        image_hashes: list[str],
+        image_filenames: list[str],
+        prompt: str,
+        system_prompt: str,
+        model: str,
+        max_tokens: int,
+        max_edge: Optional[int],
+        image_format: Optional[str],
+        quality: int,
+        detail: str
+):
+    # image_hashes are the cache key, image_filenames are only used to read the data
+    images = [
+        prepare_image(filename, max_edge=max_edge, image_format=image_format, quality=quality)
+        for filename in image_filenames
+    ]
 
     messages = [
         {
@@ -101,16 +233,17 @@ def generate_image_completion(
                 {
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/jpeg;base64,{encode_image(filename)}"
+                        "url": f"data:{image['mime_type']};base64,{image['data']}",
+                        "detail": pick_image_detail(image, detail)
                     }
                 }
-                for filename in image_filenames
+                for image in images
             ]
         }
     ]
 
     # Query the OpenAI model
-    response = client.chat.completions.create(
+    response = chat_completion(
         model=model,
         messages=messages,
         max_tokens=max_tokens
@@ -120,7 +253,171 @@ def generate_image_completion(
     return response.choices[0]
 
 
+def generate_image_completion(
+        prompt: str,
+        image_filenames: list[str],
+        system_prompt: str = "",
+        model: str = "gpt-4o-mini",
+        max_tokens: int = 500,
+        max_edge: Optional[int] = None,
+        image_format: Optional[str] = None,
+        quality: int = 85,
+        detail: str = "auto"
+) -> str:
+    """
+    Sends a prompt with images to the OpenAI model and returns the response.
+
+    Parameters:
+    - prompt (str): User prompt describing the task or question for the images.
+    - image_filenames (list[str]): List of paths to image files to include in the prompt.
+    - system_prompt (str): Additional instructions or context for the system. Default is an empty string.
+    - model (str): The model name to use for the OpenAI API call. Default is "gpt-4-vision-preview".
+    - max_tokens (int): The maximum number of tokens to generate in the response. Default is 500.
+    - max_edge (int): Downscale images so the longer edge is at most this many pixels. Default is None (no resizing).
+    - image_format (str): Re-encode images to this format ("jpeg", "webp"). Default is None (original format).
+    - quality (int): Encoder quality used when re-encoding. Default is 85.
+    - detail (str): Vision detail level - "low", "high" or "auto". With "auto" small images are sent as "low".
+
+    Returns:
+    - str: The text response from the OpenAI API, containing the model's reply.
+
+    Raises:
+    - Exception: If there's an error in the API call or processing the response.
+
+    Responses are cached by image content hashes and request parameters, so the same
+    image described with the same prompt is sent to the API only once.
+    """
+    return _image_completion_cached(
+        [file_hash(filename) for filename in image_filenames],
+        image_filenames,
+        prompt,
+        system_prompt,
+        model,
+        max_tokens,
+        max_edge,
+        image_format,
+        quality,
+        detail
+    )
+
+
+def annotate_openai_usage(response) -> None:
+    """Adds token usage of an OpenAI response to the current telemetry record"""
+    usage = getattr(response, 'usage', None)
+    if usage:
+        annotate(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+
+def estimate_message_tokens(messages: list[Dict[str, Any]], max_tokens: int = 0) -> int:
+    """
+    Estimates tokens used by a chat request, including the completion budget.
+    
+    Parameters:
+    - messages (list[Dict[str, Any]]): Chat messages, content may be text or a list of text/image parts
+    - max_tokens (int): Maximum completion tokens
+    
+    Returns:
+    - int: Estimated total tokens
+    """
+    total = max_tokens or 0
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, str):
+            total += estimate_tokens(content)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                total += estimate_tokens(part["text"])
+            elif part.get("type") == "image_url":
+                # Low detail image costs a flat 85 tokens, assume a few tiles otherwise
+                total += 85 if part["image_url"].get("detail") == "low" else 765
+    return total
+
+
+_prefill = threading.local()
+
+
+@contextlib.contextmanager
+def prefilled_chat_completion(response):
+    """
+    Makes chat_completion in the current thread return `response` instead of calling the API.
+    Used to store responses obtained elsewhere (e.g. from the Batch API) in the response cache.
+    
+    Parameters:
+    - response (ChatCompletion): Response to return
+    """
+    _prefill.response = response
+    try:
+        yield
+    finally:
+        _prefill.response = None
+
+
+def chat_completion(**kwargs):
+    """
+    Calls OpenAI chat completions through the shared rate limiter. Waits for the
+    model RPM/TPM budget and retries 429/5xx errors with backoff.
+    
+    Parameters:
+    - **kwargs: Arguments of `client.chat.completions.create`
+    
+    Returns:
+    - ChatCompletion: API response
+    """
+    prefilled = getattr(_prefill, 'response', None)
+    if prefilled is not None:
+        annotate_openai_usage(prefilled)
+        return prefilled
+
+    estimated_tokens = estimate_message_tokens(kwargs["messages"], kwargs.get("max_tokens") or 0)
+    response = openai_limiter.call(
+        kwargs["model"],
+        estimated_tokens,
+        lambda: limited_client.chat.completions.create(**kwargs),
+        usage=lambda response: response.usage.total_tokens if getattr(response, 'usage', None) else None
+    )
+    annotate_openai_usage(response)
+    return response
+
+
+def question_messages(question: str, system_prompt: Optional[str] = None) -> list[Dict[str, str]]:
+    """
+    Builds chat messages for a question with optional system prompt.
+    
+    Parameters:
+    - question (str): User question
+    - system_prompt (str): Optional system prompt
+    
+    Returns:
+    - list[Dict[str, str]]: Chat messages
+    """
+    # Konfiguracja promptu systemowego, jeśli podany
+    messages = [{"role": "user", "content": question}]
+    if system_prompt:
+        messages.insert(0, {"role": "system", "content": system_prompt})
+    return messages
+
+
+@instrumented("answer_question_openai")
+@coalesced
 @memory.cache
+def _answer_question_openai_cached(
+        question: str,
+        system_prompt: Optional[str],
+        max_tokens: int,
+        model: str
+    ) -> str:
+    # Raises on errors so that failed calls are never stored in the cache
+    # Wykonaj zapytanie do modelu
+    response = chat_completion(
+        model=model,
+        messages=question_messages(question, system_prompt),
+        max_tokens=max_tokens
+    )
+
+    return response.choices[0].message.content.strip()
+
+
 def answer_question_openai(
         question: str,
         system_prompt: Optional[str] = None,
@@ -129,6 +426,7 @@ def answer_question_openai(
     ) -> str:
     """
     Zwraca odpowiedź na pojedyncze pytanie `question` z modelu GPT-4.
+    Odpowiedzi są cache'owane, błędy nie.
     
     Parameters:
     - question: Treść pytania.
@@ -137,28 +435,42 @@ def answer_question_openai(
     - model: Nazwa modelu OpenAI do użycia.
     
     Returns:
-    - str: Odpowiedź na pytanie.
+    - str: Odpowiedź na pytanie albo "Error: ..." jeśli zapytanie się nie powiodło.
     """
     try:
+        return _answer_question_openai_cached(question, system_prompt, max_tokens, model)
+    except Exception as e:
+        return f"Error: {str(e)}"
 
-        # Konfiguracja promptu systemowego, jeśli podany
-        messages = [{"role": "user", "content": question}]
-        if system_prompt:
-            messages.insert(0, {"role": "system", "content": system_prompt})
 
-        # Wykonaj zapytanie do modelu
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            max_tokens=max_tokens
-        )
+def ollama_url(path: str) -> str:
+    """
+    Builds URL of the Ollama API endpoint, OLLAMA_BASE_URL overrides the default local server.
+    
+    Parameters:
+    - path (str): Endpoint path, e.g. "/api/generate"
+    
+    Returns:
+    - str: Full endpoint URL
+    """
+    base_url = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
+    return f"{base_url.rstrip('/')}{path}"
 
-        return response.choices[0].message.content.strip()
 
-    except Exception as e:
-        return f"Error: {str(e)}"
+def annotate_ollama_stats(response_json: Dict[str, Any]) -> None:
+    """Adds token counts and load/eval durations of an Ollama response to the current telemetry record"""
+    annotate(
+        prompt_tokens=response_json.get('prompt_eval_count'),
+        completion_tokens=response_json.get('eval_count'),
+        # Ollama reports durations in nanoseconds
+        load_duration=response_json.get('load_duration', 0) / 1e9,
+        prompt_eval_duration=response_json.get('prompt_eval_duration', 0) / 1e9,
+        eval_duration=response_json.get('eval_duration', 0) / 1e9
+    )
 
 
+@instrumented()
+@coalesced
 @memory.cache
 def answer_question_local(
         question: str,
@@ -179,7 +491,7 @@ def answer_question_local(
     Raises:
     - Exception: Jeśli wystąpi błąd w komunikacji z API
     """
-    url = "http://localhost:11434/api/generate"
+    url = ollama_url("/api/generate")
     
     data = {
         'model': model,
@@ -194,6 +506,7 @@ def answer_question_local(
         response.raise_for_status()
         
         response_json = json.loads(response.text)
+        annotate_ollama_stats(response_json)
         return response_json['response']
         
     except requests.exceptions.RequestException as e:
@@ -202,6 +515,280 @@ def answer_question_local(
         raise Exception(f"Error parsing API response: {str(e)}")
 
 
+class SchemaValidationError(ValueError):
+    """The model's answer is not valid JSON, does not match the schema, or the model refused"""
+
+
+# OpenAI models accepting json_schema response formats, older ones (e.g. gpt-4) only get plain completions
+STRUCTURED_OUTPUT_MODELS = ('gpt-4o', 'gpt-4.1', 'gpt-5', 'o1', 'o3', 'o4')
+
+
+def supports_structured_outputs(model: str) -> bool:
+    """Whether an OpenAI model accepts json_schema response formats"""
+    return model.startswith(STRUCTURED_OUTPUT_MODELS)
+
+
+def json_object_schema(**properties: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Builds JSON schema of an object with all `properties` required and no others,
+    as OpenAI strict structured outputs require.
+
+    Example:
+    - json_object_schema(score={"type": "number", "minimum": 0, "maximum": 1})
+    """
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False
+    }
+
+
+_JSON_TYPES = {
+    'object': lambda value: isinstance(value, dict),
+    'array': lambda value: isinstance(value, list),
+    'string': lambda value: isinstance(value, str),
+    # bool is an int subclass in Python, but not a JSON number
+    'number': lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    'integer': lambda value: isinstance(value, int) and not isinstance(value, bool),
+    'boolean': lambda value: isinstance(value, bool),
+    'null': lambda value: value is None,
+}
+
+
+def validate_json(value: Any, schema: Dict[str, Any], path: str = "$") -> Any:
+    """
+    Checks a parsed JSON value against a schema: type, enum, number bounds, required and
+    additional properties of objects, items and length of arrays.
+
+    Parameters:
+    - value (Any): Parsed JSON
+    - schema (Dict[str, Any]): JSON schema
+    - path (str): Location used in error messages
+
+    Returns:
+    - Any: The value, unchanged
+
+    Raises:
+    - SchemaValidationError: If the value does not match the schema
+    """
+    expected = schema.get('type')
+    if expected:
+        types = expected if isinstance(expected, list) else [expected]
+        if not any(_JSON_TYPES[t](value) for t in types):
+            raise SchemaValidationError(f"{path}: expected {expected}, got {type(value).__name__}")
+    if 'enum' in schema and value not in schema['enum']:
+        raise SchemaValidationError(f"{path}: {value!r} is not one of {schema['enum']}")
+
+    if _JSON_TYPES['number'](value):
+        if 'minimum' in schema and value < schema['minimum']:
+            raise SchemaValidationError(f"{path}: {value} is less than {schema['minimum']}")
+        if 'maximum' in schema and value > schema['maximum']:
+            raise SchemaValidationError(f"{path}: {value} is greater than {schema['maximum']}")
+        if 'exclusiveMinimum' in schema and value <= schema['exclusiveMinimum']:
+            raise SchemaValidationError(f"{path}: {value} is not greater than {schema['exclusiveMinimum']}")
+        if 'exclusiveMaximum' in schema and value >= schema['exclusiveMaximum']:
+            raise SchemaValidationError(f"{path}: {value} is not less than {schema['exclusiveMaximum']}")
+
+    if isinstance(value, dict):
+        properties = schema.get('properties', {})
+        for key in schema.get('required', []):
+            if key not in value:
+                raise SchemaValidationError(f"{path}: missing required property {key!r}")
+        if schema.get('additionalProperties') is False:
+            extra = set(value) - set(properties)
+            if extra:
+                raise SchemaValidationError(f"{path}: unexpected properties {sorted(extra)}")
+        for key, item in value.items():
+            if key in properties:
+                validate_json(item, properties[key], f"{path}.{key}")
+
+    if isinstance(value, list):
+        if 'minItems' in schema and len(value) < schema['minItems']:
+            raise SchemaValidationError(f"{path}: fewer than {schema['minItems']} items")
+        if 'maxItems' in schema and len(value) > schema['maxItems']:
+            raise SchemaValidationError(f"{path}: more than {schema['maxItems']} items")
+        if 'items' in schema:
+            for i, item in enumerate(value):
+                validate_json(item, schema['items'], f"{path}[{i}]")
+    return value
+
+
+def structured_completion(
+        question: str,
+        schema: Dict[str, Any],
+        system_prompt: Optional[str] = None,
+        model: str = 'gpt-4o-mini',
+        provider: str = 'openai',
+        max_tokens: Optional[int] = None
+    ) -> Any:
+    """
+    Asks a model for JSON constrained by `schema` and returns it as a validated Python object.
+    OpenAI gets a strict json_schema response format, Ollama the schema in its `format` option.
+    Not cached, see answer_structured.
+
+    Parameters:
+    - question (str): User question
+    - schema (Dict[str, Any]): JSON schema of the answer, an object for OpenAI (see json_object_schema)
+    - system_prompt (str): Optional system prompt
+    - model (str): Model name
+    - provider (str): "openai" or "ollama"
+    - max_tokens (int): Optional limit of completion tokens
+
+    Returns:
+    - Any: Parsed answer matching the schema
+
+    Raises:
+    - SchemaValidationError: If the answer is not valid JSON, does not match the schema or the model refused
+    - Exception: If the API call fails or its response cannot be parsed
+    """
+    if provider == 'openai':
+        kwargs = {'max_tokens': max_tokens} if max_tokens else {}
+        response = chat_completion(
+            model=model,
+            messages=question_messages(question, system_prompt),
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "answer", "schema": schema, "strict": True}
+            },
+            **kwargs
+        )
+        message = response.choices[0].message
+        if getattr(message, 'refusal', None):
+            raise SchemaValidationError(f"Model refused to answer: {message.refusal}")
+        content = message.content
+    elif provider == 'ollama':
+        data = {
+            'model': model,
+            'prompt': question,
+            'stream': False,
+            'format': schema,
+            # Constrained output does not benefit from sampling
+            'options': {'temperature': 0, **({'num_predict': max_tokens} if max_tokens else {})}
+        }
+        if system_prompt:
+            data['system'] = system_prompt
+        try:
+            response = requests.post(ollama_url("/api/generate"), json=data)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"Error communicating with local LLM API: {str(e)}")
+        try:
+            response_json = json.loads(response.text)
+        except json.JSONDecodeError as e:
+            # A broken server response, not an invalid answer of the model
+            raise Exception(f"Error parsing API response: {str(e)}")
+        annotate_ollama_stats(response_json)
+        content = response_json['response']
+    else:
+        raise ValueError(f"Unknown provider {provider}, expected 'openai' or 'ollama'")
+
+    try:
+        value = json.loads(content)
+    except json.JSONDecodeError as e:
+        raise SchemaValidationError(f"Invalid JSON from {model}: {str(e)}")
+    return validate_json(value, schema)
+
+
+@instrumented("answer_structured")
+@coalesced
+@memory.cache
+def _answer_structured_cached(
+        question: str,
+        schema: Dict[str, Any],
+        system_prompt: Optional[str],
+        model: str,
+        provider: str,
+        max_tokens: Optional[int]
+    ) -> Any:
+    # Raises on invalid answers so that they are never stored in the cache
+    return structured_completion(question, schema, system_prompt, model, provider, max_tokens)
+
+
+def answer_structured(
+        question: str,
+        schema: Dict[str, Any],
+        system_prompt: Optional[str] = None,
+        model: str = 'gpt-4o-mini',
+        provider: str = 'openai',
+        max_tokens: Optional[int] = None
+    ) -> Any:
+    """
+    Cached structured_completion: returns the answer to `question` as a Python object matching `schema`.
+
+    Parameters:
+    - question (str): User question
+    - schema (Dict[str, Any]): JSON schema of the answer, e.g. json_object_schema(category={"enum": [...]})
+    - system_prompt (str): Optional system prompt
+    - model (str): Model name, e.g. 'gpt-4o-mini' or 'gemma2:27b'
+    - provider (str): "openai" or "ollama"
+    - max_tokens (int): Optional limit of completion tokens
+
+    Returns:
+    - Any: Validated answer
+
+    Raises:
+    - SchemaValidationError: If the model did not return a valid answer
+    """
+    return _answer_structured_cached(question, schema, system_prompt, model, provider, max_tokens)
+
+
+_JSON_PATH_TOKEN = re.compile(r"\.([A-Za-z_][\w-]*)|\.\*|\[(\d+)\]|\[\*\]|\['([^']*)'\]|\[\"([^\"]*)\"\]")
+
+
+def json_path(data: Any, path: str) -> list:
+    """
+    Returns all values at a JSON path, in document order. Supports `.key`, `['key']`,
+    `[index]` and the wildcards `.*` (object values) and `[*]` (array items).
+    Missing keys and indexes match nothing.
+
+    Example:
+    - json_path({"reply": [{"id": 1}, {"id": 2}]}, "$.reply[*].id") -> [1, 2]
+
+    Parameters:
+    - data (Any): Parsed JSON, e.g. an API response
+    - path (str): Path starting with "$"
+
+    Returns:
+    - list: Matching values
+
+    Raises:
+    - ValueError: If the path is malformed
+    """
+    if not path.startswith('$'):
+        raise ValueError(f"JSON path must start with $: {path}")
+
+    matches = [data]
+    position = 1
+    while position < len(path):
+        token = _JSON_PATH_TOKEN.match(path, position)
+        if not token:
+            raise ValueError(f"Invalid JSON path {path} at position {position}")
+        key, index, quoted, double_quoted = token.groups()
+        key = key if key is not None else quoted if quoted is not None else double_quoted
+        selected = []
+        for value in matches:
+            if key is not None:
+                if isinstance(value, dict) and key in value:
+                    selected.append(value[key])
+            elif index is not None:
+                if isinstance(value, list) and int(index) < len(value):
+                    selected.append(value[int(index)])
+            elif isinstance(value, dict):
+                selected.extend(value.values())
+            elif isinstance(value, list):
+                selected.extend(value)
+        matches = selected
+        position = token.end()
+    return matches
+
+
+def json_path_first(data: Any, path: str, default: Any = None) -> Any:
+    """Returns the first value at a JSON path (see json_path), `default` if nothing matches"""
+    matches = json_path(data, path)
+    return matches[0] if matches else default
+
+
 def generate_image(
     prompt: str,
     size: str = "1024x1024",
@@ -332,6 +919,11 @@ def transcribe_audio_file(
     - Exception: If transcription fails
     """
     try:
+        if whisper_model is None:
+            text = model_server_request('transcribe', path=audio_path, model_name=model_name, language=language)
+            if text is not None:
+                return text
+        
         import whisper
         
         # Use provided model or load new one
@@ -383,6 +975,7 @@ def process_audio_batch(
         raise Exception(f"Error processing audio batch: {str(e)}")
 
 
+@instrumented()
 def categorize_content(
     content: str,
     system_prompt: str = """Categorize if the text contains information about:
@@ -390,31 +983,48 @@ def categorize_content(
     2. Hardware repairs or issues
     Return either "people", "hardware", or "none" if neither category applies.
     Only return the single word category.""",
-    model: str = "gpt-4"
+    model: Optional[str] = None
 ) -> str:
     """
-    Categorizes content using OpenAI's model to determine if it contains
-    information about people or hardware repairs.
+    Categorizes content to determine if it contains information about people
+    or hardware repairs. Models supporting structured outputs are constrained to the
+    three categories with a schema, older ones answer in plain text.
     
     Parameters:
     - content (str): The text content to analyze
     - system_prompt (str): Instructions for the categorization
-    - model (str): The model to use for categorization
+    - model (str): OpenAI model; None uses gpt-4, or with AIDEVS_ROUTER=1 the cheapest
+      model of the "basic" tier of aidevs_router, escalating on low confidence
     
     Returns:
     - str: Category ("people", "hardware", or "none")
     """
+    categories = ["people", "hardware", "none"]
+    schema = json_object_schema(category={"type": "string", "enum": categories})
     try:
-        response = client.chat.completions.create(
+        from aidevs_router import router
+        if model is None and router.enabled:
+            return router.answer(
+                "categorize_content",
+                content,
+                schema,
+                tier="basic",
+                system_prompt=system_prompt,
+                min_confidence=0.7,
+                default_model="gpt-4o"
+            )['category']
+        model = model or "gpt-4"
+        if supports_structured_outputs(model):
+            return structured_completion(content, schema, system_prompt, model=model)['category']
+        response = chat_completion(
             model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": content}
-            ],
+            messages=question_messages(content, system_prompt),
             max_tokens=10
         )
-        return response.choices[0].message.content.strip().lower()
+        category = response.choices[0].message.content.strip().lower()
+        return category if category in categories else "none"
     except Exception as e:
+        annotate(error=f"{type(e).__name__}: {str(e)}")
         print(f"Error categorizing content: {str(e)}")
         return "none"
 
@@ -441,6 +1051,9 @@ def extract_text_from_image(
     """
     try:
         if method.lower() == "easyocr":
+            text = model_server_request('ocr', path=image_path, languages=[language])
+            if text is not None:
+                return text
             import easyocr
             reader = easyocr.Reader([language])
             result = reader.readtext(image_path)
@@ -485,6 +1098,10 @@ def run_ocr(image_path: str) -> str:
     - str: Extracted text from the image
     """
     try:
+        text = model_server_request('ocr', path=image_path, languages=['en', 'pl'])
+        if text is not None:
+            return text
+        
         import easyocr
         
         # Initialize EasyOCR reader with English and Polish language support
@@ -503,18 +1120,170 @@ def run_ocr(image_path: str) -> str:
         return ""
 
 
+@instrumented("get_embedding")
+@coalesced
 @memory.cache
-def get_embedding(text: str) -> list[float]:
-    """Get embedding for text using local Gemma model"""
-    url = "http://localhost:11434/api/embeddings"
+def _embedding_cached(model: str, text: str) -> list[float]:
+    # Provider and model are part of the cache key, vectors of different models never mix
+    return get_embedding_model(model).embed([text])[0]
+
+
+def get_embedding(text: str, model: Optional[str] = None) -> list[float]:
+    """
+    Get embedding for text from the configured embedding model.
     
-    data = {
-        'model': 'gemma2:27b',
-        'prompt': text
-    }
+    Parameters:
+    - text (str): Text to embed
+    - model (str): Registered "provider:model" key (default: AIDEVS_EMBEDDING_MODEL or Ollama gemma2:27b),
+      see aidevs_embeddings.EMBEDDING_MODELS
     
-    response = requests.post(url, json=data)
-    return response.json()['embedding']
+    Returns:
+    - list[float]: Embedding vector
+    """
+    return _embedding_cached(get_embedding_model(model).key, text)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimates number of tokens in text (about 4 characters per token).
+
+    Parameters:
+    - text (str): Text to estimate
+
+    Returns:
+    - int: Estimated token count
+    """
+    return max(1, math.ceil(len(text) / 4))
+
+
+def chunk_text(text: str, max_tokens: int = 200, overlap_tokens: int = 40) -> list[str]:
+    """
+    Splits text into chunks of at most `max_tokens` estimated tokens on paragraph boundaries,
+    falling back to sentences and words for longer paragraphs. Each chunk starts with
+    up to `overlap_tokens` of the end of the previous chunk, so facts crossing a boundary
+    stay retrievable.
+
+    Parameters:
+    - text (str): Text to split
+    - max_tokens (int): Maximum estimated tokens per chunk
+    - overlap_tokens (int): Estimated tokens repeated from the previous chunk
+
+    Returns:
+    - list[str]: Chunks, a single chunk for short texts
+    """
+    units = []
+    for paragraph in re.split(r'\n\s*\n', text.strip()):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            units.append(paragraph)
+            continue
+        for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+            if estimate_tokens(sentence) <= max_tokens:
+                units.append(sentence)
+                continue
+            words, current = sentence.split(), []
+            for word in words:
+                if current and estimate_tokens(" ".join(current + [word])) > max_tokens:
+                    units.append(" ".join(current))
+                    current = []
+                current.append(word)
+            if current:
+                units.append(" ".join(current))
+
+    chunks, current = [], []
+    for unit in units:
+        if current and estimate_tokens(" ".join(current + [unit])) > max_tokens:
+            chunks.append(" ".join(current))
+            # Carry over trailing units that fit into the overlap and leave room for the new unit
+            overlap = []
+            for previous in reversed(current):
+                if estimate_tokens(" ".join([previous] + overlap + [unit])) > max_tokens \
+                        or estimate_tokens(" ".join([previous] + overlap)) > overlap_tokens:
+                    break
+                overlap.insert(0, previous)
+            current = overlap
+        current.append(unit)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def cosine_similarity(a: list[float], b: list[float]) -> float:
+    """
+    Computes cosine similarity between two vectors.
+
+    Parameters:
+    - a (list[float]): First vector
+    - b (list[float]): Second vector
+
+    Returns:
+    - float: Cosine similarity, 0.0 if any of the vectors is zero
+    """
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def bounded_map(func, items, max_workers: int = 4, max_pending: Optional[int] = None):
+    """
+    Like `executor.map`, but pulls from `items` lazily: at most `max_pending` calls are
+    queued or running at once, so a large or endless input never sits in memory.
+    
+    Parameters:
+    - func (Callable): Function applied to each item
+    - items (Iterable): Input items, consumed as results are taken
+    - max_workers (int): Worker threads
+    - max_pending (int): Maximum submitted but not yet yielded calls (default: 2 * max_workers)
+    
+    Yields:
+    - Results of `func` in input order
+    """
+    max_pending = max_pending or 2 * max_workers
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+_qdrant_clients: Dict[tuple, Any] = {}
+
+
+def get_qdrant_client():
+    """
+    Returns Qdrant client configured from QDRANT_URL and QDRANT_API_KEY, shared within the process.
+    QDRANT_URL=":memory:" runs an in-process local instance and needs no API key.
+    
+    Returns:
+    - QdrantClient: Connected client
+    
+    Raises:
+    - ValueError: If QDRANT_URL or QDRANT_API_KEY is not set
+    """
+    from qdrant_client import QdrantClient
+
+    api_key = os.getenv('QDRANT_API_KEY')
+    qdrant_url = os.getenv('QDRANT_URL')
+    
+    if not qdrant_url:
+        raise ValueError("QDRANT_URL environment variable not set")
+    if qdrant_url != ':memory:' and not api_key:
+        raise ValueError("QDRANT_API_KEY environment variable not set")
+    
+    key = (qdrant_url, api_key)
+    if key not in _qdrant_clients:
+        if qdrant_url == ':memory:':
+            _qdrant_clients[key] = QdrantClient(':memory:')
+        else:
+            _qdrant_clients[key] = QdrantClient(qdrant_url, api_key=api_key)
+    return _qdrant_clients[key]
 
 
 client = OpenAI()
+# Calls going through the shared rate limiter, which handles their retries (see chat_completion)
+limited_client = client.with_options(max_retries=0)
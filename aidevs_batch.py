@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+from openai.types.chat import ChatCompletion
+
+import aidevs
+from aidevs import question_messages, prefilled_chat_completion, answer_question_openai
+
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+
+class OpenAIBatchExecutor:
+    """Submits request files to the OpenAI Batch API"""
+
+    def __init__(self, completion_window: str = "24h"):
+        self.completion_window = completion_window
+
+    def submit(self, input_path: str) -> str:
+        """Uploads the JSONL file, starts a batch and returns its ID"""
+        with open(input_path, 'rb') as f:
+            input_file = aidevs.client.files.create(file=f, purpose="batch")
+        batch = aidevs.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        """Returns batch status, e.g. "in_progress" or "completed" """
+        return aidevs.client.batches.retrieve(batch_id).status
+
+    def fetch(self, batch_id: str) -> str:
+        """Returns contents of the output and error files of a finished batch"""
+        batch = aidevs.client.batches.retrieve(batch_id)
+        output = ""
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                output += aidevs.client.files.content(file_id).text
+        return output
+
+
+class LocalBatchExecutor:
+    """
+    Stand-in for the Batch API that runs requests in-process and produces output in the
+    Batch API format. Useful for testing without network.
+
+    Parameters:
+    - directory (str): Where output files are written
+    - respond (Callable[[Dict[str, Any]], str]): Produces reply text for a request body;
+      by default the request is sent with `chat_completion`
+    """
+
+    def __init__(self, directory: str = os.path.join("_cache_dir", "batches"), respond: Optional[Callable[[Dict[str, Any]], str]] = None):
+        self.directory = directory
+        self.respond = respond
+
+    def _completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        if self.respond is None:
+            return aidevs.chat_completion(**body).model_dump()
+        content = self.respond(body)
+        prompt_tokens = aidevs.estimate_message_tokens(body['messages'])
+        completion_tokens = aidevs.estimate_tokens(content)
+        return {
+            "id": f"chatcmpl-local-{hashlib.sha256(content.encode('utf-8')).hexdigest()[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body['model'],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def submit(self, input_path: str) -> str:
+        batch_id = f"batch_local_{hashlib.sha256(input_path.encode('utf-8')).hexdigest()[:12]}"
+        output_path = os.path.join(self.directory, f"{batch_id}.output.jsonl")
+        os.makedirs(self.directory, exist_ok=True)
+        with open(input_path, 'r', encoding='utf-8') as source, open(output_path, 'w', encoding='utf-8') as target:
+            for line in source:
+                request = json.loads(line)
+                try:
+                    result = {"status_code": 200, "body": self._completion(request['body'])}
+                    error = None
+                except Exception as e:
+                    result, error = None, {"code": type(e).__name__, "message": str(e)}
+                target.write(json.dumps({
+                    "id": f"batch_req_{request['custom_id']}",
+                    "custom_id": request['custom_id'],
+                    "response": result,
+                    "error": error,
+                }, ensure_ascii=False) + "\n")
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        return 'completed'
+
+    def fetch(self, batch_id: str) -> str:
+        with open(os.path.join(self.directory, f"{batch_id}.output.jsonl"), 'r', encoding='utf-8') as f:
+            return f.read()
+
+
+class BatchJob:
+    """
+    Collects `answer_question_openai` requests and runs them in bulk through the Batch API.
+    Requests already in the response cache are answered immediately and not submitted.
+    Results are stored in the response cache, so later `answer_question_openai` calls
+    with the same arguments return them without calling the API.
+
+    Parameters:
+    - executor: OpenAIBatchExecutor (default) or LocalBatchExecutor
+    - directory (str): Where request files and manifests are written
+    - poll_interval (float): Seconds between status checks
+    """
+
+    def __init__(self, executor=None, directory: str = os.path.join("_cache_dir", "batches"), poll_interval: float = 30.0):
+        self.executor = executor or OpenAIBatchExecutor()
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.requests: Dict[str, Dict[str, Any]] = {}
+        self.answers: Dict[str, str] = {}
+        self.batch_id: Optional[str] = None
+
+    def add(self, question: str, system_prompt: Optional[str] = None, max_tokens: int = 5, model: str = 'gpt-4o-mini') -> str:
+        """
+        Adds a request, arguments are the same as of `answer_question_openai`.
+
+        Returns:
+        - str: Custom ID used to look up the answer
+        """
+        arguments = {'question': question, 'system_prompt': system_prompt, 'max_tokens': max_tokens, 'model': model}
+        custom_id = hashlib.sha256(json.dumps(arguments, sort_keys=True).encode('utf-8')).hexdigest()[:24]
+        if custom_id in self.requests or custom_id in self.answers:
+            return custom_id
+
+        if aidevs._answer_question_openai_cached.check_call_in_cache(question, system_prompt, max_tokens, model):
+            self.answers[custom_id] = answer_question_openai(**arguments)
+        else:
+            self.requests[custom_id] = arguments
+        return custom_id
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, f"{self.batch_id}.manifest.json")
+
+    def submit(self) -> Optional[str]:
+        """
+        Writes pending requests to a JSONL file and submits it.
+
+        Returns:
+        - str: Batch ID, None if every request was already cached
+        """
+        if not self.requests:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha256("".join(sorted(self.requests)).encode('utf-8')).hexdigest()[:16]
+        input_path = os.path.abspath(os.path.join(self.directory, f"requests-{digest}.jsonl"))
+        with open(input_path, 'w', encoding='utf-8') as f:
+            for custom_id, arguments in self.requests.items():
+                f.write(json.dumps({
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        "model": arguments['model'],
+                        "messages": question_messages(arguments['question'], arguments['system_prompt']),
+                        "max_tokens": arguments['max_tokens'],
+                    },
+                }, ensure_ascii=False) + "\n")
+
+        self.batch_id = self.executor.submit(input_path)
+        # Manifest lets another process collect the results later
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({'batch_id': self.batch_id, 'requests': self.requests, 'answers': self.answers}, f, ensure_ascii=False)
+        return self.batch_id
+
+    @classmethod
+    def load(cls, manifest_path: str, executor=None, poll_interval: float = 30.0) -> 'BatchJob':
+        """Restores a submitted job from its manifest"""
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        job = cls(executor, os.path.dirname(manifest_path), poll_interval)
+        job.batch_id = manifest['batch_id']
+        job.requests = manifest['requests']
+        job.answers = manifest['answers']
+        return job
+
+    def wait(self) -> Dict[str, str]:
+        """
+        Polls until the batch finishes, stores results in the response cache and returns all answers.
+
+        Returns:
+        - Dict[str, str]: Custom ID to answer ("Error: ..." for failed requests)
+        """
+        if self.batch_id is not None:
+            while (status := self.executor.status(self.batch_id)) not in TERMINAL_STATUSES:
+                time.sleep(self.poll_interval)
+
+            results = {}
+            for line in self.executor.fetch(self.batch_id).splitlines():
+                if line.strip():
+                    result = json.loads(line)
+                    results[result['custom_id']] = result
+
+            for custom_id, arguments in self.requests.items():
+                result = results.get(custom_id)
+                response = (result or {}).get('response') or {}
+                if response.get('status_code') != 200:
+                    error = (result or {}).get('error') or response.get('body', {}).get('error') or {}
+                    self.answers[custom_id] = f"Error: {error.get('message') or f'batch {status}'}"
+                    continue
+                with prefilled_chat_completion(ChatCompletion.model_validate(response['body'])):
+                    self.answers[custom_id] = answer_question_openai(**arguments)
+            self.requests = {}
+
+        return self.answers
+
+    def run(self) -> Dict[str, str]:
+        """Submits pending requests and waits for the answers"""
+        self.submit()
+        return self.wait()
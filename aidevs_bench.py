@@ -0,0 +1,547 @@
+"""
+End-to-end benchmarks of the pipelines against local stand-in servers.
+
+The stand-in server mimics the OpenAI, Ollama and AIDEVS task HTTP APIs with
+configurable latency and token throughput, Qdrant runs in-process (QDRANT_URL=":memory:").
+Each benchmark runs in a fresh subprocess with its own cache directory, so peak RSS
+and cache state are measured per benchmark.
+
+Usage:
+    python aidevs_bench.py [benchmark ...] [--iterations N] [--documents N]
+    python aidevs_bench.py embeddings --embedding-model ollama:nomic-embed-text [--live]
+    python aidevs_bench.py --compare bench_results/old.json bench_results/new.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class ServiceProfile:
+    """Simulated service speed: fixed latency per request plus token generation time"""
+
+    def __init__(self, latency: float = 0.2, tokens_per_second: float = 100.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+
+    def delay(self, completion_tokens: int = 0) -> float:
+        return self.latency + (completion_tokens / self.tokens_per_second if self.tokens_per_second else 0.0)
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def fake_embedding(text: str, dimensions: int) -> List[float]:
+    """Deterministic pseudo-random unit vector for text"""
+    seed = int(hashlib.sha256(text.encode('utf-8')).hexdigest()[:16], 16)
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = sum(x * x for x in vector) ** 0.5
+    return [x / norm for x in vector]
+
+
+def fake_reply(prompt: str, max_tokens: Optional[int] = None) -> str:
+    """Plausible short answer for the prompts used by the pipelines"""
+    digest = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8], 16)
+    if "(0-1)" in prompt:
+        return f"{digest % 101 / 100:.2f}"
+    if "'people', 'hardware', or 'none'" in prompt:
+        return ["people", "hardware", "none"][digest % 3]
+    words = min(max_tokens or 20, 20)
+    return " ".join(["lorem"] * words)
+
+
+def fake_structured(schema: Dict[str, Any], seed: str) -> Any:
+    """Deterministic value matching a JSON schema, for structured output requests"""
+    digest = int(hashlib.sha256(seed.encode('utf-8')).hexdigest()[:8], 16)
+    if 'enum' in schema:
+        return schema['enum'][digest % len(schema['enum'])]
+    kind = schema.get('type')
+    if kind == 'object':
+        return {key: fake_structured(value, f"{seed}.{key}") for key, value in schema.get('properties', {}).items()}
+    if kind == 'array':
+        return [fake_structured(schema.get('items', {}), f"{seed}[{i}]") for i in range(1 + digest % 3)]
+    if kind in ('number', 'integer'):
+        low, high = schema.get('minimum', 0), schema.get('maximum', 100)
+        value = low + (high - low) * (digest % 101) / 100
+        return round(value) if kind == 'integer' else round(value, 2)
+    if kind == 'boolean':
+        return digest % 2 == 0
+    return "lorem"
+
+
+class StandInServer:
+    """
+    Local HTTP server answering OpenAI (/v1/...), Ollama (/api/...) and AIDEVS task API
+    (/report, /data/...) requests.
+
+    Parameters:
+    - openai (ServiceProfile): Speed of OpenAI endpoints
+    - ollama (ServiceProfile): Speed of Ollama endpoints
+    - task_api (ServiceProfile): Speed of task API endpoints
+    - embedding_dimensions (int): Size of returned embeddings of models missing in aidevs_embeddings
+    - questions (Dict[str, str]): Questions served as arxiv.txt
+    """
+
+    def __init__(
+        self,
+        openai: Optional[ServiceProfile] = None,
+        ollama: Optional[ServiceProfile] = None,
+        task_api: Optional[ServiceProfile] = None,
+        embedding_dimensions: int = 384,
+        questions: Optional[Dict[str, str]] = None
+    ):
+        self.openai = openai or ServiceProfile(0.3, 80.0)
+        self.ollama = ollama or ServiceProfile(0.1, 40.0)
+        self.task_api = task_api or ServiceProfile(0.05, 0.0)
+        self.embedding_dimensions = embedding_dimensions
+        self.questions = questions or {}
+        self.routes: Dict[tuple, Callable[[Dict[str, Any]], tuple]] = {
+            ('POST', '/v1/chat/completions'): self._chat_completions,
+            ('POST', '/v1/embeddings'): self._openai_embeddings,
+            ('POST', '/api/generate'): self._ollama_generate,
+            ('POST', '/api/embeddings'): self._ollama_embeddings,
+            ('POST', '/report'): self._report,
+        }
+        self.request_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'StandInServer':
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self, method: str):
+                path = self.path.split('?')[0]
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}') if method == 'POST' else {}
+                with server._lock:
+                    server.request_counts[path] = server.request_counts.get(path, 0) + 1
+
+                route = server.routes.get((method, path))
+                if route is None and method == 'GET' and path.startswith('/data/') and path.endswith('/arxiv.txt'):
+                    route = server._questions
+                if route is None:
+                    status, payload, delay = 404, {"error": f"Unknown endpoint {method} {path}"}, 0.0
+                else:
+                    status, payload, delay = route(body)
+                time.sleep(delay)
+
+                data = payload.encode('utf-8') if isinstance(payload, str) else json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/plain' if isinstance(payload, str) else 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _chat_completions(self, body: Dict[str, Any]) -> tuple:
+        prompt = "\n".join(
+            message['content'] if isinstance(message['content'], str)
+            else " ".join(part.get('text', '') for part in message['content'])
+            for message in body.get('messages', [])
+        )
+        response_format = body.get('response_format') or {}
+        if response_format.get('type') == 'json_schema':
+            reply = json.dumps(fake_structured(response_format['json_schema']['schema'], prompt))
+        else:
+            reply = fake_reply(prompt, body.get('max_tokens'))
+        completion_tokens = _estimate_tokens(reply)
+        return 200, {
+            "id": f"chatcmpl-{hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get('model'),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": _estimate_tokens(prompt),
+                "completion_tokens": completion_tokens,
+                "total_tokens": _estimate_tokens(prompt) + completion_tokens
+            }
+        }, self.openai.delay(completion_tokens)
+
+    def _dimensions(self, provider: str, model: Optional[str]) -> int:
+        # Registered models get their declared size, so size checks pass against the stand-in
+        from aidevs_embeddings import EMBEDDING_MODELS
+
+        registered = EMBEDDING_MODELS.get(f"{provider}:{model}")
+        return registered.dimensions if registered else self.embedding_dimensions
+
+    def _openai_embeddings(self, body: Dict[str, Any]) -> tuple:
+        inputs = body.get('input', [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = body.get('dimensions') or self._dimensions('openai', body.get('model'))
+        return 200, {
+            "object": "list",
+            "model": body.get('model'),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(text, dimensions)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": sum(_estimate_tokens(t) for t in inputs), "total_tokens": sum(_estimate_tokens(t) for t in inputs)}
+        }, self.openai.delay()
+
+    def _ollama_generate(self, body: Dict[str, Any]) -> tuple:
+        if isinstance(body.get('format'), dict):
+            reply = json.dumps(fake_structured(body['format'], body.get('prompt', '')))
+        else:
+            reply = fake_reply(body.get('prompt', ''))
+        completion_tokens = _estimate_tokens(reply)
+        delay = self.ollama.delay(completion_tokens)
+        return 200, {
+            "model": body.get('model'),
+            "response": reply,
+            "done": True,
+            "prompt_eval_count": _estimate_tokens(body.get('prompt', '')),
+            "eval_count": completion_tokens,
+            "load_duration": 0,
+            "prompt_eval_duration": int(self.ollama.latency * 1e9),
+            "eval_duration": int((delay - self.ollama.latency) * 1e9),
+        }, delay
+
+    def _ollama_embeddings(self, body: Dict[str, Any]) -> tuple:
+        return 200, {"embedding": fake_embedding(body.get('prompt', ''), self._dimensions('ollama', body.get('model')))}, self.ollama.delay()
+
+    def _report(self, body: Dict[str, Any]) -> tuple:
+        return 200, {"code": 0, "message": "OK"}, self.task_api.delay()
+
+    def _questions(self, body: Dict[str, Any]) -> tuple:
+        return 200, "\n".join(f"{qid}={question}" for qid, question in self.questions.items()), self.task_api.delay()
+
+
+WEAPONS = ["karabin plazmowy", "działo jonowe", "pistolet laserowy", "granatnik soniczny"]
+SECTORS = ["A1", "A3", "B2", "C1", "C2", "C4"]
+
+
+def write_reports(directory: str, count: int, paragraphs: int = 6) -> List[str]:
+    """Writes synthetic factory reports named like the real corpus"""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(count)
+    filenames = []
+    for i in range(count):
+        day = 1 + i % 28
+        month = 1 + (i // 28) % 12
+        filename = f"2024_{month:02d}_{day:02d}_{i:04d}.txt"
+        text = "\n\n".join(
+            f"Raport z sektora {rng.choice(SECTORS)}. Podczas patrolu odnotowano {rng.choice(WEAPONS)}. "
+            f"Jednostka {rng.randint(1, 99)} zgłasza stan {rng.choice(['normalny', 'podwyższony', 'krytyczny'])}."
+            for _ in range(paragraphs)
+        )
+        with open(os.path.join(directory, filename), 'w', encoding='utf-8') as f:
+            f.write(text)
+        filenames.append(filename)
+    return filenames
+
+
+def _index_reports(directory: str) -> None:
+    # AIDEVS_CHUNKS, AIDEVS_VECTOR_STORE, AIDEVS_QUANTIZATION and AIDEVS_STREAM_INGEST select what is benchmarked
+    from s03_create_embeddings import (
+        process_files, store_documents, stream_ingest, USE_CHUNKS, STREAM_INGEST, CHUNKS_COLLECTION_NAME, COLLECTION_NAME
+    )
+
+    collection_name = CHUNKS_COLLECTION_NAME if USE_CHUNKS else COLLECTION_NAME
+    if STREAM_INGEST:
+        stream_ingest(directory, collection_name, chunked=USE_CHUNKS)
+    else:
+        store_documents(process_files(directory, chunked=USE_CHUNKS), collection_name)
+
+
+def _bench_create_embeddings(options: Dict[str, Any]) -> Dict[str, Any]:
+    directory = os.path.abspath("reports")
+    write_reports(directory, options['documents'])
+
+    def run():
+        _index_reports(directory)
+
+    return {'run': run, 'items': options['documents']}
+
+
+def _bench_search_documents(options: Dict[str, Any]) -> Dict[str, Any]:
+    from s03_query_embedding import search_documents
+
+    directory = os.path.abspath("reports")
+    write_reports(directory, options['documents'])
+    _index_reports(directory)
+    queries = [f"W raporcie, z którego dnia znajduje się wzmianka o {weapon}?" for weapon in WEAPONS]
+
+    def run():
+        for query in queries:
+            search_documents(query)
+
+    return {'run': run, 'items': len(queries)}
+
+
+def _bench_process_questions(options: Dict[str, Any], retrieval: bool = False) -> Dict[str, Any]:
+    from process_result_md import process_questions, read_markdown_file
+
+    context = read_markdown_file(os.path.join(REPO_DIR, "result.md"))
+    questions = {f"{i:02d}": f"Pytanie numer {i} o treść dokumentu?" for i in range(1, 6)}
+
+    def run():
+        process_questions(questions, context, retrieval=retrieval)
+
+    return {'run': run, 'items': len(questions)}
+
+
+def _bench_embeddings(options: Dict[str, Any]) -> Dict[str, Any]:
+    from aidevs import chunk_text
+    from aidevs_embeddings import get_embedding_model
+
+    write_reports("reports", options['documents'])
+    texts = []
+    for filename in sorted(os.listdir("reports")):
+        with open(os.path.join("reports", filename), 'r', encoding='utf-8') as f:
+            texts.extend(chunk_text(f.read()))
+    # Backend throughput without the response cache, batched as the model declares
+    model = get_embedding_model()
+
+    return {'run': lambda: model.embed(texts), 'items': len(texts)}
+
+
+def _bench_multimodal(options: Dict[str, Any]) -> Dict[str, Any]:
+    import s02_multimodal
+
+    write_reports("temp_data", options['documents'], paragraphs=2)
+
+    return {'run': s02_multimodal.main, 'items': options['documents']}
+
+
+BENCHMARKS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    'create_embeddings': _bench_create_embeddings,
+    'search_documents': _bench_search_documents,
+    'process_questions': _bench_process_questions,
+    'process_questions_retrieval': lambda options: _bench_process_questions(options, retrieval=True),
+    'multimodal': _bench_multimodal,
+    'embeddings': _bench_embeddings,
+}
+
+
+def _run_child(name: str, options: Dict[str, Any], output_path: str) -> None:
+    """Runs one benchmark in the current (fresh) process and writes results as JSON"""
+    # Imports happen here, after the parent set up environment and working directory
+    sys.path.insert(0, REPO_DIR)
+    import aidevs
+    import aidevs_telemetry
+
+    setup = BENCHMARKS[name](options)
+    aidevs_telemetry.reset()
+
+    durations = []
+    for _ in range(options['iterations']):
+        # Every iteration starts cold, otherwise only the first one would call the models
+        aidevs.memory.clear(warn=False)
+        start = time.perf_counter()
+        setup['run']()
+        durations.append(time.perf_counter() - start)
+
+    calls = aidevs_telemetry.summary()
+    result = {
+        'benchmark': name,
+        'iterations': options['iterations'],
+        'items_per_iteration': setup['items'],
+        'wall_time_p50': aidevs_telemetry.percentile(durations, 50),
+        'wall_time_p99': aidevs_telemetry.percentile(durations, 99),
+        'throughput_items_per_s': setup['items'] * len(durations) / sum(durations) if sum(durations) else 0.0,
+        'call_latency_p50': aidevs_telemetry.percentile([r['latency'] for r in aidevs_telemetry.records], 50),
+        'call_latency_p99': aidevs_telemetry.percentile([r['latency'] for r in aidevs_telemetry.records], 99),
+        'model_calls': sum(s['calls'] - s['cache_hits'] for s in calls.values()),
+        'prompt_tokens': sum(s['prompt_tokens'] for s in calls.values()),
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'calls': calls,
+    }
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, default=str)
+
+
+def run_benchmark(name: str, server: StandInServer, options: Dict[str, Any], live: bool = False) -> Dict[str, Any]:
+    """
+    Runs a benchmark in a subprocess with its own working directory and caches.
+
+    Parameters:
+    - name (str): Benchmark name from BENCHMARKS
+    - server (StandInServer): Running stand-in server
+    - options (Dict[str, Any]): Benchmark options (iterations, documents)
+    - live (bool): Use the real OpenAI and Ollama services from the environment instead of the stand-ins
+
+    Returns:
+    - Dict[str, Any]: Benchmark results
+    """
+    workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    output_path = os.path.join(workdir, "result.json")
+    models = {} if live else dict(
+        OPENAI_API_KEY="bench",
+        OPENAI_BASE_URL=f"{server.url}/v1",
+        OLLAMA_BASE_URL=server.url,
+    )
+    env = dict(
+        os.environ,
+        **models,
+        AIDEVS_BASE_URL=server.url,
+        AIDEVS_API_KEY="bench",
+        QDRANT_URL=":memory:",
+        AIDEVS_EXTRACTION_CACHE="0",
+    )
+    try:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', name,
+             '--options', json.dumps(options), '--output', output_path],
+            cwd=workdir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"Benchmark {name} failed:\n{completed.stderr[-2000:]}")
+        with open(output_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(old_path: str, new_path: str) -> None:
+    """Prints relative change of the main metrics between two result files"""
+    with open(old_path, 'r', encoding='utf-8') as f:
+        old = {b['benchmark']: b for b in json.load(f)['benchmarks']}
+    with open(new_path, 'r', encoding='utf-8') as f:
+        new = {b['benchmark']: b for b in json.load(f)['benchmarks']}
+
+    metrics = ['wall_time_p50', 'wall_time_p99', 'throughput_items_per_s', 'model_calls', 'prompt_tokens', 'peak_rss_mb']
+    print(f"{'benchmark':<30} {'metric':<24} {'old':>12} {'new':>12} {'change':>8}")
+    for name in sorted(set(old) & set(new)):
+        for metric in metrics:
+            before, after = old[name][metric], new[name][metric]
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+            print(f"{name:<30} {metric:<24} {before:>12.3f} {after:>12.3f} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipelines against local stand-in servers")
+    parser.add_argument('benchmarks', nargs='*', default=list(BENCHMARKS), help="Benchmarks to run (default: all)")
+    parser.add_argument('--iterations', type=int, default=3)
+    parser.add_argument('--documents', type=int, default=20)
+    parser.add_argument('--openai-latency', type=float, default=0.3)
+    parser.add_argument('--openai-tps', type=float, default=80.0)
+    parser.add_argument('--ollama-latency', type=float, default=0.1)
+    parser.add_argument('--ollama-tps', type=float, default=40.0)
+    parser.add_argument('--embedding-dimensions', type=int, default=384)
+    parser.add_argument('--embedding-model', help="Registered embedding model, e.g. openai:text-embedding-3-small")
+    parser.add_argument('--live', action='store_true', help="Call the real OpenAI and Ollama services instead of the stand-ins")
+    parser.add_argument('--results-dir', default=os.path.join(REPO_DIR, "bench_results"))
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--options', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _run_child(args.child, json.loads(args.options), args.output)
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    server = StandInServer(
+        openai=ServiceProfile(args.openai_latency, args.openai_tps),
+        ollama=ServiceProfile(args.ollama_latency, args.ollama_tps),
+        embedding_dimensions=args.embedding_dimensions,
+        questions={f"{i:02d}": f"Pytanie numer {i} o treść dokumentu?" for i in range(1, 6)}
+    ).start()
+    if args.embedding_model:
+        os.environ['AIDEVS_EMBEDDING_MODEL'] = args.embedding_model
+    options = {
+        'iterations': args.iterations,
+        'documents': args.documents,
+        'embedding_model': os.getenv('AIDEVS_EMBEDDING_MODEL', "ollama:gemma2:27b"),
+        'live': args.live,
+    }
+
+    results = []
+    try:
+        for name in args.benchmarks:
+            print(f"Running {name}...")
+            result = run_benchmark(name, server, options, args.live)
+            results.append(result)
+            print(
+                f"  wall p50 {result['wall_time_p50']:.3f}s, p99 {result['wall_time_p99']:.3f}s, "
+                f"{result['throughput_items_per_s']:.2f} items/s, {result['model_calls']} model calls, "
+                f"peak RSS {result['peak_rss_mb']:.1f} MB"
+            )
+    finally:
+        server.stop()
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    revision = git_revision()
+    output_path = os.path.join(args.results_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{revision}.json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'revision': revision,
+            'timestamp': time.time(),
+            'options': options,
+            'profiles': {
+                'openai': vars(server.openai),
+                'ollama': vars(server.ollama),
+                'task_api': vars(server.task_api),
+            },
+            'benchmarks': results,
+        }, f, indent=2, default=str)
+    print(f"Results saved to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import abc
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import requests
+
+# Used when AIDEVS_EMBEDDING_MODEL is not set; keeps vectors compatible with existing collections
+DEFAULT_EMBEDDING_MODEL = "ollama:gemma2:27b"
+
+
+class EmbeddingModel(abc.ABC):
+    """
+    Embedding backend with declared output size and input limit. Subclasses implement `_embed`.
+
+    Parameters:
+    - model (str): Model name of the backend
+    - dimensions (int): Size of returned vectors
+    - max_input_tokens (int): Longer inputs are truncated (about 4 characters per token)
+    - normalize (bool): Scale vectors to unit length
+    - batch_size (int): Texts sent in one backend request
+    """
+    provider = ""
+
+    def __init__(self, model: str, dimensions: int, max_input_tokens: int, normalize: bool = False, batch_size: int = 32):
+        self.model = model
+        self.dimensions = dimensions
+        self.max_input_tokens = max_input_tokens
+        self.normalize = normalize
+        self.batch_size = batch_size
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+    @abc.abstractmethod
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        """Returns one vector per text from the backend"""
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds texts in batches.
+
+        Parameters:
+        - texts (List[str]): Texts to embed
+
+        Returns:
+        - List[List[float]]: One vector per text
+
+        Raises:
+        - ValueError: If the backend returns another number of vectors or vectors of a different size than declared
+        """
+        max_chars = self.max_input_tokens * 4
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = [text[:max_chars] for text in texts[i:i + self.batch_size]]
+            vectors.extend(self._embed(batch))
+
+        sizes = {len(vector) for vector in vectors}
+        if len(vectors) != len(texts) or sizes - {self.dimensions}:
+            raise ValueError(
+                f"{self.key} returned {len(vectors)} vectors of sizes {sorted(sizes)}, "
+                f"expected {len(texts)} of {self.dimensions}"
+            )
+        if self.normalize:
+            matrix = np.asarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            vectors = (matrix / np.where(norms == 0, 1, norms)).tolist()
+        return vectors
+
+
+class OllamaEmbeddingModel(EmbeddingModel):
+    provider = "ollama"
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        from aidevs import ollama_url
+
+        vectors = []
+        for text in texts:
+            response = requests.post(ollama_url("/api/embeddings"), json={'model': self.model, 'prompt': text})
+            if response.status_code != 200:
+                raise Exception(f"Error getting embedding: {response.text}")
+            vectors.append(response.json()['embedding'])
+        return vectors
+
+
+class OpenAIEmbeddingModel(EmbeddingModel):
+    provider = "openai"
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        import aidevs
+
+        response = aidevs.openai_limiter.call(
+            self.model,
+            sum(aidevs.estimate_tokens(text) for text in texts),
+            lambda: aidevs.limited_client.embeddings.create(model=self.model, input=texts),
+            usage=lambda response: response.usage.total_tokens if response.usage else None
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class SentenceTransformerEmbeddingModel(EmbeddingModel):
+    """Runs a sentence-transformers model on CPU in this process (pip install sentence-transformers)"""
+    provider = "sentence-transformers"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model, device="cpu")
+            return self._model.encode(texts, batch_size=self.batch_size).tolist()
+
+
+EMBEDDING_MODELS: Dict[str, EmbeddingModel] = {}
+
+
+def register_embedding_model(model: EmbeddingModel) -> EmbeddingModel:
+    """Adds a model to the registry under its "provider:model" key"""
+    EMBEDDING_MODELS[model.key] = model
+    return model
+
+
+for _model in [
+    OllamaEmbeddingModel("gemma2:27b", 3584, 8192),
+    OllamaEmbeddingModel("nomic-embed-text", 768, 8192),
+    OllamaEmbeddingModel("mxbai-embed-large", 1024, 512),
+    OllamaEmbeddingModel("bge-m3", 1024, 8192),
+    OpenAIEmbeddingModel("text-embedding-3-small", 1536, 8191, normalize=True, batch_size=256),
+    OpenAIEmbeddingModel("text-embedding-3-large", 3072, 8191, normalize=True, batch_size=256),
+    SentenceTransformerEmbeddingModel("all-MiniLM-L6-v2", 384, 256, normalize=True),
+    SentenceTransformerEmbeddingModel("paraphrase-multilingual-MiniLM-L12-v2", 384, 128, normalize=True),
+]:
+    register_embedding_model(_model)
+
+
+def get_embedding_model(key: Optional[str] = None) -> EmbeddingModel:
+    """
+    Returns registered embedding model.
+
+    Parameters:
+    - key (str): "provider:model", default from AIDEVS_EMBEDDING_MODEL or DEFAULT_EMBEDDING_MODEL
+
+    Returns:
+    - EmbeddingModel: Model
+
+    Raises:
+    - ValueError: If the model is not registered
+    """
+    key = key or os.getenv('AIDEVS_EMBEDDING_MODEL', DEFAULT_EMBEDDING_MODEL)
+    if key not in EMBEDDING_MODELS:
+        raise ValueError(f"Unknown embedding model {key}, registered: {', '.join(sorted(EMBEDDING_MODELS))}")
+    return EMBEDDING_MODELS[key]
@@ -0,0 +1,102 @@
+"""
+JSON-line request/reply over Unix sockets, shared by the task runner (aidevs_runner.py)
+and the model server (aidevs_model_server.py). Depends only on the standard library,
+so the servers start without the configuration aidevs.py needs.
+"""
+import json
+import os
+import socket
+import socketserver
+import threading
+from typing import Any, Dict, Optional
+
+
+def unix_socket_request(socket_path: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Sends one JSON request to a local service listening on a Unix socket and returns its JSON reply.
+    
+    Parameters:
+    - socket_path (str): Path to the Unix socket
+    - payload (Dict[str, Any]): Request
+    - timeout (float): Optional socket timeout in seconds
+    
+    Returns:
+    - Dict[str, Any]: Reply
+    
+    Raises:
+    - ConnectionError: If the service is not running or closes the connection
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise ConnectionError(f"No service listening on {socket_path}: {str(e)}")
+        sock.sendall(json.dumps(payload, ensure_ascii=False).encode('utf-8') + b"\n")
+        with sock.makefile('rb') as reply:
+            line = reply.readline()
+    if not line:
+        raise ConnectionError(f"Service on {socket_path} closed the connection")
+    return json.loads(line)
+
+
+def serve_unix_socket(socket_path: str, handle) -> socketserver.BaseServer:
+    """
+    Creates a threaded server answering JSON-line requests on a Unix socket.
+    Each connection sends one JSON request per line and gets one JSON reply per line.
+    
+    Parameters:
+    - socket_path (str): Path to the Unix socket, a stale socket file is replaced
+    - handle (Callable[[Dict[str, Any]], Dict[str, Any]]): Request handler, it may set
+      `server.stop_requested` to end `serve_forever()` once its reply is sent
+    
+    Returns:
+    - socketserver.BaseServer: Server, run it with `serve_forever()`
+    """
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    reply = handle(json.loads(line))
+                except Exception as e:
+                    reply = {"ok": False, "error": f"{type(e).__name__}: {str(e)}"}
+                self.wfile.write(json.dumps(reply, ensure_ascii=False, default=str).encode('utf-8') + b"\n")
+                self.wfile.flush()
+                if self.server.stop_requested:
+                    # Stop only after the reply is sent, handler threads die with the process
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                    return
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+    server.daemon_threads = True
+    server.stop_requested = False
+    return server
+
+
+def model_server_request(op: str, **params) -> Optional[str]:
+    """
+    Runs transcription or OCR on the shared model server when AIDEVS_MODEL_SERVER is set
+    to its socket path (see aidevs_model_server.py).
+    
+    Parameters:
+    - op (str): "transcribe" or "ocr"
+    - **params: Request parameters, file paths are sent as absolute paths
+    
+    Returns:
+    - Optional[str]: Extracted text, None if no model server is configured
+    
+    Raises:
+    - Exception: If the server reports an error
+    """
+    socket_path = os.getenv('AIDEVS_MODEL_SERVER')
+    if not socket_path:
+        return None
+    params['path'] = os.path.abspath(params['path'])
+    reply = unix_socket_request(socket_path, {'op': op, **params})
+    if not reply.get('ok'):
+        raise Exception(f"Model server error: {reply.get('error')}")
+    return reply['text']
@@ -0,0 +1,246 @@
+"""
+Local inference server holding one copy of the Whisper and EasyOCR models for all processes.
+Workers send transcribe/OCR requests over a Unix socket; requests for the same model are
+queued and run one at a time by the single thread that owns the model. Requests queued
+together are de-duplicated, identical ones (e.g. the same file from two processes) run once.
+
+Usage:
+    python aidevs_model_server.py [--socket PATH] [--warm whisper:turbo easyocr:en,pl]
+    AIDEVS_MODEL_SERVER=/tmp/aidevs-models.sock python s02_multimodal.py
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aidevs_ipc import serve_unix_socket
+
+DEFAULT_SOCKET = os.getenv('AIDEVS_MODEL_SERVER', os.path.join("/tmp", f"aidevs-models-{os.getuid()}.sock"))
+
+
+class _Request:
+    def __init__(self, params: Dict[str, Any]):
+        self.params = params
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[str] = None
+
+
+class ModelWorker:
+    """
+    Owns one loaded model and runs queued requests for it sequentially. Requests are taken
+    from the queue in groups, identical requests within a group are computed once; the model
+    still runs each distinct request on its own, there is no batched inference.
+
+    Parameters:
+    - load (Callable[[], Any]): Loads the model
+    - run (Callable[[Any, Dict[str, Any]], Any]): Runs a single request on the model
+    - max_batch (int): Maximum number of requests taken from the queue at once
+    - batch_window (float): Seconds to wait for more requests after the first one, so duplicates
+      arriving together share one run
+    """
+
+    def __init__(self, load: Callable[[], Any], run: Callable[[Any, Dict[str, Any]], Any],
+                 max_batch: int = 16, batch_window: float = 0.01):
+        self.load = load
+        self.run = run
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.model = None
+        self.requests = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._ready = threading.Event()
+        self._load_error: Optional[str] = None
+        self._thread.start()
+
+    def wait_ready(self) -> None:
+        """Blocks until the model is loaded"""
+        self._ready.wait()
+        if self._load_error:
+            raise Exception(self._load_error)
+
+    def submit(self, params: Dict[str, Any]) -> Any:
+        """Queues a request and waits for its result"""
+        request = _Request(params)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise Exception(request.error)
+        return request.result
+
+    def _next_batch(self) -> List[_Request]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        try:
+            self.model = self.load()
+        except Exception as e:
+            self._load_error = f"Error loading model: {str(e)}"
+        self._ready.set()
+
+        while True:
+            batch = self._next_batch()
+            start = time.perf_counter()
+            results: Dict[Tuple, Tuple[Any, Optional[str]]] = {}
+            for request in batch:
+                key = tuple(sorted((k, repr(v)) for k, v in request.params.items()))
+                if key not in results:
+                    if self._load_error:
+                        results[key] = (None, self._load_error)
+                    else:
+                        try:
+                            results[key] = (self.run(self.model, request.params), None)
+                        except Exception as e:
+                            results[key] = (None, f"{type(e).__name__}: {str(e)}")
+                request.result, request.error = results[key]
+                request.done.set()
+            self.requests += len(batch)
+            self.batches += 1
+            self.busy_seconds += time.perf_counter() - start
+
+
+def _load_whisper(model_name: str):
+    import whisper
+    return whisper.load_model(model_name)
+
+
+def _run_whisper(model, params: Dict[str, Any]) -> str:
+    result = model.transcribe(params['path'], language=params.get('language'))
+    return result['text'].strip()
+
+
+def _load_easyocr(languages: List[str]):
+    import easyocr
+    return easyocr.Reader(languages)
+
+
+def _run_easyocr(reader, params: Dict[str, Any]) -> str:
+    result = reader.readtext(params['path'])
+    return ' '.join([text[1] for text in result]).strip()
+
+
+class ModelServer:
+    """
+    Keeps one worker per loaded model, e.g. ("whisper", "turbo") or ("easyocr", "en,pl").
+    Models are loaded on first use or with `warm`.
+
+    Parameters:
+    - max_batch (int): Maximum requests a worker takes from its queue at once
+    - batch_window (float): Seconds a worker waits for duplicate requests
+    """
+
+    def __init__(self, max_batch: int = 16, batch_window: float = 0.01):
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self._workers: Dict[Tuple[str, str], ModelWorker] = {}
+        self._lock = threading.Lock()
+
+    def worker(self, kind: str, name: str) -> ModelWorker:
+        """
+        Returns worker for a model, starting it if needed.
+
+        Parameters:
+        - kind (str): "whisper" or "easyocr"
+        - name (str): Whisper model name or comma-separated EasyOCR languages
+
+        Raises:
+        - ValueError: If the model kind is unknown
+        """
+        with self._lock:
+            key = (kind, name)
+            if key not in self._workers:
+                if kind == 'whisper':
+                    self._workers[key] = ModelWorker(lambda: _load_whisper(name), _run_whisper, self.max_batch, self.batch_window)
+                elif kind == 'easyocr':
+                    self._workers[key] = ModelWorker(lambda: _load_easyocr(name.split(',')), _run_easyocr, self.max_batch, self.batch_window)
+                else:
+                    raise ValueError(f"Unknown model kind: {kind}")
+            return self._workers[key]
+
+    def warm(self, kind: str, name: str) -> None:
+        """Loads a model ahead of the first request"""
+        self.worker(kind, name).wait_ready()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                f"{kind}:{name}": {
+                    'loaded': worker.model is not None,
+                    'requests': worker.requests,
+                    'batches': worker.batches,
+                    'busy_seconds': worker.busy_seconds,
+                }
+                for (kind, name), worker in self._workers.items()
+            }
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Handles one request.
+
+        Requests:
+        - {"op": "transcribe", "path": "/abs/file.mp3", "model_name": "turbo", "language": "pl"}
+        - {"op": "ocr", "path": "/abs/file.png", "languages": ["en", "pl"]}
+        - {"op": "ping"}, {"op": "stats"}
+
+        Returns:
+        - Dict[str, Any]: {"ok": True, "text": ...} or {"ok": False, "error": ...}
+        """
+        op = request.get('op')
+        try:
+            if op == 'transcribe':
+                worker = self.worker('whisper', request.get('model_name', 'base'))
+                text = worker.submit({'path': request['path'], 'language': request.get('language')})
+            elif op == 'ocr':
+                worker = self.worker('easyocr', ','.join(request.get('languages', ['en'])))
+                text = worker.submit({'path': request['path']})
+            elif op == 'ping':
+                return {'ok': True, 'pid': os.getpid()}
+            elif op == 'stats':
+                return {'ok': True, 'models': self.stats()}
+            else:
+                return {'ok': False, 'error': f"Unknown op: {op}"}
+        except Exception as e:
+            return {'ok': False, 'error': str(e)}
+        return {'ok': True, 'text': text}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Whisper and EasyOCR models to local processes")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    parser.add_argument('--warm', nargs='*', default=[], help="Models to load at start, e.g. whisper:turbo easyocr:en,pl")
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--batch-window', type=float, default=0.01, help="Seconds to wait for duplicate requests")
+    args = parser.parse_args()
+
+    server = ModelServer(args.max_batch, args.batch_window)
+    for model in args.warm:
+        kind, _, name = model.partition(':')
+        print(f"Loading {kind} {name}...")
+        server.warm(kind, name)
+
+    socket_server = serve_unix_socket(args.socket, server.handle)
+    print(f"Model server listening on {args.socket}")
+    try:
+        socket_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        socket_server.server_close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
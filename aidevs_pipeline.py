@@ -0,0 +1,175 @@
+import hashlib
+import inspect
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import joblib
+
+
+class Stage:
+    """
+    Pipeline step. `func` is called with outputs of the `inputs` stages (positionally,
+    in the listed order) and `params` as keyword arguments.
+
+    Parameters:
+    - name (str): Unique stage name
+    - func (Callable): Function computing the stage output
+    - inputs (List[str]): Names of stages whose outputs are passed to `func`
+    - params (Dict[str, Any]): Keyword arguments, part of the fingerprint (e.g. prompts, model names)
+    - cache (bool): Persist output; set False for cheap stages that read external state
+      (e.g. listing files) or must always run (e.g. uploads to an in-memory index)
+    - version (str): Part of the fingerprint; bump it when code the stage calls changed
+    - is_valid (Callable[[Any], bool]): Checks a stored output before it is reused, e.g. that
+      an uploaded collection still exists; when it returns False the stage reruns
+
+    Only the source of `func` itself is fingerprinted. Changes to helpers it calls
+    (get_embedding, chunk_text, ...) do not invalidate stored outputs, so pass the prompts,
+    models and sizes a stage relies on in `params`, and bump `version` after other changes.
+    """
+
+    def __init__(self, name: str, func: Callable, inputs: Optional[List[str]] = None,
+                 params: Optional[Dict[str, Any]] = None, cache: bool = True, version: str = "",
+                 is_valid: Optional[Callable[[Any], bool]] = None):
+        self.name = name
+        self.func = func
+        self.inputs = inputs or []
+        self.params = params or {}
+        self.cache = cache
+        self.version = version
+        self.is_valid = is_valid
+
+    def fingerprint(self, input_fingerprints: List[str]) -> str:
+        """
+        Hashes stage code, version, params and fingerprints of input outputs. Only changes
+        that reach this stage invalidate it, e.g. a new rerank prompt keeps embeddings valid.
+        """
+        try:
+            source = inspect.getsource(self.func)
+        except (OSError, TypeError):
+            source = f"{self.func.__module__}.{self.func.__qualname__}"
+        raw = json.dumps([self.name, source, self.version, self.params, input_fingerprints], sort_keys=True, default=repr)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class Pipeline:
+    """
+    DAG of stages with persisted, fingerprinted outputs. A stage reruns only when its code,
+    params or the output of one of its inputs changed; stages whose inputs are ready run in
+    parallel threads.
+
+    Parameters:
+    - stages (List[Stage]): Stages in any order
+    - directory (str): Where stage outputs are stored
+    - max_workers (int): Maximum number of stages running at once
+    """
+
+    def __init__(self, stages: List[Stage], directory: str = os.path.join("_cache_dir", "pipeline"), max_workers: int = 4):
+        self.stages = {stage.name: stage for stage in stages}
+        self.directory = directory
+        self.max_workers = max_workers
+        for stage in stages:
+            for name in stage.inputs:
+                if name not in self.stages:
+                    raise ValueError(f"Stage {stage.name} depends on unknown stage {name}")
+        # Filled by run: stage name -> {"status": "ran"|"cached", "duration", "fingerprint"}
+        self.report: Dict[str, Dict[str, Any]] = {}
+
+    def levels(self, targets: Optional[List[str]] = None) -> List[List[str]]:
+        """
+        Groups stages needed for `targets` into levels; stages of a level only depend on earlier levels.
+
+        Raises:
+        - ValueError: If stages form a cycle
+        """
+        needed, stack = set(), list(targets or self.stages)
+        while stack:
+            name = stack.pop()
+            if name not in needed:
+                needed.add(name)
+                stack.extend(self.stages[name].inputs)
+
+        levels, done = [], set()
+        while len(done) < len(needed):
+            level = sorted(name for name in needed - done if set(self.stages[name].inputs) <= done)
+            if not level:
+                raise ValueError(f"Pipeline has a cycle among: {sorted(needed - done)}")
+            levels.append(level)
+            done.update(level)
+        return levels
+
+    def _paths(self, stage: Stage, fingerprint: str) -> tuple:
+        base = os.path.join(self.directory, stage.name, fingerprint)
+        return f"{base}.pkl", f"{base}.json"
+
+    def _run_stage(self, stage: Stage, outputs: Dict[str, Any], output_fingerprints: Dict[str, str], force: bool) -> tuple:
+        fingerprint = stage.fingerprint([output_fingerprints[name] for name in stage.inputs])
+        output_path, meta_path = self._paths(stage, fingerprint)
+        start = time.perf_counter()
+
+        output, status = None, None
+        if stage.cache and not force and os.path.exists(meta_path) and os.path.exists(output_path):
+            output = joblib.load(output_path)
+            if stage.is_valid is None or stage.is_valid(output):
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                status = 'cached'
+        if status is None:
+            output = stage.func(*[outputs[name] for name in stage.inputs], **stage.params)
+            # Fingerprint of the output itself, so downstream stages are reused when an
+            # upstream rerun produces the same result. Uncached stages may have effects their
+            # output does not show (e.g. an upload returns only a point count), their inputs count too
+            output_fingerprint = joblib.hash(output if stage.cache else [fingerprint, output])
+            meta = {'output_fingerprint': output_fingerprint, 'created': time.time()}
+            if stage.cache:
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                joblib.dump(output, f"{output_path}.tmp")
+                os.replace(f"{output_path}.tmp", output_path)
+                with open(meta_path, 'w', encoding='utf-8') as f:
+                    json.dump(meta, f)
+            status = 'ran'
+
+        self.report[stage.name] = {
+            'status': status,
+            'duration': time.perf_counter() - start,
+            'fingerprint': fingerprint,
+        }
+        return output, meta['output_fingerprint']
+
+    def run(self, targets: Optional[List[str]] = None, force: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Runs stages needed for `targets` (default: all), reusing persisted outputs.
+
+        Parameters:
+        - targets (List[str]): Stages whose outputs are needed
+        - force (List[str]): Stages to rerun even if their output is stored
+
+        Returns:
+        - Dict[str, Any]: Stage name to output for every stage that was needed
+        """
+        force = set(force or [])
+        outputs: Dict[str, Any] = {}
+        output_fingerprints: Dict[str, str] = {}
+        self.report = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for level in self.levels(targets):
+                futures = {
+                    name: executor.submit(self._run_stage, self.stages[name], outputs, output_fingerprints, name in force)
+                    for name in level
+                }
+                for name, future in futures.items():
+                    try:
+                        outputs[name], output_fingerprints[name] = future.result()
+                    except Exception as e:
+                        raise Exception(f"Error in pipeline stage {name}: {str(e)}")
+        return outputs
+
+    def format_report(self) -> str:
+        """Returns one line per stage of the last run: status and duration"""
+        return "\n".join(
+            f"{name:<12} {entry['status']:<7} {entry['duration']:.3f}s"
+            for name, entry in self.report.items()
+        )
@@ -0,0 +1,228 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+# Requests and tokens per minute per model, override with AIDEVS_OPENAI_LIMITS='{"gpt-4o": {"rpm": 5000, "tpm": 800000}}'
+DEFAULT_LIMITS: Dict[str, Dict[str, int]] = {
+    'gpt-4o-mini': {'rpm': 500, 'tpm': 200000},
+    'gpt-4o': {'rpm': 500, 'tpm': 30000},
+    'gpt-4': {'rpm': 500, 'tpm': 10000},
+    'default': {'rpm': 500, 'tpm': 30000},
+}
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations in arrival order. A reservation may take the
+    bucket below zero, the caller then waits until the debt is refilled, so callers
+    are served first come, first served.
+
+    Parameters:
+    - capacity (float): Maximum number of tokens (burst size)
+    - refill_rate (float): Tokens added per second
+    """
+
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Takes `amount` tokens and returns how many seconds the caller has to wait"""
+        self._refill(now)
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.refill_rate
+
+    def adjust(self, amount: float, now: float) -> None:
+        """Corrects a reservation once the real usage is known (positive amount takes more tokens)"""
+        self._refill(now)
+        self.tokens -= amount
+
+
+class ModelLimiter:
+    """Requests-per-minute and tokens-per-minute budgets of a single model"""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm, rpm / 60)
+        self.tokens = TokenBucket(tpm, tpm / 60)
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens: int) -> float:
+        """
+        Waits until the request fits into the budgets.
+
+        Parameters:
+        - estimated_tokens (int): Estimated prompt plus completion tokens
+
+        Returns:
+        - float: Seconds spent waiting
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(
+                self.requests.reserve(1, now),
+                self.tokens.reserve(estimated_tokens, now),
+                self.blocked_until - now
+            )
+        if wait > 0:
+            time.sleep(wait)
+        return max(wait, 0.0)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Replaces estimated token usage with the one reported by the API"""
+        with self._lock:
+            self.tokens.adjust(actual_tokens - estimated_tokens, time.monotonic())
+
+    def release(self, estimated_tokens: int) -> None:
+        """Credits back the reservation of a failed request before it is retried"""
+        with self._lock:
+            now = time.monotonic()
+            self.requests.adjust(-1, now)
+            self.tokens.adjust(-estimated_tokens, now)
+
+    def block(self, seconds: float) -> None:
+        """Pauses all callers of this model, e.g. after a 429 with Retry-After"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status_code = getattr(error, 'status_code', None)
+    if status_code is None and getattr(error, 'response', None) is not None:
+        status_code = getattr(error.response, 'status_code', None)
+    return status_code
+
+
+def _error_code(error: Exception) -> Optional[str]:
+    code = getattr(error, 'code', None)
+    body = getattr(error, 'body', None)
+    if code is None and isinstance(body, dict):
+        code = body.get('code') or (body.get('error') or {}).get('code')
+    return code
+
+
+def is_retryable(error: Exception) -> bool:
+    """Returns True for rate limit, server and connection errors; an exhausted quota is final"""
+    if type(error).__name__ in ('APIConnectionError', 'APITimeoutError'):
+        return True
+    if _error_code(error) == 'insufficient_quota':
+        return False
+    return _status_code(error) in RETRYABLE_STATUS_CODES
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Returns delay requested by the server in Retry-After headers, if any"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        # HTTP-date form is not used by OpenAI, fall back to backoff
+        return None
+    return None
+
+
+class RateLimiter:
+    """
+    Shared scheduler for OpenAI calls. Enforces per-model RPM/TPM budgets using estimated
+    request size and retries rate limit and server errors with jittered exponential backoff
+    that honors Retry-After.
+
+    Parameters:
+    - limits (Dict[str, Dict[str, int]]): Per-model {"rpm", "tpm"}; "default" applies to other models
+    - max_retries (int): Maximum number of retries of a single call
+    - base_delay (float): First backoff delay in seconds
+    - max_delay (float): Maximum backoff delay in seconds
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Dict[str, int]]] = None,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0
+    ):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._limiters: Dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, model: str) -> ModelLimiter:
+        with self._lock:
+            if model not in self._limiters:
+                limits = self.limits.get(model, self.limits['default'])
+                self._limiters[model] = ModelLimiter(limits['rpm'], limits['tpm'])
+            return self._limiters[model]
+
+    def call(
+        self,
+        model: str,
+        estimated_tokens: int,
+        request: Callable[[], Any],
+        usage: Callable[[Any], Optional[int]] = lambda response: None
+    ) -> Any:
+        """
+        Runs `request` within the model budgets, retrying retryable errors.
+
+        Parameters:
+        - model (str): Model name
+        - estimated_tokens (int): Estimated prompt plus completion tokens
+        - request (Callable[[], Any]): Function performing the API call
+        - usage (Callable[[Any], Optional[int]]): Extracts actual total tokens from the response
+
+        Returns:
+        - Any: Response of `request`
+
+        Raises:
+        - Exception: Last error if it is not retryable or retries are exhausted
+        """
+        limiter = self.limiter(model)
+        attempt = 0
+        while True:
+            limiter.acquire(estimated_tokens)
+            try:
+                response = request()
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                if _status_code(e) != 429:
+                    # The retry reserves again, so a failed attempt does not count twice. A 429
+                    # keeps its reservation: the budget was exceeded, the bucket must stay drained
+                    limiter.release(estimated_tokens)
+                delay = retry_after(e)
+                attempt += 1
+                if delay is not None and _status_code(e) == 429:
+                    # The next acquire waits for the block, together with other callers of the model
+                    limiter.block(delay)
+                    continue
+                if delay is None:
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+                time.sleep(delay)
+                continue
+
+            actual_tokens = usage(response)
+            if actual_tokens is not None:
+                limiter.record_usage(estimated_tokens, actual_tokens)
+            return response
+
+
+openai_limiter = RateLimiter(json.loads(os.getenv('AIDEVS_OPENAI_LIMITS', '{}')))
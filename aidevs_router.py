@@ -0,0 +1,315 @@
+"""
+Routes structured-output requests to the cheapest model meeting a task's quality tier.
+Opt-in: unless AIDEVS_ROUTER=1, call sites use their own default model.
+
+Candidates are tried in order of tier, then of observed latency. A request escalates to a
+larger model when the answer fails schema validation or its confidence is below the task's minimum, and
+falls back to the next candidate on errors. Local models are deprioritized while the Ollama
+queue is saturated, OpenAI models while rate limited, and any model with a high recent error
+rate, so traffic moves to OpenAI when the local server is busy and back when it recovers.
+
+Routing depends on live latency and load, so it is not deterministic: the same question may be
+answered by different models across runs. Answers are cached per model, so a repeated question
+returns the cached answer of whichever model it is routed to, which may differ from the previous
+run. Leave routing off (or use a single-model AIDEVS_ROUTER_MODELS) for reproducible results.
+
+Configuration:
+- AIDEVS_ROUTER=1 enables routing, by default call sites use their default model
+- AIDEVS_ROUTER_MODELS='[{"name": "llama3.1:8b", "provider": "ollama", "tier": 2}, ...]' replaces DEFAULT_MODELS
+- AIDEVS_ROUTER_LOCAL_CONCURRENCY: Local requests in flight at which Ollama counts as saturated
+- AIDEVS_ROUTER_LOG: JSONL file receiving routing decisions
+"""
+import collections
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import aidevs
+from aidevs_ratelimit import openai_limiter
+from aidevs_telemetry import annotate
+
+QUALITY_TIERS = {'basic': 1, 'standard': 2, 'strong': 3}
+
+
+class RoutedModel:
+    """
+    Model available to the router.
+
+    Parameters:
+    - name (str): Model name of the provider
+    - provider (str): "ollama" or "openai"
+    - tier (int): Highest quality tier the model meets, see QUALITY_TIERS
+    """
+
+    def __init__(self, name: str, provider: str, tier: int):
+        self.name = name
+        self.provider = provider
+        self.tier = tier
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider}:{self.name}"
+
+
+# Models the repo already uses, cheapest first within a tier
+DEFAULT_MODELS = [
+    RoutedModel('llama3.1:8b', 'ollama', 2),
+    RoutedModel('gpt-4o-mini', 'openai', 2),
+    RoutedModel('gemma2:27b', 'ollama', 3),
+    RoutedModel('gpt-4o', 'openai', 3),
+]
+
+
+class ModelStats:
+    """Live statistics of a model: requests in flight, moving averages of latency and error rate"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.last_error_at = 0.0
+
+    def finish(self, latency: Optional[float], error: bool) -> None:
+        """Records a finished request; `latency` is None for answers served from cache"""
+        self.in_flight -= 1
+        self.calls += 1
+        if latency is not None:
+            self.latency = latency if self.latency is None else self.alpha * latency + (1 - self.alpha) * self.latency
+        self.error_rate = self.alpha * float(error) + (1 - self.alpha) * self.error_rate
+        if error:
+            self.errors += 1
+            self.consecutive_errors += 1
+            self.last_error_at = time.monotonic()
+        else:
+            self.consecutive_errors = 0
+
+
+def with_confidence(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Adds a required 0-1 "confidence" property to an object schema"""
+    return {
+        **schema,
+        'properties': {
+            **schema['properties'],
+            'confidence': {'type': 'number', 'minimum': 0, 'maximum': 1, 'description': "Confidence in the answer"}
+        },
+        'required': list(schema.get('required', [])) + ['confidence'],
+    }
+
+
+class ModelRouter:
+    """
+    Chooses models for structured-output requests by quality tier and live statistics.
+
+    Parameters:
+    - models (List[RoutedModel]): Available models, cheapest first within a tier
+    - max_local_in_flight (int): Local requests in flight at which Ollama counts as saturated
+    - max_error_rate (float): Moving error rate above which a model is deprioritized
+    - error_cooldown (float): Seconds after the last error when a failing model is tried first again
+    - log_path (str): Optional JSONL file receiving routing decisions
+    - enabled (bool): When False, requests go to the default model of the call site
+    """
+
+    def __init__(
+        self,
+        models: Optional[List[RoutedModel]] = None,
+        max_local_in_flight: int = 2,
+        max_error_rate: float = 0.5,
+        error_cooldown: float = 30.0,
+        log_path: Optional[str] = None,
+        enabled: bool = True
+    ):
+        self.models = models or list(DEFAULT_MODELS)
+        self.max_local_in_flight = max_local_in_flight
+        self.max_error_rate = max_error_rate
+        self.error_cooldown = error_cooldown
+        self.log_path = log_path
+        self.enabled = enabled
+        self.decisions: collections.deque = collections.deque(maxlen=1000)
+        self._stats: Dict[str, ModelStats] = collections.defaultdict(ModelStats)
+        self._lock = threading.Lock()
+
+    def _deprioritized(self, model: RoutedModel) -> Optional[str]:
+        """Returns why the model should only be used as a last resort, None if it is healthy"""
+        now = time.monotonic()
+        stats = self._stats[model.key]
+        if now - stats.last_error_at < self.error_cooldown:
+            # A failed last call (e.g. the server is down) is enough, the moving average catches intermittent errors
+            if stats.consecutive_errors:
+                return f"{stats.consecutive_errors} consecutive errors"
+            if stats.error_rate > self.max_error_rate:
+                return f"error rate {stats.error_rate:.2f}"
+        if model.provider == 'ollama':
+            local_in_flight = sum(self._stats[m.key].in_flight for m in self.models if m.provider == 'ollama')
+            if local_in_flight >= self.max_local_in_flight:
+                return f"local queue saturated ({local_in_flight} in flight)"
+        elif openai_limiter.limiter(model.name).blocked_until > now:
+            return "rate limited"
+        return None
+
+    def candidates(self, tier: str) -> List[Dict[str, Any]]:
+        """
+        Orders models meeting the tier: healthy ones by tier and latency, then deprioritized ones.
+
+        Returns:
+        - List[Dict[str, Any]]: {"model": RoutedModel, "deprioritized": reason or None}
+        """
+        required = QUALITY_TIERS[tier]
+        with self._lock:
+            eligible = [
+                {'model': model, 'deprioritized': self._deprioritized(model)}
+                for model in self.models if model.tier >= required
+            ]
+            latency = {model.key: self._stats[model.key].latency or 0.0 for model in self.models}
+        # Models without measurements sort first within their tier, so they get measured
+        return sorted(eligible, key=lambda c: (c['deprioritized'] is not None, c['model'].tier, latency[c['model'].key]))
+
+    def _call(self, model: RoutedModel, question: str, schema: Dict[str, Any],
+              system_prompt: Optional[str], max_tokens: Optional[int]) -> Any:
+        try:
+            cached = aidevs._answer_structured_cached.check_call_in_cache(
+                question, schema, system_prompt, model.name, model.provider, max_tokens
+            )
+        except Exception:
+            cached = False
+        with self._lock:
+            self._stats[model.key].in_flight += 1
+        start = time.perf_counter()
+        error = False
+        try:
+            return aidevs.answer_structured(question, schema, system_prompt, model.name, model.provider, max_tokens)
+        except aidevs.SchemaValidationError:
+            # Invalid answer, the model itself is healthy
+            raise
+        except Exception:
+            error = True
+            raise
+        finally:
+            with self._lock:
+                self._stats[model.key].finish(None if cached else time.perf_counter() - start, error)
+
+    def answer(
+        self,
+        task: str,
+        question: str,
+        schema: Dict[str, Any],
+        tier: str = 'basic',
+        system_prompt: Optional[str] = None,
+        min_confidence: Optional[float] = None,
+        default_model: str = 'gpt-4o-mini',
+        default_provider: str = 'openai',
+        max_tokens: Optional[int] = None
+    ) -> Any:
+        """
+        Answers with the cheapest suitable model (see aidevs.answer_structured).
+
+        Parameters:
+        - task (str): Task name used in the log
+        - question (str): User question
+        - schema (Dict[str, Any]): JSON schema of the answer, an object schema when min_confidence is set
+        - tier (str): Required quality tier, key of QUALITY_TIERS
+        - system_prompt (str): Optional system prompt
+        - min_confidence (float): Escalate when the model's confidence is lower
+        - default_model (str): Model used when routing is disabled
+        - default_provider (str): Provider of default_model
+        - max_tokens (int): Optional limit of completion tokens
+
+        Returns:
+        - Any: Validated answer; after all escalations fail to reach min_confidence, the last valid answer
+
+        Raises:
+        - Exception: Last error if no model returned a valid answer
+        """
+        if not self.enabled:
+            return aidevs.answer_structured(question, schema, system_prompt, default_model, default_provider, max_tokens)
+
+        routed_schema = with_confidence(schema) if min_confidence is not None else schema
+        attempts = []
+        answer, chosen, last_error = None, None, None
+        escalate_above = 0
+        start = time.perf_counter()
+        for candidate in self.candidates(tier):
+            model = candidate['model']
+            if model.tier <= escalate_above:
+                continue
+            attempt = {'model': model.key}
+            if candidate['deprioritized']:
+                attempt['deprioritized'] = candidate['deprioritized']
+            attempts.append(attempt)
+            try:
+                result = self._call(model, question, routed_schema, system_prompt, max_tokens)
+            except aidevs.SchemaValidationError as e:
+                attempt['invalid'] = str(e)
+                escalate_above, last_error = model.tier, e
+                continue
+            except Exception as e:
+                # Errors (connection, broken responses) fall back to the next model, which may be of the same tier
+                attempt['error'] = f"{type(e).__name__}: {str(e)}"
+                last_error = e
+                continue
+
+            if min_confidence is not None:
+                result = dict(result)
+                attempt['confidence'] = result.pop('confidence')
+            answer, chosen = result, model
+            if min_confidence is not None and attempt['confidence'] < min_confidence:
+                escalate_above = model.tier
+                continue
+            break
+
+        self._log({
+            'time': time.time(),
+            'task': task,
+            'tier': tier,
+            'model': chosen.key if chosen else None,
+            'attempts': attempts,
+            'latency': time.perf_counter() - start,
+        })
+        if chosen is None:
+            raise last_error or ValueError(f"No model meets tier {tier}")
+        return answer
+
+    def _log(self, decision: Dict[str, Any]) -> None:
+        annotate(routed_model=decision['model'], routing_attempts=len(decision['attempts']))
+        with self._lock:
+            self.decisions.append(decision)
+            if self.log_path:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(decision, ensure_ascii=False) + "\n")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Returns live statistics per model and how many requests each model answered"""
+        with self._lock:
+            chosen = collections.Counter(decision['model'] for decision in self.decisions)
+            return {
+                model.key: {
+                    'tier': model.tier,
+                    'calls': self._stats[model.key].calls,
+                    'errors': self._stats[model.key].errors,
+                    'in_flight': self._stats[model.key].in_flight,
+                    'latency': self._stats[model.key].latency,
+                    'error_rate': self._stats[model.key].error_rate,
+                    'chosen': chosen[model.key],
+                }
+                for model in self.models
+            }
+
+
+def _models_from_env() -> Optional[List[RoutedModel]]:
+    models = os.getenv('AIDEVS_ROUTER_MODELS')
+    if not models:
+        return None
+    return [RoutedModel(m['name'], m['provider'], m['tier']) for m in json.loads(models)]
+
+
+router = ModelRouter(
+    models=_models_from_env(),
+    max_local_in_flight=int(os.getenv('AIDEVS_ROUTER_LOCAL_CONCURRENCY', 2)),
+    log_path=os.getenv('AIDEVS_ROUTER_LOG'),
+    enabled=os.getenv('AIDEVS_ROUTER', '0') == '1'
+)
@@ -0,0 +1,219 @@
+"""
+Long-lived task runner. Keeps one Python process with imported modules, HTTP clients,
+caches and loaded models, and runs task scripts (modules exposing `main`) inside it.
+
+The client forwards its AIDEVS_*, OPENAI_*, OLLAMA_* and QDRANT_* variables, they are set
+for the duration of the run and the task module is reloaded when they differ from the run
+that loaded it. Modules the task imports (aidevs, s03_create_embeddings, ...) are not
+reloaded: their module-level settings keep the values of the run that first imported them,
+restart the runner to change those.
+
+Usage:
+    python aidevs_runner.py serve [--warm audio image]
+    python aidevs_runner.py run s02_multimodal
+    python aidevs_runner.py stop
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+from aidevs_ipc import unix_socket_request, serve_unix_socket
+
+DEFAULT_SOCKET = os.getenv('AIDEVS_RUNNER_SOCKET', os.path.join("/tmp", f"aidevs-runner-{os.getuid()}.sock"))
+# Environment variables sent with "run" requests
+FORWARDED_ENV_PREFIXES = ('AIDEVS_', 'OPENAI_', 'OLLAMA_', 'QDRANT_')
+
+
+def forwarded_env() -> Dict[str, str]:
+    """Returns the variables of this process that a run request carries"""
+    return {key: value for key, value in os.environ.items() if key.startswith(FORWARDED_ENV_PREFIXES)}
+
+
+@contextlib.contextmanager
+def task_environment(env: Optional[Dict[str, str]]):
+    """
+    Replaces forwarded variables of this process with `env` until the block exits.
+    None keeps the runner's own environment.
+    """
+    if env is None:
+        yield
+        return
+    previous = dict(os.environ)
+    for key in forwarded_env():
+        del os.environ[key]
+    os.environ.update(env)
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(previous)
+
+
+class TaskRunner:
+    """
+    Loads task modules by name and runs their `main` function. Modules stay imported
+    between runs and are reloaded only when their source file changes.
+    Runs are serialized because tasks use the working directory and stdout.
+    """
+
+    def __init__(self):
+        self._loaded: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.runs = 0
+
+    def load(self, name: str):
+        """
+        Imports task module, reloading it if its file or the forwarded environment
+        changed since the last run, so module-level settings are read again.
+
+        Raises:
+        - AttributeError: If module has no `main` function
+        """
+        module = importlib.import_module(name)
+        state = (os.path.getmtime(module.__file__), tuple(sorted(forwarded_env().items())))
+        if name in self._loaded and self._loaded[name] != state:
+            module = importlib.reload(module)
+        self._loaded[name] = state
+        if not callable(getattr(module, 'main', None)):
+            raise AttributeError(f"Task module {name} has no main function")
+        return module
+
+    def run(self, name: str, args: Optional[List[Any]] = None, cwd: Optional[str] = None,
+            env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Runs task `main` and captures its output.
+
+        Parameters:
+        - name (str): Module name, e.g. "s02_multimodal"
+        - args (List[Any]): Positional arguments for `main`
+        - cwd (str): Working directory for the run (default: runner's directory)
+        - env (Dict[str, str]): Forwarded variables of the client (default: runner's environment)
+
+        Returns:
+        - Dict[str, Any]: {"ok", "output", "error", "duration"}
+        """
+        with self._lock:
+            output = io.StringIO()
+            previous_cwd = os.getcwd()
+            start = time.perf_counter()
+            error = None
+            try:
+                if cwd:
+                    os.chdir(cwd)
+                with task_environment(env), contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                    module = self.load(name)
+                    module.main(*(args or []))
+            except SystemExit as e:
+                if e.code not in (None, 0):
+                    error = f"SystemExit: {e.code}"
+            except Exception:
+                error = traceback.format_exc()
+            finally:
+                os.chdir(previous_cwd)
+                self.runs += 1
+            return {
+                'ok': error is None,
+                'output': output.getvalue(),
+                'error': error,
+                'duration': time.perf_counter() - start,
+            }
+
+
+def warm_up(plugins: List[str]) -> None:
+    """
+    Imports shared modules and loads extractor models ahead of the first task.
+
+    Parameters:
+    - plugins (List[str]): Extractor plugins to warm up: "audio", "image"
+    """
+    from aidevs_text_extractor import PluginRegistry, AudioFilePlugin, ImageFilePlugin
+
+    available = {'audio': AudioFilePlugin, 'image': ImageFilePlugin}
+    for plugin in plugins:
+        print(f"Warming up {plugin} extractor...")
+        PluginRegistry.instance(available[plugin]).ensure_warm()
+
+
+def serve(socket_path: str = DEFAULT_SOCKET, plugins: Optional[List[str]] = None) -> None:
+    """
+    Runs the task runner on a Unix socket until a "stop" request arrives.
+
+    Requests:
+    - {"command": "run", "task": "s02_multimodal", "args": [], "cwd": "/path", "env": {"AIDEVS_CHUNKS": "1"}}
+    - {"command": "ping"}
+    - {"command": "stats"}: telemetry summary of model calls made in this process
+    - {"command": "stop"}
+    """
+    import aidevs_telemetry
+
+    # Tasks import siblings by module name, like when run as scripts
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    warm_up(plugins or [])
+    runner = TaskRunner()
+    server = None
+
+    def handle(request: Dict[str, Any]) -> Dict[str, Any]:
+        command = request.get('command', 'run')
+        if command == 'run':
+            return runner.run(request['task'], request.get('args'), request.get('cwd'), request.get('env'))
+        if command == 'ping':
+            return {'ok': True, 'pid': os.getpid(), 'runs': runner.runs}
+        if command == 'stats':
+            return {'ok': True, 'calls': aidevs_telemetry.summary()}
+        if command == 'stop':
+            server.stop_requested = True
+            return {'ok': True}
+        return {'ok': False, 'error': f"Unknown command: {command}"}
+
+    server = serve_unix_socket(socket_path, handle)
+    print(f"Task runner listening on {socket_path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run aidevs tasks in a persistent process")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help="Start the runner")
+    serve_parser.add_argument('--warm', nargs='*', default=[], choices=['audio', 'image'], help="Extractors to load at start")
+    run_parser = subparsers.add_parser('run', help="Run a task in the runner")
+    run_parser.add_argument('task', help="Module name exposing main, e.g. s02_multimodal")
+    run_parser.add_argument('args', nargs='*', help="Positional arguments passed to main")
+    subparsers.add_parser('ping', help="Check that the runner is alive")
+    subparsers.add_parser('stats', help="Show model call telemetry of the runner")
+    subparsers.add_parser('stop', help="Stop the runner")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.socket, args.warm)
+        return
+
+    payload = {'command': args.command}
+    if args.command == 'run':
+        payload.update(task=args.task, args=args.args, cwd=os.getcwd(), env=forwarded_env())
+    reply = unix_socket_request(args.socket, payload)
+
+    if args.command == 'run':
+        sys.stdout.write(reply.get('output', ''))
+        if not reply.get('ok'):
+            sys.stderr.write(reply.get('error') or "Task failed\n")
+            sys.exit(1)
+        print(f"[runner] {args.task} finished in {reply['duration']:.3f}s", file=sys.stderr)
+    else:
+        print(reply)
+
+
+if __name__ == "__main__":
+    main()
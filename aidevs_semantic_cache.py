@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from aidevs import get_embedding
+from aidevs_embeddings import get_embedding_model
+
+_VOLATILE_PATTERNS = [
+    # ISO timestamps and dates, times, UUIDs and long numbers (ids, epochs)
+    (re.compile(r'\d{4}[-_/]\d{2}[-_/]\d{2}([t ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(z|[+-]\d{2}:?\d{2})?)?'), '<date>'),
+    (re.compile(r'\b\d{1,2}:\d{2}(:\d{2})?\b'), '<time>'),
+    (re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b'), '<uuid>'),
+    (re.compile(r'\b\d{6,}\b'), '<number>'),
+]
+
+
+def normalize_prompt(prompt: str, mask_volatile: bool = False) -> str:
+    """
+    Normalizes prompt for semantic caching: lowercases and collapses whitespace.
+    With `mask_volatile`, also replaces timestamps, UUIDs and long numbers with placeholders;
+    use it only when those values cannot change the answer (e.g. a "today is ..." preamble),
+    never when they are the data the answer is extracted from.
+
+    Parameters:
+    - prompt (str): Prompt text
+    - mask_volatile (bool): Replace dates, times, UUIDs and long numbers
+
+    Returns:
+    - str: Normalized prompt
+    """
+    text = prompt.lower()
+    if mask_volatile:
+        for pattern, placeholder in _VOLATILE_PATTERNS:
+            text = pattern.sub(placeholder, text)
+    return " ".join(text.split())
+
+
+class _Namespace:
+    def __init__(self, path: str):
+        self.path = path
+        self.prompts: List[str] = []
+        self.answers: List[Any] = []
+        self.exact: Dict[str, int] = {}
+        self.rows: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._add(entry['prompt'], np.asarray(entry['embedding'], dtype=np.float32), entry['answer'])
+
+    def _add(self, prompt: str, vector: np.ndarray, answer: Any) -> None:
+        norm = np.linalg.norm(vector)
+        self.rows.append(vector / norm if norm else vector)
+        self._matrix = None
+        self.exact[prompt] = len(self.prompts)
+        self.prompts.append(prompt)
+        self.answers.append(answer)
+
+    def add(self, prompt: str, embedding: List[float], answer: Any) -> None:
+        self._add(prompt, np.asarray(embedding, dtype=np.float32), answer)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'prompt': prompt, 'embedding': list(map(float, embedding)), 'answer': answer}, ensure_ascii=False) + "\n")
+
+    def nearest(self, embedding: List[float]) -> tuple:
+        if not self.prompts:
+            return None, 0.0
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not norm:
+            return None, 0.0
+        if self._matrix is None:
+            self._matrix = np.vstack(self.rows)
+        scores = self._matrix @ (query / norm)
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+
+class SemanticCache:
+    """
+    Opt-in cache of model answers that also matches near-duplicate prompts.
+    Prompts are normalized and embedded; a cached answer is returned when the nearest
+    cached prompt of the same (model, system prompt) is at least `threshold` cosine-similar.
+
+    Parameters:
+    - directory (str): Where cached prompts, embeddings and answers are stored
+    - threshold (float): Minimum cosine similarity for a hit
+    - embed (Callable[[str], List[float]]): Embedding function (default: get_embedding)
+    - embedding_model (str): Registered embedding model used by the default `embed`;
+      part of the namespace, so switching models starts a separate cache
+    """
+
+    def __init__(
+        self,
+        directory: str = os.path.join("_cache_dir", "semantic"),
+        threshold: float = 0.97,
+        embed: Optional[Callable[[str], List[float]]] = None,
+        embedding_model: Optional[str] = None
+    ):
+        self.directory = directory
+        self.threshold = threshold
+        self.embedding_model = getattr(embed, '__qualname__', 'custom') if embed else get_embedding_model(embedding_model).key
+        self.embed = embed or (lambda text: get_embedding(text, self.embedding_model))
+        self.hits = 0
+        self.misses = 0
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.Lock()
+
+    def _namespace(self, model: str, system_prompt: Optional[str], mask_volatile: bool = False) -> _Namespace:
+        # Masked and exact prompts never share entries
+        parts = [self.embedding_model, model, system_prompt or ''] + (['masked'] if mask_volatile else [])
+        key = hashlib.sha256("\x00".join(parts).encode('utf-8')).hexdigest()
+        with self._lock:
+            if key not in self._namespaces:
+                self._namespaces[key] = _Namespace(os.path.join(self.directory, f"{key}.jsonl"))
+            return self._namespaces[key]
+
+    def lookup(self, prompt: str, model: str, system_prompt: Optional[str] = None, mask_volatile: bool = False) -> tuple:
+        """
+        Finds cached answer for a prompt.
+
+        Returns:
+        - tuple: (answer or None, similarity, embedding of the normalized prompt or None)
+        """
+        namespace = self._namespace(model, system_prompt, mask_volatile)
+        normalized = normalize_prompt(prompt, mask_volatile)
+        with self._lock:
+            index = namespace.exact.get(normalized)
+            if index is not None:
+                return namespace.answers[index], 1.0, None
+
+        embedding = self.embed(normalized)
+        with self._lock:
+            index, similarity = namespace.nearest(embedding)
+            if index is not None and similarity >= self.threshold:
+                return namespace.answers[index], similarity, embedding
+        return None, similarity, embedding
+
+    def store(self, prompt: str, answer: Any, model: str, system_prompt: Optional[str] = None,
+              embedding: Optional[List[float]] = None, mask_volatile: bool = False) -> None:
+        """Stores answer for a prompt"""
+        namespace = self._namespace(model, system_prompt, mask_volatile)
+        normalized = normalize_prompt(prompt, mask_volatile)
+        if embedding is None:
+            embedding = self.embed(normalized)
+        with self._lock:
+            if normalized not in namespace.exact:
+                namespace.add(normalized, embedding, answer)
+
+    def answer(
+        self,
+        prompt: str,
+        call: Callable[[], Any],
+        model: str,
+        system_prompt: Optional[str] = None,
+        mask_volatile: bool = False
+    ) -> Any:
+        """
+        Returns cached answer for a near-duplicate prompt, otherwise runs `call` and caches its result.
+        Answers starting with "Error:" are not cached.
+
+        Parameters:
+        - prompt (str): Variable part of the request used for matching
+        - call (Callable[[], Any]): Function producing the answer on a miss
+        - model (str): Model name, part of the namespace
+        - system_prompt (str): Fixed instructions, part of the namespace
+        - mask_volatile (bool): Match prompts differing only in dates, times, UUIDs and long
+          numbers (see normalize_prompt); only for prompts where those do not change the answer
+
+        Returns:
+        - Any: Answer
+        """
+        cached, similarity, embedding = self.lookup(prompt, model, system_prompt, mask_volatile)
+        with self._lock:
+            if cached is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if cached is not None:
+            return cached
+
+        result = call()
+        if not (isinstance(result, str) and result.startswith("Error:")):
+            self.store(prompt, result, model, system_prompt, embedding, mask_volatile)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters and hit rate"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'threshold': self.threshold,
+        }
+
+
+semantic_cache = SemanticCache(threshold=float(os.getenv('AIDEVS_SEMANTIC_CACHE_THRESHOLD', 0.97)))
@@ -0,0 +1,126 @@
+import contextlib
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from aidevs_telemetry import annotate
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on this platform, only in-process coalescing is available
+    fcntl = None
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the function,
+    the others wait for it and share its result (or exception).
+
+    With `lock_dir` set, the leader also holds an exclusive file lock for the key, so
+    identical calls in other processes wait for it; the function should then read its
+    result from a persistent cache (e.g. `memory.cache`) instead of calling the backend again.
+
+    Parameters:
+    - lock_dir (str): Directory for cross-process lock files, None for in-process only
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None):
+        self.lock_dir = lock_dir if fcntl else None
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _file_lock(self, key: str):
+        if not self.lock_dir:
+            yield
+            return
+        path = os.path.join(self.lock_dir, key[:2], f"{key}.lock")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Runs `fn` unless a call with the same key is already in flight.
+
+        Parameters:
+        - key (str): Identity of the call
+        - fn (Callable[[], Any]): Function to run
+
+        Returns:
+        - Any: Result of `fn`, shared by all concurrent callers
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            annotate(coalesced=True)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with self._file_lock(key):
+                call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+def call_key(func: Callable, signature: inspect.Signature, args: tuple, kwargs: dict) -> str:
+    """Builds a stable key of a function call from its bound arguments"""
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    raw = json.dumps(
+        [func.__module__, func.__qualname__, bound.arguments],
+        sort_keys=True, default=repr, ensure_ascii=False
+    )
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+single_flight = SingleFlight(
+    os.path.join("_cache_dir", "locks") if os.getenv('AIDEVS_SINGLEFLIGHT_LOCKS', '0') == '1' else None
+)
+
+
+def coalesced(func: Callable) -> Callable:
+    """
+    Decorator sharing one execution between concurrent identical calls of `func`.
+    Set AIDEVS_SINGLEFLIGHT_LOCKS=1 to coalesce across processes as well.
+    """
+    target = getattr(func, 'func', func)
+    signature = inspect.signature(target)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = call_key(target, signature, args, kwargs)
+        return single_flight.do(key, lambda: func(*args, **kwargs))
+
+    if hasattr(func, 'check_call_in_cache'):
+        wrapper.check_call_in_cache = func.check_call_in_cache
+    return wrapper
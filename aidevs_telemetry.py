@@ -0,0 +1,240 @@
+import atexit
+import collections
+import functools
+import inspect
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Records of finished calls, bounded so long-lived processes do not grow forever
+records: collections.deque = collections.deque(maxlen=int(os.getenv('AIDEVS_TELEMETRY_MAX_RECORDS', 100000)))
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def _stack() -> List[Dict[str, Any]]:
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def annotate(**fields) -> None:
+    """
+    Adds fields (token counts, durations, error) to the record of the call currently in progress.
+    Does nothing when called outside of an instrumented call.
+
+    Parameters:
+    - **fields: Fields to set on the record, e.g. prompt_tokens=12
+    """
+    stack = _stack()
+    if stack:
+        stack[-1].update(fields)
+
+
+def instrumented(name: Optional[str] = None, model: Optional[str] = None):
+    """
+    Decorator recording latency, model, cache hit/miss and errors of every call.
+    Works on plain functions and on functions wrapped with `memory.cache`.
+
+    Parameters:
+    - name (str): Name under which calls are recorded (default: function name)
+    - model (str): Model name used when the function has no `model` argument
+
+    Returns:
+    - Callable: Decorator
+    """
+    def decorator(func: Callable) -> Callable:
+        target = getattr(func, 'func', func)
+        signature = inspect.signature(target)
+        record_name = name or target.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            record = {
+                'name': record_name,
+                'model': bound.arguments.get('model', model),
+                'started_at': time.time(),
+                'cache_hit': None,
+                'error': None,
+            }
+            if hasattr(func, 'check_call_in_cache'):
+                try:
+                    record['cache_hit'] = func.check_call_in_cache(*args, **kwargs)
+                except Exception:
+                    pass
+
+            stack = _stack()
+            stack.append(record)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                record['error'] = f"{type(e).__name__}: {str(e)}"
+                raise
+            finally:
+                record['latency'] = time.perf_counter() - start
+                stack.pop()
+                with _lock:
+                    records.append(record)
+
+        if hasattr(func, 'check_call_in_cache'):
+            # Keep cache inspection of memory.cache functions available
+            wrapper.check_call_in_cache = func.check_call_in_cache
+        return wrapper
+    return decorator
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Nearest-rank percentile.
+
+    Parameters:
+    - values (List[float]): Values, not necessarily sorted
+    - q (float): Percentile between 0 and 100
+
+    Returns:
+    - float: Percentile value, 0.0 for empty input
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summary() -> Dict[str, Dict[str, Any]]:
+    """
+    Aggregates recorded calls per (name, model).
+
+    Returns:
+    - Dict[str, Dict[str, Any]]: Statistics keyed by "name[model]"
+    """
+    with _lock:
+        snapshot = list(records)
+
+    groups: Dict[tuple, List[Dict[str, Any]]] = collections.defaultdict(list)
+    for record in snapshot:
+        groups[(record['name'], record['model'])].append(record)
+
+    result = {}
+    for (name, model), group in sorted(groups.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+        latencies = [r['latency'] for r in group]
+        result[f"{name}[{model}]"] = {
+            'name': name,
+            'model': model,
+            'calls': len(group),
+            'errors': sum(1 for r in group if r['error']),
+            'cache_hits': sum(1 for r in group if r['cache_hit']),
+            'prompt_tokens': sum(r.get('prompt_tokens') or 0 for r in group),
+            'completion_tokens': sum(r.get('completion_tokens') or 0 for r in group),
+            'latency_total': sum(latencies),
+            'latency_p50': percentile(latencies, 50),
+            'latency_p90': percentile(latencies, 90),
+            'latency_p99': percentile(latencies, 99),
+        }
+    return result
+
+
+def format_summary() -> str:
+    """Returns summary as a plain text table"""
+    lines = [f"{'call':<50} {'calls':>6} {'err':>4} {'hit':>5} {'p50 s':>8} {'p90 s':>8} {'p99 s':>8} {'tok in':>8} {'tok out':>8}"]
+    for key, stats in summary().items():
+        lines.append(
+            f"{key[:50]:<50} {stats['calls']:>6} {stats['errors']:>4} {stats['cache_hits']:>5} "
+            f"{stats['latency_p50']:>8.3f} {stats['latency_p90']:>8.3f} {stats['latency_p99']:>8.3f} "
+            f"{stats['prompt_tokens']:>8} {stats['completion_tokens']:>8}"
+        )
+    return "\n".join(lines)
+
+
+def export_jsonl(path: str) -> None:
+    """
+    Appends all recorded calls to a JSONL file.
+
+    Parameters:
+    - path (str): Output file path
+    """
+    with _lock:
+        snapshot = list(records)
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in snapshot:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+def _labels(**labels) -> str:
+    escaped = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def export_prometheus(path: Optional[str] = None) -> str:
+    """
+    Renders statistics in Prometheus text exposition format.
+
+    Parameters:
+    - path (str): Optional file to write the metrics to (e.g. for node_exporter textfile collector)
+
+    Returns:
+    - str: Metrics text
+    """
+    stats = summary()
+    lines = [
+        "# HELP aidevs_calls_total Number of model calls.",
+        "# TYPE aidevs_calls_total counter",
+    ]
+    for s in stats.values():
+        lines.append(f"aidevs_calls_total{_labels(name=s['name'], model=s['model'])} {s['calls']}")
+    lines += ["# HELP aidevs_call_errors_total Number of failed model calls.", "# TYPE aidevs_call_errors_total counter"]
+    for s in stats.values():
+        lines.append(f"aidevs_call_errors_total{_labels(name=s['name'], model=s['model'])} {s['errors']}")
+    lines += ["# HELP aidevs_cache_hits_total Number of calls served from cache.", "# TYPE aidevs_cache_hits_total counter"]
+    for s in stats.values():
+        lines.append(f"aidevs_cache_hits_total{_labels(name=s['name'], model=s['model'])} {s['cache_hits']}")
+    lines += ["# HELP aidevs_tokens_total Number of tokens used.", "# TYPE aidevs_tokens_total counter"]
+    for s in stats.values():
+        lines.append(f"aidevs_tokens_total{_labels(name=s['name'], model=s['model'], type='prompt')} {s['prompt_tokens']}")
+        lines.append(f"aidevs_tokens_total{_labels(name=s['name'], model=s['model'], type='completion')} {s['completion_tokens']}")
+    lines += ["# HELP aidevs_call_latency_seconds Model call latency.", "# TYPE aidevs_call_latency_seconds summary"]
+    for s in stats.values():
+        for quantile, key in (("0.5", 'latency_p50'), ("0.9", 'latency_p90'), ("0.99", 'latency_p99')):
+            lines.append(
+                f"aidevs_call_latency_seconds{_labels(name=s['name'], model=s['model'], quantile=quantile)} {s[key]:.6f}"
+            )
+        lines.append(f"aidevs_call_latency_seconds_sum{_labels(name=s['name'], model=s['model'])} {s['latency_total']:.6f}")
+        lines.append(f"aidevs_call_latency_seconds_count{_labels(name=s['name'], model=s['model'])} {s['calls']}")
+
+    text = "\n".join(lines) + "\n"
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    return text
+
+
+def reset() -> None:
+    """Forgets all recorded calls"""
+    with _lock:
+        records.clear()
+
+
+def _report_at_exit() -> None:
+    if not records:
+        return
+    if os.getenv('AIDEVS_TELEMETRY', '0') == '1':
+        print("\nModel call telemetry:")
+        print(format_summary())
+    jsonl_path = os.getenv('AIDEVS_TELEMETRY_JSONL')
+    if jsonl_path:
+        export_jsonl(jsonl_path)
+    prometheus_path = os.getenv('AIDEVS_TELEMETRY_PROMETHEUS')
+    if prometheus_path:
+        export_prometheus(prometheus_path)
+
+
+atexit.register(_report_at_exit)
@@ -1,10 +1,228 @@
+import atexit
+import functools
+import hashlib
+import json
 import os
-from typing import List, Type
-from aidevs import transcribe_audio_file, extract_text_from_image
+import threading
+from typing import Any, Callable, Dict, List, Optional, Type
+from aidevs import transcribe_audio_file, extract_text_from_image, file_hash
+
+class ExtractionCache:
+    """
+    On-disk cache of extracted text keyed by file content hash, plugin name and plugin config.
+    When the cache grows over `max_bytes`, least recently used entries are evicted.
+    """
+    
+    def __init__(self, directory: str = os.path.join("_cache_dir", "extraction"), max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+    
+    def key(self, filepath: str, plugin: 'TextExtractorPlugin') -> str:
+        """Builds cache key for a file extracted with the given plugin"""
+        config = json.dumps(plugin.config(), sort_keys=True)
+        raw = f"{file_hash(filepath)}|{type(plugin).__name__}|{config}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.txt")
+    
+    def get(self, key: str) -> Optional[str]:
+        """Returns cached text or None"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        # Mark as recently used for eviction
+        os.utime(path)
+        return text
+    
+    def put(self, key: str, text: str) -> None:
+        """Stores text and evicts old entries if the cache is over its size limit"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, _, size in self._entries())
+            else:
+                self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._evict()
+    
+    def _entries(self) -> List[tuple]:
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.txt'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+    
+    def _evict(self) -> None:
+        entries = sorted(self._entries())
+        self._size = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+    
+    def clear(self) -> None:
+        """Removes all cached entries"""
+        with self._lock:
+            for _, path, _ in self._entries():
+                os.remove(path)
+            self._size = 0
+
+extraction_cache: Optional[ExtractionCache] = (
+    ExtractionCache(max_bytes=int(os.getenv('AIDEVS_EXTRACTION_CACHE_MAX_BYTES', 512 * 1024 * 1024)))
+    if os.getenv('AIDEVS_EXTRACTION_CACHE', '1') != '0' else None
+)
+
+def _cached_extract(extract: Callable[[Any, str], str]) -> Callable[[Any, str], str]:
+    """Wraps plugin extract method with warm-up and extraction cache lookup"""
+    @functools.wraps(extract)
+    def wrapper(self, filepath: str) -> str:
+        if not self.cacheable or extraction_cache is None:
+            self.ensure_warm()
+            return extract(self, filepath)
+        
+        key = extraction_cache.key(filepath, self)
+        text = extraction_cache.get(key)
+        if text is None:
+            self.ensure_warm()
+            text = extract(self, filepath)
+            extraction_cache.put(key, text)
+        return text
+    return wrapper
+
+class PluginRegistry:
+    """
+    Extension to plugin index built once from TextExtractorPlugin subclasses.
+    Plugin instances are created once and reused for all files; they are warmed up
+    on the first extraction that is not served from the extraction cache.
+    """
+    _extension_map: Optional[Dict[str, Type['TextExtractorPlugin']]] = None
+    _instances: Dict[Type['TextExtractorPlugin'], 'TextExtractorPlugin'] = {}
+    _lock = threading.RLock()
+    
+    @classmethod
+    def invalidate(cls) -> None:
+        """Drop the extension index, it is rebuilt on next lookup"""
+        cls._extension_map = None
+    
+    @classmethod
+    def _get_all_plugins(cls) -> List[Type['TextExtractorPlugin']]:
+        """Use reflection to get all TextExtractorPlugin subclasses"""
+        def get_all_subclasses(base_class):
+            all_subclasses = []
+            for subclass in base_class.__subclasses__():
+                all_subclasses.append(subclass)
+                all_subclasses.extend(get_all_subclasses(subclass))
+            return all_subclasses
+            
+        return get_all_subclasses(TextExtractorPlugin)
+    
+    @classmethod
+    def extension_map(cls) -> Dict[str, Type['TextExtractorPlugin']]:
+        """Returns mapping of lowercase extensions to plugin classes"""
+        extension_map = cls._extension_map
+        if extension_map is None:
+            with cls._lock:
+                extension_map = {}
+                for plugin_class in cls._get_all_plugins():
+                    for ext in plugin_class.supported_extensions:
+                        # First registered plugin wins, same as linear probing did
+                        extension_map.setdefault(ext.lower(), plugin_class)
+                cls._extension_map = extension_map
+        return extension_map
+    
+    @classmethod
+    def plugin_class(cls, extension: str) -> Type['TextExtractorPlugin']:
+        """
+        Finds plugin class for a file extension
+        
+        Raises:
+        - ValueError: If file type is not supported
+        """
+        plugin_class = cls.extension_map().get(extension.lower())
+        if plugin_class is None:
+            raise ValueError(f"No plugin found for file type: {extension}")
+        return plugin_class
+    
+    @classmethod
+    def instance(cls, plugin_class: Type['TextExtractorPlugin']) -> 'TextExtractorPlugin':
+        """Returns shared instance of the plugin class"""
+        plugin = cls._instances.get(plugin_class)
+        if plugin is None:
+            with cls._lock:
+                plugin = cls._instances.get(plugin_class)
+                if plugin is None:
+                    plugin = plugin_class()
+                    cls._instances[plugin_class] = plugin
+        return plugin
+    
+    @classmethod
+    def teardown_all(cls) -> None:
+        """Tear down and forget all plugin instances"""
+        with cls._lock:
+            for plugin in cls._instances.values():
+                if plugin._warm:
+                    plugin.teardown()
+                    plugin._warm = False
+            cls._instances.clear()
+
+atexit.register(PluginRegistry.teardown_all)
 
 class TextExtractorPlugin:
     """Base class for text extraction plugins"""
     supported_extensions: List[str] = []
+    # Whether extracted text is stored in the extraction cache
+    cacheable: bool = True
+    _warm: bool = False
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # New plugin may handle extensions already mapped, rebuild the index on next lookup
+        PluginRegistry.invalidate()
+        if 'extract' in cls.__dict__:
+            cls.extract = _cached_extract(cls.__dict__['extract'])
+    
+    def config(self) -> Dict[str, Any]:
+        """Plugin settings that change extracted text, part of the extraction cache key"""
+        return {}
+    
+    def ensure_warm(self) -> None:
+        """Calls warm_up once per instance"""
+        if not self._warm:
+            with PluginRegistry._lock:
+                if not self._warm:
+                    self.warm_up()
+                    self._warm = True
+    
+    def warm_up(self) -> None:
+        """Load models or other state once, before the first file is extracted"""
+        pass
+    
+    def teardown(self) -> None:
+        """Release models or other state held by the plugin"""
+        pass
     
     def extract(self, filepath: str) -> str:
         raise NotImplementedError("Each plugin must implement extract method")
@@ -16,6 +234,8 @@ class TextExtractorPlugin:
 
 class TextFilePlugin(TextExtractorPlugin):
     supported_extensions = ['.txt']
+    # Reading the file is cheaper than hashing it for a cache lookup
+    cacheable = False
     
     def extract(self, filepath: str) -> str:
         with open(filepath, 'r', encoding='utf-8') as f:
@@ -23,15 +243,43 @@ class TextFilePlugin(TextExtractorPlugin):
 
 class AudioFilePlugin(TextExtractorPlugin):
     supported_extensions = ['.mp3', '.wav', '.m4a']
+    model_name = "turbo"
+    language = "pl"
+    
+    def __init__(self):
+        self.whisper_model = None
+    
+    def warm_up(self) -> None:
+        if os.getenv('AIDEVS_MODEL_SERVER'):
+            # Model is held by the shared model server, see aidevs_model_server.py
+            return
+        import whisper
+        self.whisper_model = whisper.load_model(self.model_name)
+    
+    def teardown(self) -> None:
+        self.whisper_model = None
+    
+    def config(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "language": self.language}
     
     def extract(self, filepath: str) -> str:
-        return transcribe_audio_file(filepath, model_name="turbo", language="pl")
+        return transcribe_audio_file(
+            filepath,
+            model_name=self.model_name,
+            language=self.language,
+            whisper_model=self.whisper_model
+        )
 
 class ImageFilePlugin(TextExtractorPlugin):
     supported_extensions = ['.png', '.jpg', '.jpeg']
+    method = "tesseract"
+    language = "pol+eng"
+    
+    def config(self) -> Dict[str, Any]:
+        return {"method": self.method, "language": self.language}
     
     def extract(self, filepath: str) -> str:
-        return extract_text_from_image(filepath, method="tesseract", language="pol+eng")
+        return extract_text_from_image(filepath, method=self.method, language=self.language)
 
 class TextExtractor:
     """Factory class that creates appropriate extractor based on file type"""
@@ -39,14 +287,7 @@ class TextExtractor:
     @classmethod
     def _get_all_plugins(cls) -> List[Type[TextExtractorPlugin]]:
         """Use reflection to get all TextExtractorPlugin subclasses"""
-        def get_all_subclasses(base_class):
-            all_subclasses = []
-            for subclass in base_class.__subclasses__():
-                all_subclasses.append(subclass)
-                all_subclasses.extend(get_all_subclasses(subclass))
-            return all_subclasses
-            
-        return get_all_subclasses(TextExtractorPlugin)
+        return PluginRegistry._get_all_plugins()
 
     @classmethod
     def create(cls, filepath: str) -> TextExtractorPlugin:
@@ -57,19 +298,50 @@ class TextExtractor:
         - filepath (str): Path to the file to be processed
         
         Returns:
-        - TextExtractorPlugin: Appropriate plugin instance for the file type
+        - TextExtractorPlugin: Shared plugin instance for the file type
         
         Raises:
         - ValueError: If file type is not supported
         """
         ext = os.path.splitext(filepath)[1].lower()
+        return PluginRegistry.instance(PluginRegistry.plugin_class(ext))
+
+    @classmethod
+    def extract_many(cls, filepaths: List[str], skip_unsupported: bool = False) -> Dict[str, str]:
+        """
+        Extracts text from many files, grouped by plugin so each plugin is looked up
+        and warmed up once per group
+        
+        Parameters:
+        - filepaths (List[str]): Paths to the files to be processed
+        - skip_unsupported (bool): Skip files without a plugin instead of raising
+        
+        Returns:
+        - Dict[str, str]: Mapping of file path to extracted text, in input order
+        
+        Raises:
+        - ValueError: If file type is not supported and skip_unsupported is False
+        
+        Files already in the extraction cache are returned without warming up their plugin.
+        """
+        groups: Dict[Type[TextExtractorPlugin], List[str]] = {}
+        for filepath in filepaths:
+            ext = os.path.splitext(filepath)[1].lower()
+            try:
+                plugin_class = PluginRegistry.plugin_class(ext)
+            except ValueError:
+                if skip_unsupported:
+                    continue
+                raise
+            groups.setdefault(plugin_class, []).append(filepath)
+        
+        extracted = {}
+        for plugin_class, group in groups.items():
+            plugin = PluginRegistry.instance(plugin_class)
+            for filepath in group:
+                extracted[filepath] = plugin.extract(filepath)
         
-        # Find plugin that can handle this extension
-        for plugin_class in cls._get_all_plugins():
-            if plugin_class.can_handle(ext):
-                return plugin_class()
-                
-        raise ValueError(f"No plugin found for file type: {ext}")
+        return {filepath: extracted[filepath] for filepath in filepaths if filepath in extracted}
 
     @classmethod
     def get_supported_extensions(cls) -> List[str]:
@@ -77,4 +349,4 @@ class TextExtractor:
         extensions = []
         for plugin in cls._get_all_plugins():
             extensions.extend(plugin.supported_extensions)
-        return sorted(extensions) 
\ No newline at end of file
+        return sorted(extensions)
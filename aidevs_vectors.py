@@ -0,0 +1,481 @@
+import fnmatch
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+QUANTIZATIONS = ('int8', 'binary', 'none')
+
+# Number of set bits of every byte value, for Hamming distance of packed binary codes
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+# Rows decoded or compared at a time, bounds the temporary memory of scans and encoding
+BLOCK_ROWS = 16384
+
+
+def _blocks(rows: int):
+    for start in range(0, rows, BLOCK_ROWS):
+        yield slice(start, min(start + BLOCK_ROWS, rows))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scales rows to unit length, so dot product equals cosine similarity"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class Int8Quantizer:
+    """
+    Scalar quantization of each dimension to 256 levels between its min and max (4x smaller than float32).
+    Scores are computed on the codes without decoding them.
+    """
+
+    def __init__(self, offset: np.ndarray, scale: np.ndarray):
+        self.offset = offset.astype(np.float32)
+        self.scale = scale.astype(np.float32)
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray) -> 'Int8Quantizer':
+        low, high = vectors.min(axis=0), vectors.max(axis=0)
+        # Constant dimensions get a tiny step, so any other value falls outside the range and triggers a refit
+        return cls(low, np.where(high > low, (high - low) / 255, np.finfo(np.float32).eps))
+
+    def covers(self, vectors: np.ndarray) -> bool:
+        """Whether vectors lie within the fitted range, i.e. encode without clipping"""
+        levels = (vectors - self.offset) / self.scale
+        return bool(np.all(levels >= -0.5) and np.all(levels <= 255.5))
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty(vectors.shape, dtype=np.uint8)
+        for block in _blocks(len(vectors)):
+            codes[block] = np.clip(np.rint((vectors[block] - self.offset) / self.scale), 0, 255)
+        return codes
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # query . (offset + codes * scale) = query . offset + codes . (query * scale)
+        weights = query * self.scale
+        scores = np.empty(len(codes), dtype=np.float32)
+        for block in _blocks(len(codes)):
+            scores[block] = codes[block].astype(np.float32) @ weights
+        return scores + float(query @ self.offset)
+
+
+def binary_encode(vectors: np.ndarray) -> np.ndarray:
+    """Keeps only the sign of each dimension, packed 8 per byte (32x smaller than float32)"""
+    return np.packbits(vectors > 0, axis=-1)
+
+
+def binary_scores(codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Negative Hamming distance between codes and the binarized query, higher is more similar"""
+    query_code = binary_encode(query)
+    scores = np.empty(len(codes), dtype=np.int32)
+    for block in _blocks(len(codes)):
+        scores[block] = -_POPCOUNT[np.bitwise_xor(codes[block], query_code)].sum(axis=-1, dtype=np.int32)
+    return scores
+
+
+def project_payload(payload: Dict[str, Any], with_payload: Union[bool, List[str]]) -> Dict[str, Any]:
+    """Returns whole payload, empty payload, or only the listed fields"""
+    if with_payload is True:
+        return payload
+    if not with_payload:
+        return {}
+    return {field: payload[field] for field in with_payload if field in payload}
+
+
+class PayloadFilter:
+    """
+    Conditions on payload fields, a point matches when all of them hold.
+
+    Parameters:
+    - match (Dict[str, Any]): Exact field values, e.g. {"weapon_name": "karabin plazmowy"}
+    - ranges (Dict[str, tuple]): Inclusive (low, high) bounds, either may be None; ISO date strings
+      compare chronologically
+    - patterns (Dict[str, str]): Glob patterns, e.g. {"filename": "2024_01_*"}
+    """
+
+    def __init__(self, match: Optional[Dict[str, Any]] = None, ranges: Optional[Dict[str, tuple]] = None,
+                 patterns: Optional[Dict[str, str]] = None):
+        self.match = match or {}
+        self.ranges = ranges or {}
+        self.patterns = patterns or {}
+
+    def __bool__(self):
+        return bool(self.match or self.ranges or self.patterns)
+
+    def matches(self, payload: Dict[str, Any]) -> bool:
+        for field, value in self.match.items():
+            if payload.get(field) != value:
+                return False
+        for field, (low, high) in self.ranges.items():
+            value = payload.get(field)
+            if value is None or (low is not None and value < low) or (high is not None and value > high):
+                return False
+        for field, pattern in self.patterns.items():
+            if not fnmatch.fnmatchcase(str(payload.get(field, "")), pattern):
+                return False
+        return True
+
+    def to_qdrant(self):
+        """
+        Returns Qdrant filter of exact and range conditions. Qdrant has no glob matching,
+        results of filters with patterns still have to be checked with `matches`.
+        """
+        from qdrant_client.http import models
+
+        conditions = [
+            models.FieldCondition(key=field, match=models.MatchValue(value=value))
+            for field, value in self.match.items()
+        ]
+        for field, (low, high) in self.ranges.items():
+            if isinstance(low or high, str):
+                conditions.append(models.FieldCondition(key=field, range=models.DatetimeRange(gte=low, lte=high)))
+            else:
+                conditions.append(models.FieldCondition(key=field, range=models.Range(gte=low, lte=high)))
+        return models.Filter(must=conditions) if conditions else None
+
+
+class Hit:
+    """Search result with the same attributes as Qdrant's ScoredPoint"""
+
+    def __init__(self, id: Any, score: float, payload: Dict[str, Any]):
+        self.id = id
+        self.score = score
+        self.payload = payload
+
+    def __repr__(self):
+        return f"Hit(id={self.id!r}, score={self.score:.4f})"
+
+
+class LocalVectorIndex:
+    """
+    On-disk vector index with two-stage search: compact int8 or binary codes kept in memory
+    are scanned first, then the best `limit * rescore_multiplier` candidates are rescored with
+    full-precision vectors read from a memory-mapped file.
+
+    Parameters:
+    - directory (str): Where vectors, codes and payloads are stored
+    - quantization (str): "int8", "binary" or "none" (exact search on the memory-mapped vectors)
+    - rescore_multiplier (int): Candidates rescored per requested result (default: 4 for int8,
+      16 for binary codes, which lose more ranking information)
+    """
+
+    def __init__(self, directory: str, quantization: str = 'int8', rescore_multiplier: Optional[int] = None):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        self.directory = directory
+        self.quantization = quantization
+        self.rescore_multiplier = rescore_multiplier or (16 if quantization == 'binary' else 4)
+        self.ids: List[Any] = []
+        self.payloads: List[Dict[str, Any]] = []
+        self.dimensions: Optional[int] = None
+        self.codes: Optional[np.ndarray] = None
+        self.quantizer: Optional[Int8Quantizer] = None
+        self._positions: Dict[Any, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        # Positions of rows added or replaced since codes were last updated
+        self._dirty: set = set()
+        # Positions whose ID and payload are not yet in points.jsonl, and lines that file holds
+        self._unsaved: set = set()
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        if os.path.exists(self._path('meta.json')):
+            self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self) -> None:
+        with open(self._path('meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.dimensions = meta['dimensions']
+        if 'ids' in meta:
+            # Older indexes kept all payloads in meta.json, the next save moves them to the log
+            self.ids, self.payloads = meta['ids'], meta['payloads']
+            self._unsaved = set(range(len(self.ids)))
+        else:
+            self.ids, self.payloads = [None] * meta['count'], [None] * meta['count']
+            with open(self._path('points.jsonl'), 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._log_lines += 1
+                    point = json.loads(line)
+                    # Lines past `count` were appended by a save that did not finish
+                    if point['position'] < meta['count']:
+                        self.ids[point['position']], self.payloads[point['position']] = point['id'], point['payload']
+        self._positions = {point_id: i for i, point_id in enumerate(self.ids)}
+        self._open_vectors()
+        if meta['quantization'] != self.quantization or not os.path.exists(self._path('codes.npz')):
+            self._rebuild_codes()
+            return
+        stored = np.load(self._path('codes.npz'))
+        self.codes = stored['codes']
+        if self.quantization == 'int8':
+            self.quantizer = Int8Quantizer(stored['offset'], stored['scale'])
+
+    def _open_vectors(self) -> None:
+        self._vectors = np.memmap(self._path('vectors.f32'), dtype=np.float32, mode='r+', shape=(len(self.ids), self.dimensions)) \
+            if self.ids else None
+
+    def _rebuild_codes(self) -> None:
+        self._dirty = set()
+        if self._vectors is None or self.quantization == 'none':
+            self.codes = None
+            return
+        if self.quantization == 'int8':
+            self.quantizer = Int8Quantizer.fit(self._vectors)
+            self.codes = self.quantizer.encode(self._vectors)
+        else:
+            self.codes = np.concatenate([binary_encode(self._vectors[block]) for block in _blocks(len(self.ids))])
+
+    def _update_codes(self) -> None:
+        """
+        Encodes only rows added or replaced since the last update. Int8 codes of all rows are
+        refitted when a changed row falls outside the quantizer's range.
+        """
+        if self._vectors is None or self.quantization == 'none' or self.codes is None:
+            self._rebuild_codes()
+            return
+        if not self._dirty:
+            return
+        positions = np.array(sorted(self._dirty), dtype=np.int64)
+        rows = self._vectors[positions]
+        if self.quantization == 'int8':
+            if not self.quantizer.covers(rows):
+                self._rebuild_codes()
+                return
+            encoded = self.quantizer.encode(rows)
+        else:
+            encoded = binary_encode(rows)
+        if len(self.codes) < len(self.ids):
+            grown = np.empty((len(self.ids), self.codes.shape[1]), dtype=np.uint8)
+            grown[:len(self.codes)] = self.codes
+            self.codes = grown
+        self.codes[positions] = encoded
+        self._dirty = set()
+
+    def upsert(self, ids: List[Any], vectors: List[List[float]], payloads: List[Dict[str, Any]], commit: bool = True) -> None:
+        """
+        Adds or replaces points and encodes them.
+
+        Parameters:
+        - ids (List[Any]): Point IDs (int or str); when an ID repeats, its last vector and payload win
+        - vectors (List[List[float]]): Vectors, normalized on insert
+        - payloads (List[Dict[str, Any]]): Point payloads
+        - commit (bool): Update codes and save metadata; when adding many batches pass False
+          and call `commit()` once at the end
+        """
+        if not ids:
+            return
+        vectors = normalize(vectors)
+        with self._lock:
+            if self.dimensions is None:
+                self.dimensions = vectors.shape[1]
+            elif vectors.shape[1] != self.dimensions:
+                raise ValueError(f"Vector size {vectors.shape[1]} does not match index size {self.dimensions}")
+
+            os.makedirs(self.directory, exist_ok=True)
+            new_rows = []
+            # Last occurrence of each ID in the batch
+            latest = {point_id: i for i, point_id in enumerate(ids)}
+            for point_id, i in latest.items():
+                position = self._positions.get(point_id)
+                if position is None:
+                    position = self._positions[point_id] = len(self.ids)
+                    self.ids.append(point_id)
+                    self.payloads.append(payloads[i])
+                    new_rows.append(vectors[i])
+                else:
+                    self._vectors[position] = vectors[i]
+                    self.payloads[position] = payloads[i]
+                self._dirty.add(position)
+                self._unsaved.add(position)
+
+            if self._vectors is not None:
+                self._vectors.flush()
+            if new_rows:
+                with open(self._path('vectors.f32'), 'ab') as f:
+                    f.write(np.asarray(new_rows, dtype=np.float32).tobytes())
+                self._open_vectors()
+            if commit:
+                self._update_codes()
+                self._save()
+
+    def commit(self) -> None:
+        """Encodes points added since the last commit and saves the index"""
+        with self._lock:
+            self._update_codes()
+            self._save()
+
+    def _save(self) -> None:
+        # IDs and payloads are appended to points.jsonl, so a commit writes only the points it
+        # changed; the log is rewritten once replaced points make up half of it
+        if self._log_lines + len(self._unsaved) > 2 * len(self.ids):
+            with open(self._path('points.jsonl.tmp'), 'w', encoding='utf-8') as f:
+                self._write_points(f, range(len(self.ids)))
+            os.replace(self._path('points.jsonl.tmp'), self._path('points.jsonl'))
+            self._log_lines = len(self.ids)
+        else:
+            with open(self._path('points.jsonl'), 'a', encoding='utf-8') as f:
+                self._write_points(f, sorted(self._unsaved))
+            self._log_lines += len(self._unsaved)
+        self._unsaved = set()
+        # Written last, points of an interrupted save stay beyond `count`
+        with open(self._path('meta.json.tmp'), 'w', encoding='utf-8') as f:
+            json.dump({'count': len(self.ids), 'dimensions': self.dimensions, 'quantization': self.quantization}, f)
+        os.replace(self._path('meta.json.tmp'), self._path('meta.json'))
+        if self.codes is not None:
+            arrays = {'codes': self.codes}
+            if self.quantizer is not None:
+                arrays.update(offset=self.quantizer.offset, scale=self.quantizer.scale)
+            with open(self._path('codes.npz.tmp'), 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(self._path('codes.npz.tmp'), self._path('codes.npz'))
+
+    def _write_points(self, f, positions) -> None:
+        for position in positions:
+            f.write(json.dumps({'position': position, 'id': self.ids[position], 'payload': self.payloads[position]},
+                               ensure_ascii=False) + "\n")
+
+    def search(self, query: List[float], limit: int = 5, with_payload: Union[bool, List[str]] = True,
+               query_filter: Optional[PayloadFilter] = None) -> List[Hit]:
+        """
+        Finds points most similar to `query` by cosine similarity.
+
+        Parameters:
+        - query (List[float]): Query vector
+        - limit (int): Number of results
+        - with_payload (bool | List[str]): Whole payload, none, or only the listed fields
+        - query_filter (PayloadFilter): Only points whose payload matches are scanned
+
+        Returns:
+        - List[Hit]: Results with exact (rescored) scores, best first
+        """
+        with self._lock:
+            if not self.ids:
+                return []
+            query = normalize(query)
+            if query_filter:
+                # Pre-filter on payload, the vector scan only touches matching points
+                candidates = np.array([i for i, payload in enumerate(self.payloads) if query_filter.matches(payload)], dtype=np.int64)
+                if not len(candidates):
+                    return []
+            else:
+                candidates = np.arange(len(self.ids))
+            if self.codes is not None:
+                codes = self.codes[candidates] if query_filter else self.codes
+                approximate = self.quantizer.scores(codes, query) if self.quantizer else binary_scores(codes, query)
+                count = min(len(candidates), limit * self.rescore_multiplier)
+                candidates = candidates[np.argpartition(-approximate, count - 1)[:count]]
+            # Sorted positions keep memmap reads sequential
+            candidates = np.sort(candidates)
+            exact = self._vectors[candidates] @ query
+            order = np.argsort(-exact)[:limit]
+            return [
+                Hit(self.ids[candidates[i]], float(exact[i]), project_payload(self.payloads[candidates[i]], with_payload))
+                for i in order
+            ]
+
+    def retrieve(self, ids: List[Any], with_payload: Union[bool, List[str]] = True) -> List[Hit]:
+        """Returns stored points by ID (score 0), unknown IDs are skipped"""
+        with self._lock:
+            return [
+                Hit(point_id, 0.0, project_payload(self.payloads[self._positions[point_id]], with_payload))
+                for point_id in ids if point_id in self._positions
+            ]
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Bytes of codes kept in memory versus full-precision vectors kept on disk"""
+        return {
+            'codes': int(self.codes.nbytes) if self.codes is not None else 0,
+            'vectors': len(self.ids) * (self.dimensions or 0) * 4,
+        }
+
+
+_local_indexes: Dict[tuple, LocalVectorIndex] = {}
+
+
+def get_local_index(collection_name: str, quantization: str = 'int8') -> LocalVectorIndex:
+    """
+    Returns a shared local index stored in _cache_dir/vectors/<collection_name>.
+
+    Parameters:
+    - collection_name (str): Name of the collection
+    - quantization (str): "int8", "binary" or "none"
+    """
+    key = (collection_name, quantization)
+    if key not in _local_indexes:
+        _local_indexes[key] = LocalVectorIndex(os.path.join("_cache_dir", "vectors", collection_name), quantization)
+    return _local_indexes[key]
+
+
+class ContentStore:
+    """
+    Document texts stored as files keyed by point ID, so vector payloads can stay small
+    and texts are read only for the hits that need them.
+
+    Parameters:
+    - directory (str): Where texts are stored
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, point_id: Any) -> str:
+        key = hashlib.sha256(json.dumps(point_id).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key[:2], f"{key}.txt")
+
+    def put(self, point_id: Any, content: str) -> None:
+        path = self._path(point_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(f"{path}.tmp", path)
+
+    def get_many(self, ids: List[Any]) -> Dict[Any, str]:
+        """Returns texts of the given points, unknown IDs are skipped"""
+        contents = {}
+        for point_id in ids:
+            path = self._path(point_id)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    contents[point_id] = f.read()
+        return contents
+
+
+def get_content_store(collection_name: str) -> ContentStore:
+    """Returns content store in _cache_dir/content/<collection_name>"""
+    return ContentStore(os.path.join("_cache_dir", "content", collection_name))
+
+
+def qdrant_quantization_config(quantization: str):
+    """
+    Returns Qdrant quantization config for a collection, None for "none".
+    Quantized vectors stay in RAM, originals can live on disk and are used for rescoring.
+    """
+    from qdrant_client.http import models
+
+    if quantization == 'int8':
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if quantization == 'binary':
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+def qdrant_search_params(quantization: str, oversampling: float = 4.0):
+    """Returns Qdrant search params that rescore oversampled quantized candidates, None for "none" """
+    from qdrant_client.http import models
+
+    if quantization == 'none':
+        return None
+    return models.SearchParams(
+        quantization=models.QuantizationSearchParams(ignore=False, rescore=True, oversampling=oversampling)
+    )
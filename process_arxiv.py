@@ -25,8 +25,16 @@ def download_file(url: str, temp_dir: str) -> Optional[str]:
         print(f"Error downloading {url}: {e}")
         return None
 
-def process_media_element(element, base_url: str, temp_dir: str) -> str:
+def download_file_once(url: str, temp_dir: str, downloads: dict) -> Optional[str]:
+    """Downloads a file unless the same URL was already downloaded in this run"""
+    if url not in downloads:
+        downloads[url] = download_file(url, temp_dir)
+    return downloads[url]
+
+def process_media_element(element, base_url: str, temp_dir: str, downloads: Optional[dict] = None) -> str:
     """Process audio or image element and return extracted text"""
+    if downloads is None:
+        downloads = {}
     
     # Get surrounding paragraph if exists
     surrounding_p = element.find_parent('p')
@@ -38,7 +46,7 @@ def process_media_element(element, base_url: str, temp_dir: str) -> str:
             return "[Audio file not found]"
             
         full_url = urljoin(base_url, src)
-        audio_path = download_file(full_url, temp_dir)
+        audio_path = download_file_once(full_url, temp_dir, downloads)
         if not audio_path:
             return "[Failed to download audio]"
             
@@ -55,7 +63,7 @@ def process_media_element(element, base_url: str, temp_dir: str) -> str:
             return "[Image not found]"
             
         full_url = urljoin(base_url, src)
-        img_path = download_file(full_url, temp_dir)
+        img_path = download_file_once(full_url, temp_dir, downloads)
         if not img_path:
             return "[Failed to download image]"
             
@@ -67,7 +75,9 @@ def process_media_element(element, base_url: str, temp_dir: str) -> str:
                 image_filenames=[img_path],
                 model="gpt-4o",
                 system_prompt="Provide a detailed (try name things, especially recognized Named Entities and objects) description of the image that would be meaningful mentioned context.",
-                max_tokens=300
+                max_tokens=300,
+                max_edge=1024,
+                image_format="jpeg"
             )
             return f"[Image Description: {description}]"
         except Exception as e:
@@ -82,10 +92,15 @@ def html_to_markdown(html_content: str, base_url: str) -> str:
     with tempfile.TemporaryDirectory() as temp_dir:
         soup = BeautifulSoup(html_content, 'html.parser')
         
-        # Process all media elements
+        # Process all media elements; the same media with the same context is processed once
+        downloads = {}
+        replacements = {}
         for element in soup.find_all(['audio', 'img']):
-            replacement_text = process_media_element(element, base_url, temp_dir)
-            element.replace_with(replacement_text)
+            surrounding_p = element.find_parent('p')
+            key = (element.name, element.get('src'), surrounding_p.get_text(strip=True) if surrounding_p else "")
+            if key not in replacements:
+                replacements[key] = process_media_element(element, base_url, temp_dir, downloads)
+            element.replace_with(replacements[key])
         
         # Basic HTML to Markdown conversion
         markdown = ""
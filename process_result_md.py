@@ -1,5 +1,30 @@
 import os
-from aidevs import answer_question_openai, send_task, fetch_text
+import re
+import json
+from aidevs import (
+    answer_question_openai,
+    send_task,
+    fetch_text,
+    get_embedding,
+    estimate_tokens,
+    cosine_similarity,
+    bounded_map
+)
+
+# Send each question only the most relevant chunks instead of the whole document
+USE_RETRIEVAL = os.getenv('AIDEVS_RETRIEVAL', '0') == '1'
+# Answer all questions in one call sharing one context
+SINGLE_CALL = os.getenv('AIDEVS_SINGLE_CALL', '0') == '1'
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*)$")
+# Consecutive headings without text between them are a table of contents, not sections
+TOC_MIN_HEADINGS = 3
+
+ANSWER_INSTRUCTIONS = """Na podstawie podanego kontekstu, najpierw podaj wszystkie istotne dla danego pytania informacje, 
+    a następnie odpowiedz na pytanie. Odpowiedź na pytanie nie może być pełnym zdaniem, tylko krótka i związana z pytaniem.
+    Możesz się domyślać niektórych faktów na podstawie metadanych dokumentu, np. lokalizacji, dat etc. Zwróć uwagę o co jesteś pytany.
+    Fotografie zapewne zostały wykonane w mieście autora.
+    """
 
 def read_markdown_file(filename: str = "result.md") -> str:
     """Read and return contents of the markdown file"""
@@ -35,21 +60,186 @@ def fetch_questions() -> dict:
     except Exception as e:
         raise Exception(f"Error fetching questions: {str(e)}")
 
-def process_questions(questions: dict, context: str) -> dict:
-    """Process each question using OpenAI with the markdown context"""
-    system_prompt = f"""Oto cały kontekst:
+def chunk_markdown(markdown: str, max_chunk_tokens: int = 400) -> list[dict]:
+    """
+    Splits markdown into sections by headings. Sections longer than `max_chunk_tokens`
+    are further split on paragraph boundaries. A run of headings without text between
+    them (a table of contents, as in result.md) becomes one chunk of its own and does
+    not title the text that follows it.
+    
+    Parameters:
+    - markdown (str): Markdown document
+    - max_chunk_tokens (int): Maximum estimated tokens per chunk
+    
+    Returns:
+    - list[dict]: Chunks with "title" (heading path) and "text"
+    """
+    sections = []
+    headings = []
+    paragraphs = []
+    # Headings seen since the last text, as (level, title)
+    empty_headings = []
+    
+    def flush():
+        if paragraphs:
+            sections.append((" > ".join(headings), list(paragraphs)))
+            paragraphs.clear()
+    
+    def close_toc():
+        if len(empty_headings) >= TOC_MIN_HEADINGS:
+            # Keep only the headings above the listed ones, e.g. the document title
+            toc_level = empty_headings[-1][0]
+            del headings[toc_level - 1:]
+            sections.append((" > ".join(headings), ["\n".join(title for level, title in empty_headings if level >= toc_level)]))
+        empty_headings.clear()
+    
+    def add_text(text: str):
+        close_toc()
+        paragraphs.append(text)
+    
+    for block in re.split(r"\n\s*\n", markdown):
+        lines = []
+        for line in block.strip().splitlines():
+            heading = HEADING_PATTERN.match(line.strip())
+            if not heading:
+                lines.append(line)
+                continue
+            # A heading may start a block or follow text without a blank line
+            if "\n".join(lines).strip():
+                add_text("\n".join(lines).strip())
+            lines = []
+            flush()
+            level, title = len(heading.group(1)), heading.group(2).strip()
+            headings[level - 1:] = [title]
+            empty_headings.append((level, title))
+        if "\n".join(lines).strip():
+            add_text("\n".join(lines).strip())
+    flush()
+    close_toc()
+    
+    chunks = []
+    for title, section_paragraphs in sections:
+        current = []
+        for paragraph in section_paragraphs:
+            if current and estimate_tokens("\n\n".join(current + [paragraph])) > max_chunk_tokens:
+                chunks.append({"title": title, "text": "\n\n".join(current)})
+                current = []
+            current.append(paragraph)
+        if current:
+            chunks.append({"title": title, "text": "\n\n".join(current)})
+    return chunks
+
+def embed_chunks(chunks: list[dict], max_workers: int = 8) -> list[list[float]]:
+    """Embed chunks concurrently; embeddings are cached by get_embedding"""
+    return list(bounded_map(lambda chunk: get_embedding(f"{chunk['title']}\n{chunk['text']}"), chunks, max_workers=max_workers))
+
+def rank_chunks(question: str, chunks: list[dict], embeddings: list[list[float]]) -> list[int]:
+    """Return chunk indices ordered by similarity to the question"""
+    query_embedding = get_embedding(question)
+    scores = [cosine_similarity(query_embedding, embedding) for embedding in embeddings]
+    return sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+
+def pack_context(chunks: list[dict], ranked: list[int], top_k: int, token_budget: int) -> str:
+    """
+    Pack the best ranked chunks into a context string.
+    
+    Parameters:
+    - chunks (list[dict]): All chunks
+    - ranked (list[int]): Chunk indices ordered by relevance
+    - top_k (int): Maximum number of chunks
+    - token_budget (int): Maximum estimated tokens of the packed context
+    
+    Returns:
+    - str: Selected chunks in document order
+    """
+    selected = []
+    used_tokens = 0
+    for i in ranked[:top_k]:
+        chunk_tokens = estimate_tokens(chunks[i]["text"])
+        if selected and used_tokens + chunk_tokens > token_budget:
+            continue
+        selected.append(i)
+        used_tokens += chunk_tokens
+    
+    return "\n\n".join(
+        f"## {chunks[i]['title']}\n{chunks[i]['text']}" if chunks[i]["title"] else chunks[i]["text"]
+        for i in sorted(selected)
+    )
+
+def build_system_prompt(context: str) -> str:
+    """Build system prompt with the given context"""
+    return f"""Oto cały kontekst:
     {context} 
-    Na podstawie podanego kontekstu, najpierw podaj wszystkie istotne dla danego pytania informacje, 
-    a następnie odpowiedz na pytanie. Odpowiedź na pytanie nie może być pełnym zdaniem, tylko krótka i związana z pytaniem.
-    Możesz się domyślać niektórych faktów na podstawie metadanych dokumentu, np. lokalizacji, dat etc. Zwróć uwagę o co jesteś pytany.
-    Fotografie zapewne zostały wykonane w mieście autora.
+    {ANSWER_INSTRUCTIONS}"""
+
+def answer_all_at_once(questions: dict, context: str) -> dict:
+    """Answer all questions in a single call sharing one context"""
+    question_list = "\n".join(f"{qid}={question}" for qid, question in questions.items())
+    response = answer_question_openai(
+        question=f"""Odpowiedz na wszystkie pytania. Zwróć wyłącznie obiekt JSON, w którym kluczem jest identyfikator pytania,
+    a wartością krótka odpowiedź. Pytania:
+{question_list}""",
+        system_prompt=build_system_prompt(context),
+        max_tokens=200 * len(questions),
+        model='gpt-4o-mini'
+    )
+    
+    text = response.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        raise Exception(f"Error parsing answers: {response}")
+    return {qid: str(parsed.get(qid, "")) for qid in questions}
+
+def process_questions(
+    questions: dict,
+    context: str,
+    retrieval: bool = False,
+    single_call: bool = False,
+    top_k: int = 5,
+    token_budget: int = 2000
+) -> dict:
     """
+    Process each question using OpenAI with the markdown context.
+    
+    Parameters:
+    - questions (dict): Question ID to question text
+    - context (str): Markdown document
+    - retrieval (bool): Send only the chunks most relevant to each question instead of the whole document
+    - single_call (bool): Answer all questions in one call sharing a single context
+    - top_k (int): Number of chunks retrieved per question
+    - token_budget (int): Maximum estimated context tokens per question
+    
+    Returns:
+    - dict: Question ID to answer
+    """
+    if retrieval:
+        chunks = chunk_markdown(context)
+        embeddings = embed_chunks(chunks)
+        rankings = {qid: rank_chunks(question, chunks, embeddings) for qid, question in questions.items()}
+    
+    if single_call:
+        if retrieval:
+            # Interleave per-question rankings so every question gets its best chunks first
+            ranked = []
+            for position in range(len(chunks)):
+                for ranking in rankings.values():
+                    if ranking[position] not in ranked:
+                        ranked.append(ranking[position])
+            context = pack_context(chunks, ranked, top_k * len(questions), token_budget * len(questions))
+        answers = answer_all_at_once(questions, context)
+        for qid, question in questions.items():
+            print(f"{qid=}\n{question=}\nanswer={answers[qid]!r}\n")
+        return answers
     
     answers = {}
     for qid, question in questions.items():
+        question_context = pack_context(chunks, rankings[qid], top_k, token_budget) if retrieval else context
         answer = answer_question_openai(
             question=question,
-            system_prompt=system_prompt,
+            system_prompt=build_system_prompt(question_context),
             max_tokens=1000,
             model='gpt-4o-mini'
         )
@@ -67,7 +257,7 @@ def main():
         questions = fetch_questions()
         
         # Process questions and get answers
-        answers = process_questions(questions, context)
+        answers = process_questions(questions, context, retrieval=USE_RETRIEVAL, single_call=SINGLE_CALL)
         
         # Send results to the API
         send_task("arxiv", answers)
@@ -1,12 +1,24 @@
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from aidevs import (
     answer_question_local,
     download_and_extract_zip, 
     generate_image_completion,
-    answer_question_openai,
+    answer_structured,
+    json_object_schema,
     send_task
 )
-from aidevs_text_extractor import TextExtractor
+from aidevs_text_extractor import TextExtractor, AudioFilePlugin, ImageFilePlugin
+
+# Opt-in: reuse classifications of near-duplicate contents
+USE_SEMANTIC_CACHE = os.getenv('AIDEVS_SEMANTIC_CACHE', '0') == '1'
+
+CATEGORY_SCHEMA = json_object_schema(category={"type": "string", "enum": ["people", "hardware", "none"]})
+
+def extract_content(filepath: str) -> str:
+    """Extract text from a file with the matching TextExtractor plugin"""
+    extractor = TextExtractor.create(filepath)
+    return extractor.extract(filepath)
 
 def process_file(filepath: str, filename: str) -> tuple[str, str]:
     """
@@ -17,8 +29,7 @@ def process_file(filepath: str, filename: str) -> tuple[str, str]:
     
     try:
         # Create appropriate extractor and get content
-        extractor = TextExtractor.create(filepath)
-        content = extractor.extract(filepath)
+        content = extract_content(filepath)
         print(f"Extracted content: {content[:1000]}...")
         
     except ValueError as e:
@@ -28,7 +39,14 @@ def process_file(filepath: str, filename: str) -> tuple[str, str]:
         print(f"Error processing file {filename}: {e}")
         return filename, None
 
-    # Use answer_question_openai to categorize content
+    return classify_content(filename, content)
+
+def classify_content(filename: str, content: str) -> tuple[str, str]:
+    """
+    Determine category of extracted content.
+    Returns tuple of (filename, category) where category is 'people', 'hardware' or None
+    """
+    # Structured output constrains the answer to CATEGORY_SCHEMA
     system_prompt = """You are a content classifier. Analyze the text and determine if it contains:
     1. Information about detecting people or human presence (but not in the past).
     2. Information about physical hardware repairs or hardware-related issues
@@ -43,15 +61,94 @@ def process_file(filepath: str, filename: str) -> tuple[str, str]:
     Respond with exactly one word: 'people', 'hardware', or 'none'."""
     
     print("Categorizing content...")
-    category = answer_question_openai(
-        question=f"{system_prompt}\n\nContent to analyze:\n{content}",
-        max_tokens=1,
-        model="gpt-4o-mini"
-    )
+    def classify() -> str:
+        try:
+            return answer_structured(
+                question=f"{system_prompt}\n\nContent to analyze:\n{content}",
+                schema=CATEGORY_SCHEMA,
+                model="gpt-4o-mini"
+            )['category']
+        except Exception as e:
+            # Not cached by the semantic cache
+            return f"Error: {str(e)}"
+    
+    if USE_SEMANTIC_CACHE:
+        from aidevs_semantic_cache import semantic_cache
+        # Timestamps and ids in reports do not change their category
+        category = semantic_cache.answer(content, classify, model="gpt-4o-mini", system_prompt=system_prompt, mask_volatile=True)
+    else:
+        category = classify()
     print(f"Category determined: {category}")
     
     return filename, category if category in ['people', 'hardware'] else None
 
+def categorize_files(
+    output_dir: str,
+    audio_workers: int = 1,
+    ocr_workers: int = os.cpu_count() or 1,
+    classify_workers: int = 8
+) -> dict:
+    """
+    Categorize files in a directory with a staged pipeline. Audio transcription and OCR
+    run in separate process pools, and each extracted text is classified in a thread pool
+    as soon as it is ready, so CPU work and API calls overlap.
+    
+    Parameters:
+    - output_dir (str): Directory with files to process (subdirectories are skipped)
+    - audio_workers (int): Number of processes for audio transcription
+    - ocr_workers (int): Number of processes for OCR
+    - classify_workers (int): Number of concurrent classification requests
+    
+    Returns:
+    - dict: Sorted filenames in "people" and "hardware" categories
+    """
+    categories = {
+        "people": [],
+        "hardware": []
+    }
+    
+    files = sorted(f for f in os.listdir(output_dir) if os.path.isfile(os.path.join(output_dir, f)))
+    print(f"Found {len(files)} files to process")
+    
+    with ProcessPoolExecutor(max_workers=audio_workers) as audio_pool, \
+         ProcessPoolExecutor(max_workers=ocr_workers) as ocr_pool, \
+         ThreadPoolExecutor(max_workers=classify_workers) as classify_pool:
+        
+        extractions = {}
+        classifications = []
+        for filename in files:
+            filepath = os.path.join(output_dir, filename)
+            ext = os.path.splitext(filename)[1].lower()
+            if AudioFilePlugin.can_handle(ext):
+                extractions[audio_pool.submit(extract_content, filepath)] = filename
+            elif ImageFilePlugin.can_handle(ext):
+                extractions[ocr_pool.submit(extract_content, filepath)] = filename
+            else:
+                # Cheap extraction (or unsupported file) is handled by the classification stage
+                classifications.append(classify_pool.submit(process_file, filepath, filename))
+        
+        for future in as_completed(extractions):
+            filename = extractions[future]
+            try:
+                content = future.result()
+            except Exception as e:
+                print(f"Error processing file {filename}: {e}")
+                continue
+            print(f"Extracted content from {filename}: {content[:1000]}...")
+            classifications.append(classify_pool.submit(classify_content, filename, content))
+        
+        for future in classifications:
+            filename, category = future.result()
+            if category in categories:
+                categories[category].append(filename)
+                print(f"Added {filename} to category: {category}")
+    
+    # Sort filenames in each category
+    for category in categories:
+        categories[category].sort()
+    
+    return categories
+
 def main():
     # Get base URL from environment
     base_url = os.getenv('AIDEVS_BASE_URL')
@@ -67,35 +164,17 @@ def main():
     # print(f"Files extracted to: {output_dir}")
     output_dir = "./temp_data"
 
-    # Initialize result categories
-    categories = {
-        "people": [],
-        "hardware": []
-    }
-    
     # Process only files in the root directory
     print("\nStarting file processing...")
-    files = [f for f in os.listdir(output_dir) if os.path.isfile(os.path.join(output_dir, f))]
-    sorted_files = sorted(files)
-    
     print(f"\nProcessing root directory: {output_dir}")
-    print(f"Found {len(sorted_files)} files to process")
-    
-    for filename in sorted_files:
-        filepath = os.path.join(output_dir, filename)
-        filename, category = process_file(filepath, filename)
-        
-        if category in categories:
-            categories[category].append(filename)
-            print(f"Added {filename} to category: {category}")
-    
-    # Sort filenames in each category
-    for category in categories:
-        categories[category].sort()
+    categories = categorize_files(output_dir)
     
     print("\nFinal categorization:")
     print(f"People category: {categories['people']}")
     print(f"Hardware category: {categories['hardware']}")
+    if USE_SEMANTIC_CACHE:
+        from aidevs_semantic_cache import semantic_cache
+        print(f"Semantic cache: {semantic_cache.stats()}")
     
     # Send results
     print("\nSending results to server...")
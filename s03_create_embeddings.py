@@ -1,12 +1,29 @@
 import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import re
-from typing import Dict, Any
+from typing import Dict, Any, Iterator
 import requests
-from qdrant_client import QdrantClient
 from qdrant_client.http import models
-from aidevs import answer_question_local, memory, get_embedding
+from aidevs import answer_question_local, memory, get_embedding, get_qdrant_client, chunk_text, bounded_map
 from aidevs_text_extractor import TextFilePlugin
+from aidevs_vectors import get_local_index, get_content_store, qdrant_quantization_config
+from aidevs_embeddings import get_embedding_model
+
+COLLECTION_NAME = "factory_documents"
+# Chunk points use their own collection, ids and payload differ from whole-document points
+CHUNKS_COLLECTION_NAME = "factory_document_chunks"
+USE_CHUNKS = os.getenv('AIDEVS_CHUNKS', '0') == '1'
+# "qdrant" or "local" (aidevs_vectors.LocalVectorIndex in _cache_dir/vectors)
+VECTOR_STORE = os.getenv('AIDEVS_VECTOR_STORE', 'qdrant')
+# "int8", "binary" or "none", applies to new collections
+QUANTIZATION = os.getenv('AIDEVS_QUANTIZATION', 'none')
+# "payload" keeps document text in point payloads, "local" moves it to aidevs_vectors.ContentStore
+CONTENT_STORE = os.getenv('AIDEVS_CONTENT_STORE', 'payload')
+# Upload while documents are still being processed, see stream_ingest
+STREAM_INGEST = os.getenv('AIDEVS_STREAM_INGEST', '0') == '1'
 
 def extract_date_from_filename(filename: str) -> str:
     """Extract date from filename in format YYYY_MM_DD"""
@@ -17,102 +34,153 @@ def extract_date_from_filename(filename: str) -> str:
         return datetime.strptime(date_str, '%Y_%m_%d').isoformat()
     return None
 
-@memory.cache
-def extract_weapon_name(content: str) -> str:
-    """Extract weapon name from file content using Gemma"""
-    prompt = """Extract the weapon name from the following text. Return only the weapon name, nothing else:
+WEAPON_NAME_PROMPT = """Extract the weapon name from the following text. Return only the weapon name, nothing else:
 
     Text: {content}
     """
-    
+WEAPON_NAME_MODEL = 'gemma2:27b'
+
+@memory.cache
+def extract_weapon_name(content: str, model: str = WEAPON_NAME_MODEL, prompt: str = WEAPON_NAME_PROMPT) -> str:
+    """Extract weapon name from file content using a local model (Gemma by default)"""
     response = answer_question_local(
         prompt.format(content=content),
-        model='gemma2:27b',
+        model=model,
         stream=False
     )
     print(f"Weapon name: {response=}")
     return response.strip()
 
-def process_files(directory: str) -> list[Dict[str, Any]]:
-    """Process all text files in directory and return list of documents with embeddings"""
-    text_plugin = TextFilePlugin()
-    documents = []
-    
-    for filename in os.listdir(directory):
-        if not filename.endswith('.txt'):
-            continue
-            
-        filepath = os.path.join(directory, filename)
-        
-        # Extract text content
-        content = text_plugin.extract(filepath)
-        
-        # Get embedding (now cached)
-        embedding = get_embedding(content)
-        
-        # Extract metadata (weapon name extraction now cached)
-        date = extract_date_from_filename(filename)
-        weapon_name = extract_weapon_name(content)
-        
-        doc = {
-            'filename': filename,
-            'content': content,
-            'embedding': embedding,
-            'metadata': {
-                'date': date,
-                'weapon_name': weapon_name
-            }
-        }
-        
-        documents.append(doc)
-        
-    return documents
+def embed_chunks(content: str, max_chunk_tokens: int = 200, overlap_tokens: int = 40, max_workers: int = 8) -> list[Dict[str, Any]]:
+    """Split content into overlapping chunks and embed them in parallel"""
+    chunks = chunk_text(content, max_chunk_tokens, overlap_tokens)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        embeddings = list(executor.map(get_embedding, chunks))
+    return [
+        {'chunk_index': i, 'text': chunk, 'embedding': embedding}
+        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings))
+    ]
 
-def store_in_qdrant(documents: list[Dict[str, Any]]):
-    """Store documents in Qdrant cloud database"""
-    api_key = os.getenv('QDRANT_API_KEY')
-    qdrant_url = os.getenv('QDRANT_URL')
+def process_file(directory: str, filename: str, chunked: bool = False, max_chunk_tokens: int = 200, overlap_tokens: int = 40) -> Dict[str, Any]:
+    """Extract content, metadata and embedding(s) of a single file"""
+    # Extract text content
+    content = TextFilePlugin().extract(os.path.join(directory, filename))
     
-    if not api_key:
-        raise ValueError("QDRANT_API_KEY environment variable not set")
-    if not qdrant_url:
-        raise ValueError("QDRANT_URL environment variable not set")
-    
-    # Initialize Qdrant client
-    client = QdrantClient(
-        qdrant_url,
-        api_key=api_key
-    )
+    # Extract metadata (weapon name extraction now cached)
+    date = extract_date_from_filename(filename)
+    weapon_name = extract_weapon_name(content)
     
-    # Create collection if it doesn't exist
-    collection_name = "factory_documents"
+    doc = {
+        'filename': filename,
+        'content': content,
+        'metadata': {
+            'date': date,
+            'weapon_name': weapon_name
+        }
+    }
     
+    # Get embedding (now cached)
+    if chunked:
+        doc['chunks'] = embed_chunks(content, max_chunk_tokens, overlap_tokens)
+    else:
+        doc['embedding'] = get_embedding(content)
+    return doc
+
+def list_text_files(directory: str) -> Iterator[str]:
+    """Yield names of .txt files in directory order"""
+    for filename in os.listdir(directory):
+        if filename.endswith('.txt'):
+            yield filename
+
+def process_files(directory: str, chunked: bool = False, max_chunk_tokens: int = 200, overlap_tokens: int = 40) -> list[Dict[str, Any]]:
+    """
+    Process all text files in directory and return list of documents with embeddings.
+    With `chunked`, documents get a list of embedded 'chunks' instead of a single 'embedding'.
+    """
+    return [
+        process_file(directory, filename, chunked, max_chunk_tokens, overlap_tokens)
+        for filename in list_text_files(directory)
+    ]
+
+def chunk_point_id(filename: str, chunk_index: int) -> str:
+    """Stable point ID of a document chunk, re-indexing overwrites the same points"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{filename}#{chunk_index}"))
+
+def document_points(documents: list[Dict[str, Any]], start: int = 0) -> list[models.PointStruct]:
+    """
+    Build points: one per document, or one per chunk linked to its document by filename.
+    Whole-document point IDs are positions in directory order, counted from `start`.
+    """
+    points = []
+    for i, doc in enumerate(documents, start):
+        payload = {
+            'filename': doc['filename'],
+            'content': doc['content'],
+            'date': doc['metadata']['date'],
+            'weapon_name': doc['metadata']['weapon_name']
+        }
+        if 'chunks' not in doc:
+            points.append(models.PointStruct(id=i, vector=doc['embedding'], payload=payload))
+            continue
+        for chunk in doc['chunks']:
+            points.append(models.PointStruct(
+                id=chunk_point_id(doc['filename'], chunk['chunk_index']),
+                vector=chunk['embedding'],
+                payload={
+                    **payload,
+                    'content': chunk['text'],
+                    'chunk_index': chunk['chunk_index'],
+                    'chunk_count': len(doc['chunks'])
+                }
+            ))
+    return points
+
+PAYLOAD_INDEXES = {
+    'date': models.PayloadSchemaType.DATETIME,
+    'weapon_name': models.PayloadSchemaType.KEYWORD,
+    'filename': models.PayloadSchemaType.KEYWORD,
+}
+
+def move_contents(points: list[models.PointStruct], collection_name: str) -> list[models.PointStruct]:
+    """With the local content store, move document text out of payloads into the store"""
+    if CONTENT_STORE == 'local':
+        store = get_content_store(collection_name)
+        for point in points:
+            store.put(point.id, point.payload.pop('content'))
+    return points
+
+def ensure_collection(client, collection_name: str):
+    """Create Qdrant collection if it doesn't exist, and the payload indexes it lacks"""
     try:
-        client.get_collection(collection_name)
+        indexed = set(client.get_collection(collection_name).payload_schema or {})
     except:
+        indexed = set()
         # Create new collection
         client.create_collection(
             collection_name=collection_name,
             vectors_config=models.VectorParams(
-                size=len(documents[0]['embedding']),
-                distance=models.Distance.COSINE
-            )
+                size=get_embedding_model().dimensions,
+                distance=models.Distance.COSINE,
+                # Originals are only read to rescore quantized candidates
+                on_disk=QUANTIZATION != 'none'
+            ),
+            quantization_config=qdrant_quantization_config(QUANTIZATION)
         )
+    # Indexes for filtered search, see s03_query_embedding.document_filter; collections
+    # created before an index was added get it here
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        if field_name not in indexed:
+            client.create_payload_index(collection_name=collection_name, field_name=field_name, field_schema=field_schema)
+
+def store_in_qdrant(documents: list[Dict[str, Any]], collection_name: str = COLLECTION_NAME):
+    """Store documents in Qdrant cloud database"""
+    # Initialize Qdrant client
+    client = get_qdrant_client()
     
     # Prepare points for upload
-    points = []
-    for i, doc in enumerate(documents):
-        point = models.PointStruct(
-            id=i,
-            vector=doc['embedding'],
-            payload={
-                'filename': doc['filename'],
-                'content': doc['content'],
-                'date': doc['metadata']['date'],
-                'weapon_name': doc['metadata']['weapon_name']
-            }
-        )
-        points.append(point)
+    points = move_contents(document_points(documents), collection_name)
+    
+    ensure_collection(client, collection_name)
     
     # Upload points in batches
     batch_size = 100
@@ -123,17 +191,115 @@ def store_in_qdrant(documents: list[Dict[str, Any]]):
             points=batch
         )
 
+def store_locally(documents: list[Dict[str, Any]], collection_name: str = COLLECTION_NAME):
+    """Store documents in the local quantized vector index"""
+    points = move_contents(document_points(documents), collection_name)
+    get_local_index(collection_name, QUANTIZATION).upsert(
+        [point.id for point in points],
+        [point.vector for point in points],
+        [point.payload for point in points]
+    )
+
+def store_documents(documents: list[Dict[str, Any]], collection_name: str = COLLECTION_NAME):
+    """Store documents in the configured vector store"""
+    if VECTOR_STORE == 'local':
+        store_locally(documents, collection_name)
+    else:
+        store_in_qdrant(documents, collection_name)
+
+def stream_ingest(
+    directory: str,
+    collection_name: str = COLLECTION_NAME,
+    chunked: bool = False,
+    batch_size: int = 64,
+    workers: int = 4,
+    max_in_flight: int = 2
+) -> Dict[str, int]:
+    """
+    Ingest files as a stream: files are processed by `workers` threads and their points are
+    uploaded in batches while later files are still being embedded. At most `workers` documents
+    are buffered in processing and `max_in_flight` batches in upload; when uploads lag behind,
+    processing waits, so memory stays bounded regardless of corpus size.
+    
+    Returns:
+    - Dict[str, int]: Numbers of documents, points and batches uploaded
+    """
+    local = VECTOR_STORE == 'local'
+    if local:
+        index = get_local_index(collection_name, QUANTIZATION)
+        # The local index is a single memmap file, uploads of its batches are not overlapped
+        max_in_flight = 1
+    else:
+        client = get_qdrant_client()
+        ensure_collection(client, collection_name)
+    
+    def upload(points: list[models.PointStruct]):
+        move_contents(points, collection_name)
+        if local:
+            index.upsert([p.id for p in points], [p.vector for p in points], [p.payload for p in points], commit=False)
+        else:
+            client.upsert(collection_name=collection_name, points=points)
+    
+    slots = threading.Semaphore(max_in_flight)
+    uploads = []
+    stats = {'documents': 0, 'points': 0, 'batches': 0}
+    
+    def submit(executor: ThreadPoolExecutor, points: list[models.PointStruct]):
+        # Blocks while max_in_flight batches are uploading (backpressure on processing)
+        slots.acquire()
+        future = executor.submit(upload, points)
+        future.add_done_callback(lambda _: slots.release())
+        uploads.append(future)
+        # Surface upload errors early instead of after the whole corpus
+        for done in [f for f in uploads if f.done()]:
+            done.result()
+            uploads.remove(done)
+        stats['points'] += len(points)
+        stats['batches'] += 1
+    
+    documents = bounded_map(
+        lambda filename: process_file(directory, filename, chunked),
+        list_text_files(directory),
+        max_workers=workers,
+        max_pending=workers
+    )
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        batch = []
+        for doc in documents:
+            batch.extend(document_points([doc], start=stats['documents']))
+            stats['documents'] += 1
+            if len(batch) >= batch_size:
+                submit(executor, batch)
+                batch = []
+        if batch:
+            submit(executor, batch)
+        for future in uploads:
+            future.result()
+    
+    if local:
+        index.commit()
+    return stats
+
 def main():
     """Main function to process files and store in Qdrant"""
     directory = "data/dane_z_fabryki/do-not-share/"
     
+    collection_name = CHUNKS_COLLECTION_NAME if USE_CHUNKS else COLLECTION_NAME
+    
+    if STREAM_INGEST:
+        print(f"Streaming documents to {VECTOR_STORE}...")
+        stats = stream_ingest(directory, collection_name, chunked=USE_CHUNKS)
+        print(f"Uploaded {stats['points']} points of {stats['documents']} documents in {stats['batches']} batches")
+        print("Done!")
+        return
+    
     # Process all files
     print("Processing files and generating embeddings...")
-    documents = process_files(directory)
+    documents = process_files(directory, chunked=USE_CHUNKS)
     
     # Store in Qdrant
-    print("Storing documents in Qdrant...")
-    store_in_qdrant(documents)
+    print(f"Storing documents in {VECTOR_STORE}...")
+    store_documents(documents, collection_name)
     
     print("Done!")
 
@@ -1,5 +1,6 @@
 import os
-from aidevs import send_task, answer_question_local
+from aidevs import send_task, answer_question_local, json_object_schema, json_path
+from aidevs_router import router
 import json
 
 def get_db_url():
@@ -19,7 +20,8 @@ def query_database(query: str) -> dict:
 
 def extract_data_with_llm(json_response: dict, extraction_prompt: str) -> list:
     """
-    Use local LLM to extract data from JSON response based on the prompt
+    Use LLM ("standard" tier of aidevs_router) to extract data from JSON response based on the prompt.
+    The answer is a validated list of strings, no comma separated text to split.
     """
     prompt = f"""
     Given this JSON response:
@@ -27,13 +29,31 @@ def extract_data_with_llm(json_response: dict, extraction_prompt: str) -> list:
     
     {extraction_prompt}
     
-    Return only the extracted data as comma separated values, nothing else, only data without keys, do not write a program, just process the data.
+    Return only the extracted values, without keys, do not write a program, just process the data.
     """
     
-    result = answer_question_local(prompt)
+    # No semantic cache here: near-duplicate responses differ exactly in the values being extracted
+    result = router.answer(
+        'extract_data_with_llm',
+        prompt,
+        json_object_schema(values={"type": "array", "items": {"type": "string"}}),
+        tier='standard',
+        default_model='llama3.1:8b',
+        default_provider='ollama'
+    )['values']
     print(f"{result=}")
     return result
 
+def extract_data(json_response: dict, path: str, extraction_prompt: str) -> list:
+    """
+    Extract values from JSON response at a JSON path (see aidevs.json_path), e.g. "$.reply[*].*".
+    Asks the LLM only when the path matches nothing, i.e. the response has an unexpected shape.
+    """
+    values = json_path(json_response, path)
+    if values:
+        return [str(value) for value in values]
+    return extract_data_with_llm(json_response, extraction_prompt)
+
 def get_database_structure():
     """
     Get the database structure including tables and their schemas
@@ -41,26 +61,28 @@ def get_database_structure():
     # Get list of tables
     result = query_database("show tables")
     
-    # Extract table names using LLM
-    tables = extract_data_with_llm(
+    # Replies are lists of rows, "show tables" rows have a single column with the table name
+    tables = extract_data(
         result,
-        "Extract all table names from this response. Return them as a Python list of strings."
+        "$.reply[*].*",
+        "Extract all table names from this response."
     )
     print(f"{tables=}")
     
     # Get structure for each table
     structure = {}
-    for table_name in tables.split(','):
+    for table_name in tables:
         create_table = query_database(f"show create table {table_name}")
-        # Extract create table statement using LLM
-        table_structure = extract_data_with_llm(
+        # Extract create table statement
+        table_structure = extract_data(
             create_table,
-            "Extract only the CREATE TABLE statement from this response object. Return it as a single string, without any additional text or formatting."
+            "$.reply[*]['Create Table']",
+            "Extract only the CREATE TABLE statement from this response object."
         )
         print(f"{table_structure=}")
         if table_structure:
-            structure[table_name] = table_structure
-        print(f"Structure for {table_name}: {structure[table_name]}")
+            structure[table_name] = table_structure[0]
+            print(f"Structure for {table_name}: {structure[table_name]}")
     print(f"{structure=}")
     
     return structure
@@ -85,14 +107,15 @@ def main():
     # Execute the query
     result = query_database(sql_query)
     
-    # Extract DC_IDs using LLM
-    dc_ids = extract_data_with_llm(
+    # Extract DC_IDs, the query selects a single column
+    dc_ids = extract_data(
         result,
-        "Extract all datacenter values from this response. Return them as list of identifiers comma separated."
+        "$.reply[*].*",
+        "Extract all datacenter values from this response."
     )
     
     # Send answer to the task using default URL
-    send_task("database", [x for x in dc_ids.split(',')])
+    send_task("database", dc_ids)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
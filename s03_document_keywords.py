@@ -1,8 +1,33 @@
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict
-from aidevs import answer_question_local, answer_question_openai, send_task
+from typing import List, Dict, Optional
+from aidevs import answer_question_local, answer_question_openai, send_task, memory, file_hash
+
+FACT_SYSTEM_PROMPT = """
+    Analyze the following fact and generate keywords in Polish in singluar nominative form that describe:
+    - What is this fact about: person name
+    - Key entities mentioned
+    - Important attributes or characteristics
+    - Any specific technical terms
+    Return only personname followed by keywords separated by commas, no other text.
+    """
+
+KEYWORDS_QUESTION = "If person in mentioned include all keywords for this person. Include information of the sector name! Generate keywords for:\n{text}"
+
+KEYWORDS_INSTRUCTIONS = """
+    Generate keywords for the document that describe:
+    - Names and their characteristics (occupation, skills, languages)
+    - Sector names if mentioned
+    - Technical terms and technologies
+    - Detection-related keywords if relevant
+    - Include keywords for detected persons
+    - Always include keyword for the sector name
+    
+    Generate keywords in Polish in singular form.
+    Return only keywords separated by commas, no other text.
+    """
 
 def load_facts(facts_dir: str) -> str:
     """
@@ -45,86 +70,167 @@ def load_factory_reports(reports_dir: str) -> Dict[str, str]:
             
     return reports
 
-def generate_fact_keywords(facts_dir: str) -> Dict[str, List[str]]:
+def parse_keywords(response: str) -> List[str]:
     """
-    Generates keywords for each fact file.
+    Splits a comma separated model answer into keywords.
     
     Parameters:
-    - facts_dir (str): Path to the directory containing fact files
+    - response (str): Model answer
     
     Returns:
-    - Dict[str, List[str]]: Dictionary mapping fact files to their keywords
+    - List[str]: Non-empty keywords
+    
+    Raises:
+    - ValueError: If the answer is an "Error: ..." string or has no keywords, so that
+      cached callers do not store failures as keywords
     """
-    fact_keywords = {}
-    facts_path = Path(facts_dir)
+    if response.startswith("Error:"):
+        raise ValueError(f"Keyword generation failed: {response}")
+    keywords = [kw.strip() for kw in response.split(',') if kw.strip()]
+    if not keywords:
+        raise ValueError("Keyword generation returned no keywords")
+    return keywords
+
+@memory.cache(ignore=['fact_content'])
+def fact_file_keywords(content_hash: str, fact_content: str, system_prompt: str = FACT_SYSTEM_PROMPT) -> List[str]:
+    """
+    Generates keywords for a single fact. Results are persisted by fact content hash.
     
-    system_prompt = """
-    Analyze the following fact and generate keywords in Polish in singluar nominative form that describe:
-    - What is this fact about: person name
-    - Key entities mentioned
-    - Important attributes or characteristics
-    - Any specific technical terms
-    Return only personname followed by keywords separated by commas, no other text.
+    Parameters:
+    - content_hash (str): SHA-256 of the fact file, used as the cache key
+    - fact_content (str): Text of the fact
+    - system_prompt (str): Instructions for keyword generation
+    
+    Returns:
+    - List[str]: Keywords, person name first
+    
+    Raises:
+    - ValueError: If the request failed (failures are not cached)
+    """
+    response = answer_question_openai(
+        question=f"Generate fact name andkeywords for:\n{fact_content}",
+        system_prompt=system_prompt,
+        max_tokens=100
+    )
+    return parse_keywords(response)
+
+def generate_fact_keywords(facts_dir: str, max_workers: int = 8) -> Dict[str, List[str]]:
     """
+    Generates keywords for each fact file concurrently.
     
-    for file in facts_path.glob("*.txt"):
+    Parameters:
+    - facts_dir (str): Path to the directory containing fact files
+    - max_workers (int): Maximum number of concurrent requests
+    
+    Returns:
+    - Dict[str, List[str]]: Dictionary mapping fact files to their keywords, sorted by filename
+    """
+    files = sorted(Path(facts_dir).glob("*.txt"))
+    
+    def process(file: Path) -> List[str]:
         print(f"Generating keywords for fact: {file}")
         with open(file, 'r', encoding='utf-8') as f:
             fact_content = f.read().strip()
-            
-        response = answer_question_openai(
-            question=f"Generate fact name andkeywords for:\n{fact_content}",
-            system_prompt=system_prompt,
-            max_tokens=100
-        )
-        
-        fact_keywords[file.name] = [kw.strip() for kw in response.split(',')]
+        return fact_file_keywords(file_hash(str(file)), fact_content)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        keywords = list(executor.map(process, files))
         
-    return fact_keywords
+    return {file.name: file_keywords for file, file_keywords in zip(files, keywords)}
 
-def generate_keywords(text: str, fact_keywords: Dict[str, List[str]]) -> List[str]:
+def build_keywords_system_prompt(fact_keywords: Dict[str, List[str]]) -> str:
     """
-    Generates keywords for a given text using fact keywords as context.
+    Builds the system prompt shared by all reports. The fact context comes first
+    so the prompt is an identical prefix of every request and can be cached by the provider.
     
     Parameters:
-    - text (str): The text to generate keywords for
     - fact_keywords (Dict[str, List[str]]): Keywords extracted from facts
     
     Returns:
-    - List[str]: List of keywords
+    - str: System prompt
     """
-    # Create a context string from fact keywords
     context = "\n".join([
-        f"Fact {idx + 1} keywords: {', '.join(keywords)}"
-        for idx, keywords in enumerate(fact_keywords.values())
+        f"Fact {idx + 1} keywords: {', '.join(fact_keywords[name])}"
+        for idx, name in enumerate(sorted(fact_keywords))
     ])
     
-    system_prompt = f"""
+    return f"""
     Using the following fact keywords as context:
     {context}
+    {KEYWORDS_INSTRUCTIONS}"""
+
+def generate_keywords(
+    text: str,
+    fact_keywords: Optional[Dict[str, List[str]]] = None,
+    system_prompt: Optional[str] = None
+) -> List[str]:
+    """
+    Generates keywords for a given text using fact keywords as context.
     
-    Generate keywords for the document that describe:
-    - Names and their characteristics (occupation, skills, languages)
-    - Sector names if mentioned
-    - Technical terms and technologies
-    - Detection-related keywords if relevant
-    - Include keywords for detected persons
-    - Always include keyword for the sector name
+    Parameters:
+    - text (str): The text to generate keywords for
+    - fact_keywords (Dict[str, List[str]]): Keywords extracted from facts
+    - system_prompt (str): Prebuilt prompt from `build_keywords_system_prompt`, takes precedence over `fact_keywords`
     
-    Generate keywords in Polish in singular form.
-    Return only keywords separated by commas, no other text.
+    Returns:
+    - List[str]: List of keywords
+    
+    Raises:
+    - ValueError: If the request failed
     """
+    if system_prompt is None:
+        system_prompt = build_keywords_system_prompt(fact_keywords or {})
     
     response = answer_question_openai(
-        question=f"If person in mentioned include all keywords for this person. Include information of the sector name! Generate keywords for:\n{text}",
+        question=KEYWORDS_QUESTION.format(text=text),
         system_prompt=system_prompt,
         max_tokens=100
     )
     
-    keywords = [kw.strip() for kw in response.split(',')]
+    keywords = parse_keywords(response)
     print(f"{keywords=}")
     return keywords
 
+def generate_report_keywords(
+    reports: Dict[str, str],
+    fact_keywords: Dict[str, List[str]],
+    max_workers: int = 8,
+    use_batch: bool = False
+) -> Dict[str, str]:
+    """
+    Generates keywords for all reports concurrently, sharing one precomputed system prompt.
+    
+    Parameters:
+    - reports (Dict[str, str]): Filenames mapped to report contents
+    - fact_keywords (Dict[str, List[str]]): Keywords extracted from facts
+    - max_workers (int): Maximum number of concurrent requests
+    - use_batch (bool): Submit all reports at once through the OpenAI Batch API instead
+    
+    Returns:
+    - Dict[str, str]: Filenames mapped to comma separated keywords
+    """
+    system_prompt = build_keywords_system_prompt(fact_keywords)
+    
+    if use_batch:
+        from aidevs_batch import BatchJob
+        job = BatchJob()
+        custom_ids = {
+            filename: job.add(KEYWORDS_QUESTION.format(text=content), system_prompt=system_prompt, max_tokens=100)
+            for filename, content in reports.items()
+        }
+        answers = job.run()
+        return {
+            filename: ", ".join(parse_keywords(answers[custom_id]))
+            for filename, custom_id in custom_ids.items()
+        }
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            filename: executor.submit(generate_keywords, content, system_prompt=system_prompt)
+            for filename, content in reports.items()
+        }
+        return {filename: ", ".join(future.result()) for filename, future in futures.items()}
+
 def main():
     # Load environment variables
     base_dir = "data/dane_z_fabryki"
@@ -138,10 +244,7 @@ def main():
     reports = load_factory_reports(base_dir)
     
     # Generate keywords for each report using fact keywords as context
-    result = {}
-    for filename, content in reports.items():
-        keywords = generate_keywords(content, fact_keywords)
-        result[filename] = ", ".join(keywords)
+    result = generate_report_keywords(reports, fact_keywords, use_batch=os.getenv('AIDEVS_BATCH', '0') == '1')
     
     # Send results to API
     print(f"{result=}")
@@ -0,0 +1,291 @@
+"""
+Retrieval quality and latency evaluation of the s03 document search.
+
+Reads a labeled query set and reports recall@k, MRR, latency of each search stage
+(embed, search, fetch, rerank) and model calls per query for one or more configurations.
+Each configuration runs in a fresh subprocess with its own environment, in the current
+working directory, so the corpus embeddings in _cache_dir are reused between configurations
+and runs. Qdrant runs in-process (QDRANT_URL=":memory:") unless a configuration sets QDRANT_URL.
+
+Query set: JSON list or JSONL, each item with "query" and the expected "filename" and/or
+"date" (YYYY-MM-DD), a single value or a list:
+    {"query": "W raporcie, z którego dnia ...?", "date": "2024-02-21"}
+A filename with its date is one expected document; several filenames, or several dates
+without a filename, are one document each (see expected_documents).
+
+Configuration: NAME or NAME:KEY=VALUE,KEY=VALUE. Upper-case keys are environment variables
+(AIDEVS_CHUNKS, AIDEVS_VECTOR_STORE, AIDEVS_QUANTIZATION, AIDEVS_EMBEDDING_MODEL, ...),
+lower-case keys are evaluation options: rerank (0/1) and limit.
+
+Usage:
+    python s03_eval.py queries.jsonl
+    python s03_eval.py queries.jsonl --config baseline --config no_rerank:rerank=0 \\
+        --config chunks:AIDEVS_CHUNKS=1 --config int8:AIDEVS_VECTOR_STORE=local,AIDEVS_QUANTIZATION=int8
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+from tabulate import tabulate
+
+DIRECTORY = "data/dane_z_fabryki/do-not-share/"
+STAGES = ['embed', 'search', 'fetch', 'rerank', 'total']
+DEFAULT_CONFIGS = ["baseline", "no_rerank:rerank=0"]
+
+
+def load_queries(path: str) -> List[Dict[str, Any]]:
+    """
+    Reads labeled queries from a JSON list or a JSONL file.
+
+    Parameters:
+    - path (str): Path to the query set
+
+    Returns:
+    - List[Dict[str, Any]]: Items with "query" and expected "filename" and/or "date"
+
+    Raises:
+    - ValueError: If an item has no query or no expected document
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        items = json.loads(text)
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    for i, item in enumerate(items, 1):
+        if not item.get('query') or not (item.get('filename') or item.get('date')):
+            raise ValueError(f"Query {i} in {path} needs \"query\" and an expected \"filename\" or \"date\"")
+    return items
+
+
+def parse_config(spec: str) -> Dict[str, Any]:
+    """
+    Parses NAME:KEY=VALUE,KEY=VALUE into a configuration.
+
+    Returns:
+    - Dict[str, Any]: Name, environment variables and evaluation options (rerank, limit)
+    """
+    name, _, assignments = spec.partition(':')
+    config = {'name': name, 'env': {}, 'rerank': True, 'limit': 5}
+    for assignment in filter(None, assignments.split(',')):
+        key, _, value = assignment.partition('=')
+        if key.isupper():
+            config['env'][key] = value
+        elif key == 'rerank':
+            config['rerank'] = value == '1'
+        elif key == 'limit':
+            config['limit'] = int(value)
+        else:
+            raise ValueError(f"Unknown option {key} in configuration {name}")
+    return config
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def expected_documents(item: Dict[str, Any]) -> List[set]:
+    """
+    Documents a query should find, each as the (field, value) keys identifying it.
+    A single filename and its date describe one document; several filenames, or dates
+    without a filename, are one document each.
+    """
+    filenames, dates = _as_list(item.get('filename')), _as_list(item.get('date'))
+    if len(filenames) == 1:
+        return [{('filename', filenames[0])} | {('date', date) for date in dates}]
+    if filenames:
+        return [{('filename', filename)} for filename in filenames]
+    return [{('date', date)} for date in dates]
+
+
+def hit_keys(payload: Dict[str, Any]) -> set:
+    """Keys a hit can satisfy: its filename and its date (YYYY-MM-DD)"""
+    keys = {('filename', payload.get('filename'))}
+    if payload.get('date'):
+        keys.add(('date', payload['date'].split('T')[0]))
+    return keys
+
+
+def recall_at(ranked: List[Dict[str, Any]], expected: List[set], k: int) -> float:
+    """Fraction of expected documents matched by any of the first k hits"""
+    found = [document for document in expected if any(hit_keys(payload) & document for payload in ranked[:k])]
+    return len(found) / len(expected)
+
+
+def reciprocal_rank(ranked: List[Dict[str, Any]], expected: List[set]) -> float:
+    """1 / position of the first hit matching an expected document, 0 if none does"""
+    for rank, payload in enumerate(ranked, 1):
+        if any(hit_keys(payload) & document for document in expected):
+            return 1 / rank
+    return 0.0
+
+
+def index_corpus(directory: str, collection_name: str, chunked: bool) -> None:
+    """Indexes the corpus into the evaluation collection; embeddings come from the cache after the first run"""
+    from s03_create_embeddings import process_files, store_documents
+
+    # Local stores persist in _cache_dir, start from an empty collection so removed reports do not linger
+    shutil.rmtree(os.path.join("_cache_dir", "vectors", collection_name), ignore_errors=True)
+    shutil.rmtree(os.path.join("_cache_dir", "content", collection_name), ignore_errors=True)
+    store_documents(process_files(directory, chunked=chunked), collection_name)
+
+
+def evaluate_query(query: str, collection_name: str, chunked: bool, limit: int = 5, rerank: bool = True) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+    """
+    Runs s03_query_embedding.rank_documents, which times each search stage.
+
+    Parameters:
+    - query (str): Question
+    - collection_name (str): Collection to search
+    - chunked (bool): Collection holds chunks, hits are aggregated by document
+    - limit (int): Documents to retrieve (and rerank)
+    - rerank (bool): Rerank hits with the LLM relevance score
+
+    Returns:
+    - Tuple[List[Dict[str, Any]], Dict[str, float]]: Payloads of ranked documents and seconds spent per stage
+    """
+    from s03_query_embedding import rank_documents
+
+    timings = {}
+    ranked, _ = rank_documents(query, chunked, limit, collection_name=collection_name, rerank=rerank, timings=timings)
+    return [hit.payload for hit, _ in ranked], timings
+
+
+def _run_child(config: Dict[str, Any], queries_path: str, directory: str, output_path: str) -> None:
+    """Evaluates one configuration in the current (fresh) process and writes results as JSON"""
+    # Imports happen here, after the parent set up the environment
+    import aidevs_telemetry
+    from s03_create_embeddings import USE_CHUNKS, VECTOR_STORE, QUANTIZATION
+
+    queries = load_queries(queries_path)
+    collection_name = f"eval_{config['name']}_{'chunks' if USE_CHUNKS else 'documents'}"
+    index_corpus(directory, collection_name, USE_CHUNKS)
+
+    results = []
+    for item in queries:
+        aidevs_telemetry.reset()
+        ranked, timings = evaluate_query(item['query'], collection_name, USE_CHUNKS, config['limit'], config['rerank'])
+        expected = expected_documents(item)
+        results.append({
+            'query': item['query'],
+            'ranked': [{'filename': p.get('filename'), 'date': p.get('date')} for p in ranked],
+            'reciprocal_rank': reciprocal_rank(ranked, expected),
+            'recall': {k: recall_at(ranked, expected, k) for k in sorted({1, 3, config['limit']})},
+            'timings': timings,
+            'model_calls': sum(1 for r in aidevs_telemetry.records if not r['cache_hit']),
+            'cached_calls': sum(1 for r in aidevs_telemetry.records if r['cache_hit']),
+        })
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'config': config,
+            'chunked': USE_CHUNKS,
+            'vector_store': VECTOR_STORE,
+            'quantization': QUANTIZATION,
+            'queries': results,
+        }, f, indent=2, default=str)
+
+
+def run_config(config: Dict[str, Any], queries_path: str, directory: str) -> Dict[str, Any]:
+    """
+    Evaluates a configuration in a subprocess with its environment variables set.
+
+    Parameters:
+    - config (Dict[str, Any]): Configuration from parse_config
+    - queries_path (str): Labeled query set
+    - directory (str): Directory with the report files
+
+    Returns:
+    - Dict[str, Any]: Per-query results
+    """
+    workdir = tempfile.mkdtemp(prefix=f"eval_{config['name']}_")
+    output_path = os.path.join(workdir, "result.json")
+    env = dict(os.environ, QDRANT_URL=":memory:", **config['env'])
+    try:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), os.path.abspath(queries_path),
+             '--directory', os.path.abspath(directory), '--child', json.dumps(config), '--output', output_path],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"Configuration {config['name']} failed:\n{completed.stderr[-2000:]}")
+        with open(output_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def summarize(result: Dict[str, Any]) -> Dict[str, float]:
+    """Averages quality metrics and model calls, and takes latency percentiles per stage"""
+    from aidevs_telemetry import percentile
+
+    queries = result['queries']
+    summary = {}
+    for k in queries[0]['recall']:
+        summary[f"recall@{k}"] = sum(q['recall'][k] for q in queries) / len(queries)
+    summary['MRR'] = sum(q['reciprocal_rank'] for q in queries) / len(queries)
+    for stage in STAGES:
+        latencies = [q['timings'][stage] * 1000 for q in queries]
+        summary[f"{stage} p50 ms"] = percentile(latencies, 50)
+        summary[f"{stage} p95 ms"] = percentile(latencies, 95)
+    summary['model calls/query'] = sum(q['model_calls'] for q in queries) / len(queries)
+    summary['cached calls/query'] = sum(q['cached_calls'] for q in queries) / len(queries)
+    return summary
+
+
+def format_comparison(results: List[Dict[str, Any]]) -> str:
+    """Table with one column per configuration"""
+    summaries = [summarize(result) for result in results]
+    metrics = list(dict.fromkeys(metric for summary in summaries for metric in summary))
+    table_data = [
+        [metric] + [f"{summary[metric]:.3f}" if metric in summary else "-" for summary in summaries]
+        for metric in metrics
+    ]
+    headers = ["Metric"] + [result['config']['name'] for result in results]
+    return tabulate(table_data, headers=headers, tablefmt="grid")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and latency of the s03 search")
+    parser.add_argument('queries', help="Labeled query set, JSON or JSONL")
+    parser.add_argument('--directory', default=DIRECTORY, help="Directory with the report files")
+    parser.add_argument('--config', action='append', help="NAME[:KEY=VALUE,...], may be repeated")
+    parser.add_argument('--save', help="Write per-query results of all configurations to this JSON file")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _run_child(json.loads(args.child), args.queries, args.directory, args.output)
+        return
+
+    configs = [parse_config(spec) for spec in args.config or DEFAULT_CONFIGS]
+    names = [config['name'] for config in configs]
+    if len(set(names)) != len(names):
+        parser.error("Configuration names must be unique")
+
+    results = []
+    for config in configs:
+        print(f"Evaluating {config['name']}...")
+        results.append(run_config(config, args.queries, args.directory))
+
+    print(format_comparison(results))
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"Results saved to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from tabulate import tabulate
+
+from aidevs import file_hash, get_embedding, send_task
+from aidevs_embeddings import get_embedding_model
+from aidevs_pipeline import Pipeline, Stage
+from aidevs_text_extractor import TextFilePlugin
+from aidevs import get_qdrant_client
+from aidevs_vectors import get_local_index
+from s03_create_embeddings import (COLLECTION_NAME, QUANTIZATION, VECTOR_STORE, WEAPON_NAME_MODEL, WEAPON_NAME_PROMPT,
+                                   extract_date_from_filename, extract_weapon_name, store_documents)
+from s03_query_embedding import RELEVANCE_MODEL, RELEVANCE_PROMPT, evaluate_relevance, vector_search, fetch_contents
+
+DIRECTORY = "data/dane_z_fabryki/do-not-share/"
+QUERY = "W raporcie, z którego dnia znajduje się wzmianka o kradzieży prototypu broni?"
+
+
+def list_files(directory: str) -> Dict[str, str]:
+    """Returns hashes of report files, so edited reports invalidate only their downstream stages"""
+    return {
+        filename: file_hash(os.path.join(directory, filename))
+        for filename in sorted(os.listdir(directory))
+        if filename.endswith('.txt')
+    }
+
+
+def extract_documents(files: Dict[str, str], directory: str) -> Dict[str, str]:
+    """Reads text of each report"""
+    text_plugin = TextFilePlugin()
+    return {filename: text_plugin.extract(os.path.join(directory, filename)) for filename in files}
+
+
+def embed_documents(contents: Dict[str, str], model: str = None, max_workers: int = 8) -> Dict[str, List[float]]:
+    """Embeds each report with the embedding model `model` ("provider:model", see aidevs_embeddings)"""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        embeddings = executor.map(lambda content: get_embedding(content, model), contents.values())
+        return dict(zip(contents, embeddings))
+
+
+def extract_metadata(contents: Dict[str, str], model: str = WEAPON_NAME_MODEL, prompt: str = WEAPON_NAME_PROMPT,
+                     max_workers: int = 8) -> Dict[str, Dict[str, Any]]:
+    """Extracts date from filename and weapon name from content"""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        weapon_names = executor.map(lambda content: extract_weapon_name(content, model, prompt), contents.values())
+        return {
+            filename: {'date': extract_date_from_filename(filename), 'weapon_name': weapon_name}
+            for filename, weapon_name in zip(contents, weapon_names)
+        }
+
+
+def upload_documents(contents: Dict[str, str], embeddings: Dict[str, List[float]],
+                     metadata: Dict[str, Dict[str, Any]], collection_name: str) -> Dict[str, Any]:
+    """Upserts documents to the vector store; point IDs follow filename order, so reruns overwrite the same points"""
+    documents = [
+        {'filename': filename, 'content': content, 'embedding': embeddings[filename], 'metadata': metadata[filename]}
+        for filename, content in contents.items()
+    ]
+    store_documents(documents, collection_name)
+    return {'collection': collection_name, 'points': len(documents)}
+
+
+def upload_present(upload: Dict[str, Any]) -> bool:
+    """Whether the vector store still holds an earlier upload, e.g. not an in-memory Qdrant of a finished process"""
+    try:
+        if VECTOR_STORE == 'local':
+            return get_local_index(upload['collection'], QUANTIZATION).count() >= upload['points']
+        return get_qdrant_client().count(upload['collection'], exact=True).count >= upload['points']
+    except Exception:
+        return False
+
+
+def search(upload: Dict[str, Any], query: str, limit: int = 5, model: str = None) -> List[Dict[str, Any]]:
+    """Returns the most similar documents with their metadata and text; `model` must be the one that embedded them"""
+    result = vector_search(upload['collection'], get_embedding(query, model), limit)
+    contents = fetch_contents(upload['collection'], [match.id for match in result])
+    return [
+        {'id': match.id, 'score': match.score, 'payload': match.payload, 'content': contents.get(match.id, "")}
+        for match in result
+    ]
+
+
+def rerank(hits: List[Dict[str, Any]], query: str, prompt: str = RELEVANCE_PROMPT,
+           model: str = RELEVANCE_MODEL) -> List[Dict[str, Any]]:
+    """Scores hits with the LLM and sorts them by the average of vector and LLM score"""
+    ranked = []
+    for hit in hits:
+        llm_score = evaluate_relevance(hit['content'], query, prompt, model)
+        ranked.append({**hit, 'llm_score': llm_score, 'combined_score': (hit['score'] + llm_score) / 2})
+    return sorted(ranked, key=lambda hit: hit['combined_score'], reverse=True)
+
+
+def build_pipeline(directory: str = DIRECTORY, query: str = QUERY, prompt: str = RELEVANCE_PROMPT) -> Pipeline:
+    """Declares the s03 workflow: extract, embed and metadata feed upload, then search and rerank"""
+    # Part of the fingerprints, switching AIDEVS_EMBEDDING_MODEL re-embeds instead of reusing old vectors
+    embedding_model = get_embedding_model().key
+    return Pipeline([
+        Stage('files', list_files, params={'directory': directory}, cache=False),
+        Stage('extract', extract_documents, ['files'], {'directory': directory}),
+        Stage('embed', embed_documents, ['extract'], {'model': embedding_model}),
+        Stage('metadata', extract_metadata, ['extract'], {'model': WEAPON_NAME_MODEL, 'prompt': WEAPON_NAME_PROMPT}),
+        # Upserts again only when its inputs changed or the collection lost the points (in-memory or recreated index)
+        Stage('upload', upload_documents, ['extract', 'embed', 'metadata'], {'collection_name': COLLECTION_NAME},
+              is_valid=upload_present),
+        Stage('search', search, ['upload'], {'query': query, 'limit': 5, 'model': embedding_model}),
+        Stage('rerank', rerank, ['search'], {'query': query, 'prompt': prompt, 'model': RELEVANCE_MODEL}),
+    ])
+
+
+def main():
+    """Runs the s03 workflow, reusing stages that did not change"""
+    pipeline = build_pipeline()
+    outputs = pipeline.run()
+    print(pipeline.format_report())
+
+    ranked = outputs['rerank']
+    table_data = [
+        [
+            i,
+            hit['payload']['date'].split('T')[0],
+            hit['payload']['weapon_name'],
+            f"{hit['score']:.4f}",
+            f"{hit['llm_score']:.4f}",
+            f"{hit['combined_score']:.4f}"
+        ]
+        for i, hit in enumerate(ranked, 1)
+    ]
+    print("\nSearch Results:")
+    print(tabulate(table_data, headers=["Rank", "Date", "Weapon Name", "Vector Score", "LLM Score", "Combined Score"], tablefmt="grid"))
+
+    formatted_date = ranked[0]['payload']['date'].split('T')[0]
+    print(f"\nBest matching date: {formatted_date}")
+    send_task("wektory", formatted_date)
+
+
+if __name__ == "__main__":
+    main()
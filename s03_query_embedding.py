@@ -1,15 +1,13 @@
-import os
-from qdrant_client import QdrantClient
+import time
+
 from qdrant_client.http import models
-from aidevs import get_embedding, send_task, answer_question_local
+from aidevs import get_embedding, send_task, json_object_schema, get_qdrant_client, SchemaValidationError
+from aidevs_router import router
+from s03_create_embeddings import COLLECTION_NAME, CHUNKS_COLLECTION_NAME, USE_CHUNKS, VECTOR_STORE, QUANTIZATION, CONTENT_STORE
+from aidevs_vectors import PayloadFilter, get_local_index, get_content_store, qdrant_search_params
 from tabulate import tabulate
 
-def evaluate_relevance(content: str, query: str) -> float:
-    """
-    Use LLM to evaluate how relevant the document is to the query.
-    Returns a score between 0 and 1.
-    """
-    prompt = """Oceń jak dobrze ten dokument pasuje do pytania.
+RELEVANCE_PROMPT = """Oceń jak dobrze ten dokument pasuje do pytania.
     Zwróć tylko liczbę z zakresu 0-1, gdzie:
     1 = dokument jest w 100% związany z pytaniem
     0 = dokument nie ma nic wspólnego z pytaniem
@@ -19,59 +17,187 @@ def evaluate_relevance(content: str, query: str) -> float:
     Dokument: {content}
     
     Wynik (0-1):"""
-    
-    response = answer_question_local(
-        prompt.format(query=query, content=content),
-        model='gemma2:27b',
-        stream=False
-    )
-    
+
+RELEVANCE_MODEL = 'gemma2:27b'
+
+RELEVANCE_SCHEMA = json_object_schema(score={"type": "number", "minimum": 0, "maximum": 1})
+
+def evaluate_relevance(content: str, query: str, prompt: str = RELEVANCE_PROMPT, model: str = RELEVANCE_MODEL) -> float:
+    """
+    Use LLM to evaluate how relevant the document is to the query, a "basic" tier task for aidevs_router.
+    Returns a score between 0 and 1, constrained by RELEVANCE_SCHEMA instead of parsed from text.
+    `model` is the Ollama model asked when routing is off.
+    """
     try:
-        print(f"LLM score: {response}")
-        score = float(response.strip())
-        return min(max(score, 0), 1)  # Ensure score is between 0 and 1
-    except:
+        score = router.answer(
+            'evaluate_relevance',
+            prompt.format(query=query, content=content),
+            RELEVANCE_SCHEMA,
+            tier='basic',
+            default_model=model,
+            default_provider='ollama'
+        )['score']
+        print(f"LLM score: {score}")
+        return score
+    except SchemaValidationError as e:
+        # Invalid answer counts as irrelevant, connection errors and broken responses are raised
+        print(f"Error evaluating relevance: {str(e)}")
         return 0.0
 
-def search_documents(query: str) -> str:
-    """Search documents in Qdrant and return date from best matching document"""
-    
-    # Get embedding for query
-    query_embedding = get_embedding(query)
-    
-    # Initialize Qdrant client
-    api_key = os.getenv('QDRANT_API_KEY')
-    qdrant_url = os.getenv('QDRANT_URL')
-    
-    if not api_key:
-        raise ValueError("QDRANT_API_KEY environment variable not set")
-    if not qdrant_url:
-        raise ValueError("QDRANT_URL environment variable not set")
-    
-    client = QdrantClient(
-        qdrant_url,
-        api_key=api_key
-    )
+# Fields needed to rank and display hits; document text is fetched separately with fetch_contents
+SEARCH_PAYLOAD_FIELDS = ['filename', 'date', 'weapon_name', 'chunk_index']
+
+def document_filter(date_from: str = None, date_to: str = None, weapon_name: str = None, filename_pattern: str = None) -> PayloadFilter:
+    """
+    Build filter on report metadata.
     
-    # Search for 5 most similar documents
-    search_result = client.search(
-        collection_name="factory_documents",
-        query_vector=query_embedding,
-        limit=5
+    Parameters:
+    - date_from (str): First date, YYYY-MM-DD
+    - date_to (str): Last date, YYYY-MM-DD (inclusive)
+    - weapon_name (str): Exact weapon name
+    - filename_pattern (str): Glob pattern, e.g. "2024_01_*"
+    """
+    ranges = {}
+    if date_from or date_to:
+        # Dates are stored as ISO timestamps at midnight
+        ranges['date'] = (f"{date_from}T00:00:00" if date_from else None, f"{date_to}T23:59:59" if date_to else None)
+    return PayloadFilter(
+        match={'weapon_name': weapon_name} if weapon_name else None,
+        ranges=ranges,
+        patterns={'filename': filename_pattern} if filename_pattern else None
     )
-    
-    if not search_result:
-        raise ValueError("No matching documents found")
-    
+
+def vector_search(collection_name: str, query_embedding: list[float], limit: int, with_payload=SEARCH_PAYLOAD_FIELDS,
+                  query_filter: PayloadFilter = None) -> list:
+    """Returns points most similar to the query from the configured vector store, with only the requested payload fields"""
+    if VECTOR_STORE == 'local':
+        return get_local_index(collection_name, QUANTIZATION).search(query_embedding, limit, with_payload, query_filter)
+    if not query_filter or not query_filter.patterns:
+        return get_qdrant_client().query_points(
+            collection_name=collection_name,
+            query=query_embedding,
+            limit=limit,
+            with_payload=with_payload,
+            query_filter=query_filter.to_qdrant() if query_filter else None,
+            search_params=qdrant_search_params(QUANTIZATION)
+        ).points
+    
+    # Qdrant cannot match glob patterns, check them page by page until `limit` points match
+    # or the results run out; pages double so rare matches need few requests
+    fields = with_payload if with_payload is True else list(set(with_payload or []) | set(query_filter.patterns))
+    matches, offset, page_size = [], 0, limit
+    while len(matches) < limit:
+        points = get_qdrant_client().query_points(
+            collection_name=collection_name,
+            query=query_embedding,
+            limit=page_size,
+            offset=offset,
+            with_payload=fields,
+            query_filter=query_filter.to_qdrant(),
+            search_params=qdrant_search_params(QUANTIZATION)
+        ).points
+        matches += [point for point in points if query_filter.matches(point.payload)]
+        if len(points) < page_size:
+            break
+        offset += page_size
+        page_size = min(page_size * 2, 1024)
+    return matches[:limit]
+
+def fetch_contents(collection_name: str, ids: list) -> dict:
+    """Fetch document (or chunk) text of the given points in one request"""
+    if not ids:
+        return {}
+    if CONTENT_STORE == 'local':
+        return get_content_store(collection_name).get_many(ids)
+    if VECTOR_STORE == 'local':
+        points = get_local_index(collection_name, QUANTIZATION).retrieve(ids, ['content'])
+    else:
+        points = get_qdrant_client().retrieve(
+            collection_name=collection_name,
+            ids=ids,
+            with_payload=['content'],
+            with_vectors=False
+        )
+    return {point.id: point.payload['content'] for point in points}
+
+def aggregate_by_document(points: list, limit: int) -> list:
+    """
+    Groups chunk hits by parent document, keeping the best scoring chunk of each.
+    Its text is what gets reranked.
+    """
+    best = {}
+    for point in points:
+        filename = point.payload['filename']
+        if filename not in best or point.score > best[filename].score:
+            best[filename] = point
+    return sorted(best.values(), key=lambda point: point.score, reverse=True)[:limit]
+
+def rank_documents(query: str, chunked: bool = USE_CHUNKS, limit: int = 5, query_filter: PayloadFilter = None,
+                   collection_name: str = None, rerank: bool = True, timings: dict = None) -> tuple:
+    """
+    Runs the search stages: embed the query, vector search, fetch texts of the hits and rerank them with the LLM.
+
+    Parameters:
+    - query (str): Question
+    - chunked (bool): Search chunks and aggregate them by document
+    - limit (int): Documents to retrieve (and rerank)
+    - query_filter (PayloadFilter): Narrows candidates before the vector search, see document_filter
+    - collection_name (str): Collection to search, by default the one of `chunked`
+    - rerank (bool): Rerank hits by the average of vector similarity and LLM relevance score
+    - timings (dict): When given, receives seconds spent in each stage (embed, search, fetch, rerank, total)
+
+    Returns:
+    - tuple: List of (hit, combined score) best first, and texts of the hits by ID (empty without rerank)
+    """
+    timings = {} if timings is None else timings
+    collection_name = collection_name or (CHUNKS_COLLECTION_NAME if chunked else COLLECTION_NAME)
+
+    start = time.perf_counter()
+    query_embedding = get_embedding(query)
+    timings['embed'] = time.perf_counter() - start
+
+    stage_start = time.perf_counter()
+    if chunked:
+        # Several chunks may belong to one document, fetch more to still get `limit` documents
+        chunk_hits = vector_search(collection_name, query_embedding, limit * 4, query_filter=query_filter)
+        search_result = aggregate_by_document(chunk_hits, limit)
+    else:
+        # Search for most similar documents
+        search_result = vector_search(collection_name, query_embedding, limit, query_filter=query_filter)
+    timings['search'] = time.perf_counter() - stage_start
+
+    # Text only of the hits that get reranked
+    stage_start = time.perf_counter()
+    contents = fetch_contents(collection_name, [match.id for match in search_result]) if rerank else {}
+    timings['fetch'] = time.perf_counter() - stage_start
+
     # Evaluate each document's relevance
+    stage_start = time.perf_counter()
     evaluated_results = []
     for match in search_result:
-        llm_score = evaluate_relevance(match.payload['content'], query)
-        combined_score = (match.score + llm_score) / 2  # Average of vector similarity and LLM score
+        if rerank:
+            llm_score = evaluate_relevance(contents.get(match.id, ""), query)
+            combined_score = (match.score + llm_score) / 2  # Average of vector similarity and LLM score
+        else:
+            combined_score = match.score
         evaluated_results.append((match, combined_score))
     
     # Sort by combined score
     evaluated_results.sort(key=lambda x: x[1], reverse=True)
+    timings['rerank'] = time.perf_counter() - stage_start
+    timings['total'] = time.perf_counter() - start
+
+    return evaluated_results, contents
+
+def search_documents(query: str, chunked: bool = USE_CHUNKS, limit: int = 5, query_filter: PayloadFilter = None) -> str:
+    """
+    Search documents in Qdrant and return date from best matching document.
+    `query_filter` (see document_filter) narrows candidates before the vector search.
+    """
+    evaluated_results, contents = rank_documents(query, chunked, limit, query_filter)
+    
+    if not evaluated_results:
+        raise ValueError("No matching documents found")
     
     # Prepare table data
     table_data = []
@@ -97,7 +223,7 @@ def search_documents(query: str) -> str:
     best_match = evaluated_results[0][0]
     print(f"\nBest matching document content:")
     print("-" * 80)
-    print(best_match.payload['content'][:80])
+    print(contents.get(best_match.id, "")[:80])
     print("-" * 80)
     
     return best_match.payload['date']
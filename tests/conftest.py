@@ -0,0 +1,6 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# aidevs creates its OpenAI client at import, tests never call the API
+os.environ.setdefault('OPENAI_API_KEY', 'test')
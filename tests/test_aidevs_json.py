@@ -0,0 +1,78 @@
+import pytest
+
+from aidevs import SchemaValidationError, json_object_schema, json_path, json_path_first, validate_json
+
+
+SCHEMA = json_object_schema(
+    category={"type": "string", "enum": ["people", "hardware"]},
+    score={"type": "number", "minimum": 0, "maximum": 1},
+    tags={"type": "array", "items": {"type": "string"}, "maxItems": 2},
+    note={"type": ["string", "null"]},
+)
+
+
+def test_valid_value_is_returned_unchanged():
+    value = {"category": "people", "score": 1, "tags": ["a"], "note": None}
+    assert validate_json(value, SCHEMA) is value
+
+
+@pytest.mark.parametrize('value, message', [
+    ({"category": "people", "score": 0.5, "tags": []}, "missing required property 'note'"),
+    ({"category": "cars", "score": 0.5, "tags": [], "note": None}, r"\$.category: 'cars' is not one of"),
+    ({"category": "people", "score": 1.5, "tags": [], "note": None}, r"\$.score: 1.5 is greater than 1"),
+    ({"category": "people", "score": True, "tags": [], "note": None}, r"\$.score: expected number, got bool"),
+    ({"category": "people", "score": 0, "tags": ["a", 1], "note": None}, r"\$.tags\[1\]: expected string"),
+    ({"category": "people", "score": 0, "tags": ["a", "b", "c"], "note": None}, "more than 2 items"),
+    ({"category": "people", "score": 0, "tags": [], "note": None, "extra": 1}, r"unexpected properties \['extra'\]"),
+    ([], r"\$: expected object, got list"),
+])
+def test_invalid_values_are_rejected(value, message):
+    with pytest.raises(SchemaValidationError, match=message):
+        validate_json(value, SCHEMA)
+
+
+def test_schema_validation_error_is_a_value_error():
+    with pytest.raises(ValueError):
+        validate_json("1", {"type": "integer"})
+    assert validate_json(1, {"type": "integer", "exclusiveMinimum": 0}) == 1
+    with pytest.raises(SchemaValidationError, match="not greater than 0"):
+        validate_json(0, {"type": "integer", "exclusiveMinimum": 0})
+
+
+RESPONSE = {
+    "code": 0,
+    "reply": [
+        {"id": 1, "name": "Adam", "tags": {"role": "admin"}},
+        {"id": 2, "name": "Barbara"},
+    ],
+    "odd key": "value",
+}
+
+
+@pytest.mark.parametrize('path, expected', [
+    ("$", [RESPONSE]),
+    ("$.code", [0]),
+    ("$.reply[*].id", [1, 2]),
+    ("$.reply[1].name", ["Barbara"]),
+    ("$.reply[5].name", []),
+    ("$.reply[*].tags.role", ["admin"]),
+    ("$.reply[0].*", [1, "Adam", {"role": "admin"}]),
+    ("$['odd key']", ["value"]),
+    ('$["reply"][0]["name"]', ["Adam"]),
+    ("$.missing.id", []),
+    ("$.code.id", []),
+])
+def test_json_path(path, expected):
+    assert json_path(RESPONSE, path) == expected
+
+
+@pytest.mark.parametrize('path', ["reply", "$.reply[", "$..id", "$.reply[-1]"])
+def test_json_path_rejects_malformed_paths(path):
+    with pytest.raises(ValueError):
+        json_path(RESPONSE, path)
+
+
+def test_json_path_first():
+    assert json_path_first(RESPONSE, "$.reply[*].name") == "Adam"
+    assert json_path_first(RESPONSE, "$.reply[9].name") is None
+    assert json_path_first(RESPONSE, "$.reply[9].name", default="none") == "none"
@@ -0,0 +1,133 @@
+import types
+
+import pytest
+
+import aidevs_ratelimit
+from aidevs_ratelimit import ModelLimiter, RateLimiter, TokenBucket, is_retryable, retry_after
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code, headers=None, code=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = types.SimpleNamespace(status_code=status_code, headers=headers or {})
+        self.code = code
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records sleeps instead of waiting; backoff jitter returns its upper bound"""
+    recorded = []
+    monkeypatch.setattr(aidevs_ratelimit.time, 'sleep', recorded.append)
+    monkeypatch.setattr(aidevs_ratelimit.random, 'uniform', lambda low, high: high)
+    return recorded
+
+
+def failing_then(errors, response="ok"):
+    errors = list(errors)
+
+    def request():
+        if errors:
+            raise errors.pop(0)
+        return response
+    return request
+
+
+def bucket(capacity, refill_rate):
+    b = TokenBucket(capacity, refill_rate)
+    b.updated = 0.0
+    return b
+
+
+def test_bucket_reserve_waits_for_debt():
+    b = bucket(10, 2)
+    assert b.reserve(10, 0.0) == 0.0
+    # 4 tokens short at 2 tokens per second
+    assert b.reserve(4, 0.0) == pytest.approx(2.0)
+
+
+def test_bucket_refills_up_to_capacity():
+    b = bucket(10, 2)
+    b.reserve(10, 0.0)
+    b.reserve(0, 3.0)
+    assert b.tokens == pytest.approx(6)
+    b.reserve(0, 100.0)
+    assert b.tokens == pytest.approx(10)
+
+
+def test_bucket_adjust_credits_and_charges():
+    b = bucket(10, 1)
+    b.reserve(8, 0.0)
+    b.adjust(-5, 0.0)
+    assert b.tokens == pytest.approx(7)
+    b.adjust(3, 0.0)
+    assert b.tokens == pytest.approx(4)
+
+
+def test_model_limiter_release_returns_reservation():
+    limiter = ModelLimiter(rpm=60, tpm=1000)
+    limiter.acquire(400)
+    limiter.release(400)
+    assert limiter.requests.tokens == pytest.approx(60, abs=0.1)
+    assert limiter.tokens.tokens == pytest.approx(1000, abs=1)
+
+
+def test_model_limiter_record_usage_corrects_estimate():
+    limiter = ModelLimiter(rpm=60, tpm=1000)
+    limiter.acquire(100)
+    limiter.record_usage(100, 300)
+    assert limiter.tokens.tokens == pytest.approx(700, abs=1)
+
+
+def test_retry_after_headers():
+    assert retry_after(FakeAPIError(429, {'retry-after-ms': '1500'})) == 1.5
+    assert retry_after(FakeAPIError(429, {'retry-after': '2'})) == 2.0
+    assert retry_after(FakeAPIError(429)) is None
+
+
+def test_retryable_errors():
+    assert is_retryable(FakeAPIError(429))
+    assert is_retryable(FakeAPIError(503))
+    assert not is_retryable(FakeAPIError(400))
+    assert not is_retryable(FakeAPIError(429, code='insufficient_quota'))
+
+
+def test_server_error_is_retried_with_backoff_and_refunded(sleeps):
+    limiter = RateLimiter({'default': {'rpm': 60, 'tpm': 1000}}, base_delay=1.0, max_delay=60.0)
+    assert limiter.call('m', 100, failing_then([FakeAPIError(503), FakeAPIError(503)])) == "ok"
+    assert sleeps == [1.0, 2.0]
+    # Failed attempts were credited back, only the successful one is charged
+    assert limiter.limiter('m').requests.tokens == pytest.approx(59, abs=0.1)
+    assert limiter.limiter('m').tokens.tokens == pytest.approx(900, abs=1)
+
+
+def test_rate_limit_keeps_reservation_and_honors_retry_after(sleeps):
+    limiter = RateLimiter({'default': {'rpm': 60, 'tpm': 1000}})
+    assert limiter.call('m', 100, failing_then([FakeAPIError(429, {'retry-after': '3'})])) == "ok"
+    # Waited once, in acquire, for the block set by the 429
+    assert len(sleeps) == 1 and sleeps[0] == pytest.approx(3.0, abs=0.1)
+    model = limiter.limiter('m')
+    assert model.requests.tokens == pytest.approx(58, abs=0.1)
+    assert model.tokens.tokens == pytest.approx(800, abs=1)
+    assert model.blocked_until > 0
+
+
+def test_rate_limit_without_retry_after_keeps_reservation(sleeps):
+    limiter = RateLimiter({'default': {'rpm': 60, 'tpm': 1000}}, base_delay=0.5)
+    limiter.call('m', 100, failing_then([FakeAPIError(429)]))
+    assert sleeps == [0.5]
+    assert limiter.limiter('m').tokens.tokens == pytest.approx(800, abs=1)
+
+
+def test_insufficient_quota_is_not_retried(sleeps):
+    limiter = RateLimiter()
+    with pytest.raises(FakeAPIError):
+        limiter.call('m', 100, failing_then([FakeAPIError(429, {'retry-after': '1'}, code='insufficient_quota')]))
+    assert sleeps == []
+
+
+def test_retries_are_bounded(sleeps):
+    limiter = RateLimiter(max_retries=2, base_delay=1.0)
+    with pytest.raises(FakeAPIError):
+        limiter.call('m', 10, failing_then([FakeAPIError(500)] * 5))
+    assert sleeps == [1.0, 2.0]
@@ -0,0 +1,101 @@
+import pytest
+
+import aidevs
+from aidevs_router import ModelRouter, RoutedModel
+
+MODELS = [
+    RoutedModel('small', 'ollama', 1),
+    RoutedModel('medium', 'ollama', 2),
+    RoutedModel('medium-api', 'openai', 2),
+    RoutedModel('large', 'ollama', 3),
+]
+SCHEMA = aidevs.json_object_schema(category={"type": "string"})
+
+
+def fake_answers(monkeypatch, answers):
+    """Replaces answer_structured with per-model answers; exceptions are raised"""
+    calls = []
+
+    def answer_structured(question, schema, system_prompt, model, provider, max_tokens):
+        calls.append(model)
+        answer = answers[model]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    monkeypatch.setattr(aidevs, 'answer_structured', answer_structured)
+    return calls
+
+
+def names(candidates):
+    return [c['model'].name for c in candidates]
+
+
+def test_candidates_meet_tier():
+    router = ModelRouter(MODELS)
+    assert names(router.candidates('basic')) == ['small', 'medium', 'medium-api', 'large']
+    assert names(router.candidates('standard')) == ['medium', 'medium-api', 'large']
+    assert names(router.candidates('strong')) == ['large']
+
+
+def test_candidates_prefer_lower_latency_within_tier():
+    router = ModelRouter(MODELS)
+    router._stats['ollama:medium'].latency = 2.0
+    router._stats['openai:medium-api'].latency = 0.5
+    assert names(router.candidates('standard')) == ['medium-api', 'medium', 'large']
+
+
+def test_failing_model_is_deprioritized():
+    router = ModelRouter(MODELS)
+    router._stats['ollama:small'].in_flight = 1
+    router._stats['ollama:small'].finish(1.0, error=True)
+    candidates = router.candidates('basic')
+    assert names(candidates)[-1] == 'small'
+    assert candidates[-1]['deprioritized'] == "1 consecutive errors"
+
+
+def test_invalid_answer_escalates_to_higher_tier(monkeypatch):
+    calls = fake_answers(monkeypatch, {
+        'medium': aidevs.SchemaValidationError("$.category: expected string"),
+        'medium-api': {'category': 'unused'},
+        'large': {'category': 'people'},
+    })
+    router = ModelRouter(MODELS)
+    assert router.answer('task', 'q', SCHEMA, tier='standard') == {'category': 'people'}
+    # The other tier 2 model is skipped, it is no stronger than the one that failed
+    assert calls == ['medium', 'large']
+
+
+def test_low_confidence_escalates(monkeypatch):
+    calls = fake_answers(monkeypatch, {
+        'small': {'category': 'none', 'confidence': 0.2},
+        'medium': {'category': 'people', 'confidence': 0.9},
+    })
+    router = ModelRouter(MODELS)
+    assert router.answer('task', 'q', SCHEMA, min_confidence=0.7) == {'category': 'people'}
+    assert calls == ['small', 'medium']
+
+
+def test_broken_response_falls_back_without_escalating(monkeypatch):
+    # e.g. requests' JSONDecodeError, a ValueError that is not a validation error
+    calls = fake_answers(monkeypatch, {
+        'medium': ValueError("Expecting value: line 1 column 1"),
+        'medium-api': {'category': 'hardware'},
+    })
+    router = ModelRouter(MODELS)
+    assert router.answer('task', 'q', SCHEMA, tier='standard') == {'category': 'hardware'}
+    assert calls == ['medium', 'medium-api']
+    assert router.decisions[-1]['attempts'][0]['error'].startswith('ValueError')
+
+
+def test_last_error_is_raised_when_no_model_answers(monkeypatch):
+    fake_answers(monkeypatch, {'large': aidevs.SchemaValidationError("invalid")})
+    with pytest.raises(aidevs.SchemaValidationError):
+        ModelRouter(MODELS).answer('task', 'q', SCHEMA, tier='strong')
+
+
+def test_disabled_router_uses_default_model(monkeypatch):
+    calls = fake_answers(monkeypatch, {'gemma2:27b': {'category': 'none'}})
+    router = ModelRouter(MODELS, enabled=False)
+    assert router.answer('task', 'q', SCHEMA, default_model='gemma2:27b', default_provider='ollama') == {'category': 'none'}
+    assert calls == ['gemma2:27b']
@@ -0,0 +1,95 @@
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import aidevs_singleflight
+from aidevs_singleflight import SingleFlight, call_key, coalesced
+
+
+def test_concurrent_calls_share_one_execution(monkeypatch):
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+    waiting = threading.Semaphore(0)
+    monkeypatch.setattr(aidevs_singleflight, 'annotate', lambda **fields: waiting.release())
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'result'
+
+    with ThreadPoolExecutor(8) as pool:
+        leader = pool.submit(flight.do, 'key', slow)
+        assert started.wait(5)
+        followers = [pool.submit(flight.do, 'key', slow) for _ in range(7)]
+        # Followers announce themselves right before waiting for the leader
+        for _ in followers:
+            assert waiting.acquire(timeout=5)
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert results == ['result'] * 8
+    assert len(calls) == 1
+
+
+def test_error_is_raised_in_every_waiting_caller():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError("backend down")
+
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(flight.do, 'key', failing)
+        assert started.wait(5)
+        followers = [pool.submit(flight.do, 'key', failing) for _ in range(3)]
+        release.set()
+        for future in [leader] + followers:
+            with pytest.raises(ValueError, match="backend down"):
+                future.result()
+
+
+def test_finished_calls_are_not_shared():
+    flight = SingleFlight()
+    results = iter([1, 2])
+    assert flight.do('key', lambda: next(results)) == 1
+    assert flight.do('key', lambda: next(results)) == 2
+    assert flight._calls == {}
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 'a') == 'a'
+    assert flight.do('b', lambda: 'b') == 'b'
+
+
+def test_file_lock(tmp_path):
+    flight = SingleFlight(str(tmp_path))
+    assert flight.do('abcdef', lambda: 42) == 42
+    if aidevs_singleflight.fcntl:
+        assert (tmp_path / 'ab' / 'abcdef.lock').exists()
+
+
+def test_call_key_uses_bound_arguments():
+    def ask(question, model='gpt-4o'):
+        return question
+
+    signature = inspect.signature(ask)
+    key = call_key(ask, signature, ('hi',), {})
+    assert key == call_key(ask, signature, (), {'question': 'hi', 'model': 'gpt-4o'})
+    assert key != call_key(ask, signature, ('hi',), {'model': 'gpt-4o-mini'})
+
+
+def test_coalesced_keeps_function_result():
+    @coalesced
+    def add(a, b=1):
+        return a + b
+
+    assert add(1) == 2
+    assert add(1, b=3) == 4
+    assert add.__name__ == 'add'
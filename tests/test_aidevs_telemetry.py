@@ -0,0 +1,73 @@
+import pytest
+
+import aidevs_telemetry
+from aidevs_telemetry import annotate, instrumented, percentile, summary
+
+
+@pytest.fixture(autouse=True)
+def clean_records():
+    aidevs_telemetry.reset()
+    yield
+    aidevs_telemetry.reset()
+
+
+def test_percentile_uses_nearest_rank():
+    values = [5, 1, 4, 2, 3, 6, 8, 7, 10, 9]
+    assert percentile(values, 50) == 5
+    assert percentile(values, 90) == 9
+    assert percentile(values, 99) == 10
+    assert percentile(values, 0) == 1
+    assert percentile(values, 100) == 10
+
+
+def test_percentile_of_few_values():
+    assert percentile([], 50) == 0.0
+    assert percentile([3.5], 99) == 3.5
+    assert percentile([1, 2], 50) == 1
+
+
+def test_summary_groups_calls_by_name_and_model():
+    @instrumented(name='ask')
+    def ask(question, model='gpt-4o-mini'):
+        annotate(prompt_tokens=10, completion_tokens=2)
+        if question == 'fail':
+            raise ValueError("bad question")
+        return question
+
+    ask('a')
+    ask('b', model='gpt-4o')
+    with pytest.raises(ValueError):
+        ask('fail')
+
+    stats = summary()
+    assert list(stats) == ['ask[gpt-4o]', 'ask[gpt-4o-mini]']
+    mini = stats['ask[gpt-4o-mini]']
+    assert (mini['calls'], mini['errors'], mini['cache_hits']) == (2, 1, 0)
+    assert (mini['prompt_tokens'], mini['completion_tokens']) == (20, 4)
+    assert mini['latency_p50'] <= mini['latency_p99'] <= mini['latency_total']
+    assert stats['ask[gpt-4o]']['calls'] == 1
+
+
+def test_summary_latency_percentiles():
+    for latency in [0.1, 0.2, 0.3, 0.4]:
+        aidevs_telemetry.records.append({'name': 'f', 'model': None, 'latency': latency, 'cache_hit': True, 'error': None})
+    stats = summary()['f[None]']
+    assert stats['cache_hits'] == 4
+    assert stats['latency_total'] == pytest.approx(1.0)
+    assert (stats['latency_p50'], stats['latency_p90'], stats['latency_p99']) == (0.2, 0.4, 0.4)
+    assert 'aidevs_call_latency_seconds{name="f",model="None",quantile="0.5"} 0.200000' in aidevs_telemetry.export_prometheus()
+
+
+def test_instrumented_records_cache_hits(tmp_path):
+    from joblib import Memory
+
+    memory = Memory(str(tmp_path), verbose=0)
+
+    @instrumented(model='m')
+    @memory.cache
+    def double(x):
+        return 2 * x
+
+    assert double(2) == 4 and double(2) == 4
+    stats = summary()['double[m]']
+    assert (stats['calls'], stats['cache_hits']) == (2, 1)
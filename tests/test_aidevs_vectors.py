@@ -0,0 +1,136 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import aidevs_vectors
+from aidevs_vectors import Int8Quantizer, LocalVectorIndex, PayloadFilter, binary_encode, binary_scores, normalize
+
+
+@pytest.fixture
+def vectors():
+    return normalize(np.random.default_rng(0).normal(size=(200, 32)))
+
+
+def test_int8_scores_approximate_dot_product(vectors):
+    quantizer = Int8Quantizer.fit(vectors)
+    codes = quantizer.encode(vectors)
+    assert codes.dtype == np.uint8
+    query = vectors[7]
+    np.testing.assert_allclose(quantizer.scores(codes, query), vectors @ query, atol=0.05)
+    assert np.argmax(quantizer.scores(codes, query)) == 7
+
+
+def test_int8_scores_are_the_same_in_blocks(vectors, monkeypatch):
+    quantizer = Int8Quantizer.fit(vectors)
+    codes = quantizer.encode(vectors)
+    whole = quantizer.scores(codes, vectors[0])
+    monkeypatch.setattr(aidevs_vectors, 'BLOCK_ROWS', 7)
+    np.testing.assert_allclose(quantizer.scores(codes, vectors[0]), whole, atol=1e-5)
+    np.testing.assert_array_equal(quantizer.encode(vectors), codes)
+
+
+def test_int8_covers_only_fitted_range(vectors):
+    quantizer = Int8Quantizer.fit(vectors)
+    assert quantizer.covers(vectors)
+    assert not quantizer.covers(vectors[:1] * 10)
+    # Constant dimensions do not cover other values
+    assert not Int8Quantizer.fit(vectors[:1]).covers(vectors[1:2])
+
+
+def test_binary_scores_are_negative_hamming_distance(vectors, monkeypatch):
+    codes = binary_encode(vectors)
+    assert codes.shape == (200, 4)
+    expected = -np.sum((vectors > 0) != (vectors[3] > 0), axis=1)
+    np.testing.assert_array_equal(binary_scores(codes, vectors[3]), expected)
+    monkeypatch.setattr(aidevs_vectors, 'BLOCK_ROWS', 9)
+    np.testing.assert_array_equal(binary_scores(codes, vectors[3]), expected)
+
+
+def test_payload_filter():
+    payload = {'filename': '2024_01_05_report.txt', 'date': '2024-01-05T00:00:00', 'weapon_name': 'karabin'}
+    assert PayloadFilter(match={'weapon_name': 'karabin'}).matches(payload)
+    assert PayloadFilter(ranges={'date': ('2024-01-01T00:00:00', '2024-01-31T23:59:59')}).matches(payload)
+    assert PayloadFilter(patterns={'filename': '2024_01_*'}).matches(payload)
+    assert not PayloadFilter(patterns={'filename': '2024_02_*'}).matches(payload)
+    assert not PayloadFilter()
+
+
+@pytest.mark.parametrize('quantization', ['int8', 'binary', 'none'])
+def test_search_finds_exact_match(tmp_path, vectors, quantization):
+    index = LocalVectorIndex(str(tmp_path), quantization)
+    index.upsert(list(range(200)), vectors, [{'i': i} for i in range(200)])
+    hits = index.search(vectors[42], limit=3)
+    assert hits[0].id == 42 and hits[0].score == pytest.approx(1.0)
+    assert hits[0].payload == {'i': 42}
+    assert [hit.id for hit in index.search(vectors[42], 3, query_filter=PayloadFilter(match={'i': 5}))] == [5]
+
+
+def test_upsert_duplicate_ids_last_wins(tmp_path, vectors):
+    index = LocalVectorIndex(str(tmp_path))
+    index.upsert(['a', 'a', 'b'], vectors[:3], [{'v': 1}, {'v': 2}, {'v': 3}])
+    assert index.count() == 2
+    assert [hit.payload for hit in index.retrieve(['a', 'b'])] == [{'v': 2}, {'v': 3}]
+    assert index.search(vectors[1], 1)[0].id == 'a'
+
+
+def test_commit_encodes_only_changed_rows(tmp_path, vectors):
+    index = LocalVectorIndex(str(tmp_path))
+    index.upsert(list(range(100)), vectors[:100], [{}] * 100)
+    codes, quantizer = index.codes.copy(), index.quantizer
+    index.upsert([5], vectors[6:7], [{}])
+    assert index.quantizer is quantizer
+    np.testing.assert_array_equal(np.delete(index.codes, 5, axis=0), np.delete(codes, 5, axis=0))
+    np.testing.assert_array_equal(index.codes[5], quantizer.encode(vectors[6:7])[0])
+
+
+def test_index_reloads_from_disk(tmp_path, vectors):
+    index = LocalVectorIndex(str(tmp_path))
+    for start in range(0, 200, 50):
+        ids = list(range(start, start + 50))
+        index.upsert(ids, vectors[start:start + 50], [{'i': i} for i in ids], commit=False)
+    index.commit()
+    index.upsert([3], vectors[4:5], [{'i': 'replaced'}])
+
+    reloaded = LocalVectorIndex(str(tmp_path))
+    assert reloaded.count() == 200
+    assert reloaded.retrieve([3])[0].payload == {'i': 'replaced'}
+    np.testing.assert_array_equal(reloaded.codes, index.codes)
+    assert reloaded.search(vectors[100], 1)[0].id == 100
+
+
+def test_saves_append_changed_points_only(tmp_path, vectors):
+    index = LocalVectorIndex(str(tmp_path))
+    for start in range(0, 200, 20):
+        index.upsert(list(range(start, start + 20)), vectors[start:start + 20], [{}] * 20)
+    with open(tmp_path / 'points.jsonl', encoding='utf-8') as f:
+        assert len(f.readlines()) == 200
+
+    # Replacing more than the index holds compacts the log
+    for _ in range(2):
+        index.upsert(list(range(200)), vectors, [{'new': True}] * 200)
+    with open(tmp_path / 'points.jsonl', encoding='utf-8') as f:
+        assert len(f.readlines()) == 200
+    assert LocalVectorIndex(str(tmp_path)).retrieve([0])[0].payload == {'new': True}
+
+
+def test_interrupted_save_is_ignored(tmp_path, vectors):
+    index = LocalVectorIndex(str(tmp_path))
+    index.upsert([1, 2], vectors[:2], [{}, {}])
+    with open(tmp_path / 'points.jsonl', 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'position': 2, 'id': 3, 'payload': {}}) + "\n")
+    assert LocalVectorIndex(str(tmp_path)).count() == 2
+
+
+def test_loads_index_with_payloads_in_meta(tmp_path, vectors):
+    index = LocalVectorIndex(str(tmp_path))
+    index.upsert([1, 2], vectors[:2], [{'a': 1}, {'a': 2}])
+    # Layout before points.jsonl existed
+    os.remove(tmp_path / 'points.jsonl')
+    with open(tmp_path / 'meta.json', 'w', encoding='utf-8') as f:
+        json.dump({'ids': [1, 2], 'payloads': [{'a': 1}, {'a': 2}], 'dimensions': 32, 'quantization': 'int8'}, f)
+    legacy = LocalVectorIndex(str(tmp_path))
+    assert [hit.payload for hit in legacy.retrieve([1, 2])] == [{'a': 1}, {'a': 2}]
+    legacy.commit()
+    assert LocalVectorIndex(str(tmp_path)).retrieve([2])[0].payload == {'a': 2}